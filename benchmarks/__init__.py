@@ -0,0 +1,8 @@
+import sys
+from pathlib import Path
+
+# The benchmarks import the pipeline modules the same way the tests do,
+# with src on the path.
+src_path = Path(__file__).parent.parent / "src"
+if str(src_path) not in sys.path:
+    sys.path.insert(0, str(src_path))
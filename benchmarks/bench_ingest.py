@@ -0,0 +1,47 @@
+# bench_ingest.py
+#
+# Throughput, in MB/s on one core, of turning hOCR files into lxml
+# trees: the previous str pipeline (decode, DOTALL regex to strip the
+# XML declaration, two full-string replaces, fromstring) against
+# nlp.ingest (one scan over the bytes, one reusable parser).
+#
+#   python -m benchmarks.bench_ingest
+
+import re
+import benchmarks
+from lxml import etree
+from benchmarks.suite import print_speedups
+from benchmarks.synthetic import two_column_page
+from nlp import ingest
+
+
+def str_fix_entities(xml_string:str) -> str:
+    xml_string = re.sub(r'<\?xml.*?\?>', '', xml_string, flags=re.DOTALL)
+    xml_string = xml_string.replace("&shy;", "\u00AD")
+    xml_string = xml_string.replace("&quot;", "\u0022")
+    return xml_string
+
+
+def str_parse(data:bytes):
+    return etree.fromstring(str_fix_entities(data.decode("utf-8")))
+
+
+def run(pages=20, rows=80, number=3):
+    files = []
+    for seed in range(pages):
+        page = two_column_page(rows=rows, words_per_line=10, fused_every=7, seed=seed)
+        # a sprinkling of the entities the coordOCR files contain
+        page = page.replace("λόγος", "λό&shy;γος").replace("verbum", "&quot;verbum&quot;")
+        files.append(page.encode("utf-8"))
+    megabytes = sum(len(data) for data in files) / 1e6
+    print(f"{pages} dense pages, {megabytes:.1f} MB")
+    print_speedups([
+        ("fix entities", lambda: [str_fix_entities(d.decode("utf-8")) for d in files],
+                         lambda: [ingest.fix_entities(d) for d in files]),
+        ("fix and parse", lambda: [str_parse(d) for d in files],
+                          lambda: [ingest.parse(d) for d in files]),
+    ], "str", "bytes", number, megabytes=megabytes)
+
+
+if __name__ == "__main__":
+    run()
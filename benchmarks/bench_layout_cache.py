@@ -0,0 +1,31 @@
+# bench_layout_cache.py
+#
+# Building a Page by parsing its hOCR file against restoring it from the
+# on-disk layout cache.
+#
+#   python -m benchmarks.bench_layout_cache
+
+import tempfile
+import benchmarks
+from benchmarks.suite import print_speedups
+from benchmarks.synthetic import two_column_page
+from nlp.layout_cache import LayoutCache, file_key
+from nlp.page import Page
+from nlp.ingest import parse
+
+
+def run(rows=120, words_per_line=10, number=5):
+    raw = two_column_page(rows=rows, words_per_line=words_per_line, fused_every=7).encode("utf-8")
+    key = file_key(raw)
+    with tempfile.TemporaryDirectory() as directory:
+        cache = LayoutCache(directory)
+        cache.store_page(key, Page(parse(raw)))
+        size = cache.path(key).stat().st_size
+        print(f"dense two-column page: {len(raw) / 1024:.1f} KiB of hOCR, {size / 1024:.1f} KiB cached")
+        print_speedups([
+            ("build page", lambda: Page(parse(raw)), lambda: cache.load_page(file_key(raw))),
+        ], "parse", "cache", number)
+
+
+if __name__ == "__main__":
+    run()
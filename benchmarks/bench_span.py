@@ -0,0 +1,91 @@
+# bench_span.py
+#
+# Cached Span.lines / tokens / blocks against the previous implementation,
+# which rebuilt the lists recursively with list + list on every access.
+#
+#   python -m benchmarks.bench_span
+
+from contextlib import contextmanager
+import benchmarks
+from benchmarks.suite import print_speedups
+from benchmarks.synthetic import two_column_page, parse
+from nlp.block import Block
+from nlp.page import Page
+from nlp.span import Span
+from nlp.token import Token
+from nlp.utils import flatten
+
+
+def uncached_tokens(self):
+    token_list = []
+    for obj in self.objects:
+        if isinstance(obj, Token):
+            token_list.append(obj)
+        else:
+            token_list = token_list + obj.tokens
+    return token_list
+
+def uncached_lines(self):
+    line_list = []
+    if self.type == 'ocr_line':
+        line_list.append(self)
+    else:
+        for o in self.objects:
+            line_list = line_list + o.lines
+    return line_list
+
+
+def uncached_block_tokens(self):
+    return flatten([para.tokens for para in self.paras])
+
+def uncached_block_lines(self):
+    return flatten([para.lines for para in self.paras])
+
+
+@contextmanager
+def uncached():
+    """Temporarily restore the uncached tokens and lines properties."""
+    saved = [(cls, name, cls.__dict__[name]) for cls in (Span, Block) for name in ('tokens', 'lines')]
+    Span.tokens, Span.lines = property(uncached_tokens), property(uncached_lines)
+    Block.tokens, Block.lines = property(uncached_block_tokens), property(uncached_block_lines)
+    try:
+        yield
+    finally:
+        for cls, name, prop in saved:
+            setattr(cls, name, prop)
+
+
+def without_caches(fn):
+    """fn, called with the uncached properties."""
+    def call():
+        with uncached():
+            return fn()
+    return call
+
+
+def heuristics(page):
+    # start from a fresh layout analysis so that each run measures the
+    # line and token lookups it makes, not the PageLayout cache
+    page._layout = None
+    page.margin_left, page.margin_right, page.margin_top, page.margin_bottom
+    page.left_lines()
+    page.right_lines()
+    page.running_head
+    page.greek_columns
+    page.fused_lines
+
+
+def run(rows=80, words_per_line=10, number=5):
+    page = Page(parse(two_column_page(rows=rows, words_per_line=words_per_line, fused_every=7)))
+    print(f"dense two-column page: {len(page.lines)} lines, {len(page.tokens)} tokens")
+    cases = [
+        ("page.lines", lambda: page.lines),
+        ("page.tokens", lambda: page.tokens),
+        ("layout heuristics", lambda: heuristics(page)),
+    ]
+    print_speedups([(name, without_caches(fn), fn) for name, fn in cases],
+                   "uncached", "cached", number)
+
+
+if __name__ == "__main__":
+    run()
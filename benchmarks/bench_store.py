@@ -0,0 +1,49 @@
+# bench_store.py
+#
+# Memory and layout-analysis time of the array-backed CompactPage against
+# the Page object tree, on the same dense two-column page.
+#
+#   python -m benchmarks.bench_store
+
+import tracemalloc
+import benchmarks
+from benchmarks.suite import print_speedups
+from benchmarks.synthetic import two_column_page, parse
+from nlp.page import Page
+from nlp.store import CompactPage
+
+
+def build_size(cls, tree):
+    tracemalloc.start()
+    page = cls(tree)
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return page, size
+
+
+def heuristics(page):
+    # both kinds of page start from nothing kept, so that each run
+    # measures the whole layout analysis
+    page.drop_caches()
+    page.left_lines()
+    page.right_lines()
+    page.running_head
+    page.greek_columns
+    [line.is_fused for line in page.lines]
+
+
+def run(rows=200, words_per_line=10, number=5):
+    tree = parse(two_column_page(rows=rows, words_per_line=words_per_line, fused_every=7))
+    page, page_size = build_size(Page, tree)
+    compact, compact_size = build_size(CompactPage, tree)
+    print(f"dense two-column page: {len(page.lines)} lines, {len(page.tokens)} tokens")
+    print(f"{'memory':20} objects {page_size / 1024:10.1f} KiB   arrays {compact_size / 1024:10.1f} KiB"
+          f"   x{page_size / compact_size:,.1f}")
+    print_speedups([
+        ("build", lambda: Page(tree), lambda: CompactPage(tree)),
+        ("layout heuristics", lambda: heuristics(page), lambda: heuristics(compact)),
+    ], "objects", "arrays", number)
+
+
+if __name__ == "__main__":
+    run()
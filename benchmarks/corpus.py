@@ -0,0 +1,160 @@
+# corpus.py
+#
+# A synthetic corpus for the end-to-end benchmarks: Princeton-style
+# volume directories (a METS file with fileSec and structMap, one
+# coordOCR hOCR file and one OCR text file per page) and the matching
+# HathiTrust-style EPUBs, built from the same pages.
+#
+#   python -m benchmarks.corpus /tmp/corpus --volumes 10 --pages 200
+#
+# writes /tmp/corpus/pg/<barcode>/ and /tmp/corpus/epub/<barcode>.epub.
+# Each volume opens with a front cover and a blank page, every
+# chapter_every-th page starts a chapter with a title page, one page in
+# blank_every is blank, and it ends with a back cover. Text pages have
+# ORDERLABELs and some fused lines.
+
+import argparse
+import random
+import zipfile
+from pathlib import Path
+import benchmarks
+from benchmarks.synthetic import XHTML_PAGE, two_column_page, title_page
+
+
+METS_FILE = """<?xml version="1.0" encoding="UTF-8"?>
+<METS:mets xmlns:METS="http://www.loc.gov/METS/" xmlns:xlink="http://www.w3.org/1999/xlink" OBJID="{barcode}">
+<METS:fileSec>
+<METS:fileGrp USE="image">
+{images}
+</METS:fileGrp>
+<METS:fileGrp USE="OCR">
+{texts}
+</METS:fileGrp>
+<METS:fileGrp USE="coordOCR">
+{html}
+</METS:fileGrp>
+</METS:fileSec>
+<METS:structMap TYPE="physical">
+<METS:div TYPE="volume">
+{divs}
+</METS:div>
+</METS:structMap>
+</METS:mets>
+"""
+
+CONTAINER = """<?xml version="1.0" encoding="UTF-8"?>
+<container version="1.0" xmlns="urn:oasis:names:tc:opendocument:xmlns:container">
+<rootfiles><rootfile full-path="OEBPS/content.opf" media-type="application/oebps-package+xml"/></rootfiles>
+</container>
+"""
+
+TOC = """<?xml version="1.0" encoding="UTF-8"?>
+<html xmlns="http://www.w3.org/1999/xhtml"><head><title>{barcode}</title></head>
+<body><nav><ol>
+{items}
+</ol></nav></body></html>
+"""
+
+BLANK_PAGE = XHTML_PAGE.format(width=2000, height=3000, blocks="")
+
+
+def barcode(n:int) -> str:
+    return f"3210100{n:07d}"
+
+
+def volume_pages(pages:int, rows:int=60, words_per_line:int=8, chapter_every:int=25,
+                 blank_every:int=40, seed:int=0):
+    """(orderlabel, admid tags, hOCR) of each page of a volume."""
+    rng = random.Random(seed)
+    result = [(None, "FRONT_COVER", BLANK_PAGE), (None, "BLANK", BLANK_PAGE)]
+    label = 1
+    while len(result) < pages - 1:
+        n = len(result)
+        if blank_every and n % blank_every == 0:
+            result.append((None, "BLANK", BLANK_PAGE))
+            continue
+        page_seed = rng.randrange(1 << 30)
+        if chapter_every and n % chapter_every == 2:
+            hocr = title_page(rows=rows // 2, words_per_line=words_per_line, seed=page_seed)
+            result.append((str(label), "CHAPTER_START", hocr))
+        else:
+            fused_every = rng.choice([0, 0, 7, 11])
+            hocr = two_column_page(rows=rows, words_per_line=words_per_line,
+                                   fused_every=fused_every, seed=page_seed)
+            result.append((str(label), None, hocr))
+        label += 1
+    result.append((None, "BACK_COVER", BLANK_PAGE))
+    return result[:pages]
+
+
+def write_pg_volume(directory:Path, barcode:str, pages) -> Path:
+    """Write a volume directory for pg.PgVolume from volume_pages()."""
+    directory.mkdir(parents=True, exist_ok=True)
+    images, texts, html, divs = [], [], [], []
+    for order, (label, admid, hocr) in enumerate(pages, start=1):
+        name = f"{order:08d}"
+        images.append(f"<METS:file ID='IMG{name}' MIMETYPE='image/jp2'>"
+                      f"<METS:FLocat LOCTYPE='URL' xlink:href='{name}.jp2'/></METS:file>")
+        texts.append(f"<METS:file ID='TXT{name}' MIMETYPE='text/plain'>"
+                     f"<METS:FLocat LOCTYPE='URL' xlink:href='{name}.txt'/></METS:file>")
+        html.append(f"<METS:file ID='HTML{name}' MIMETYPE='text/html'>"
+                    f"<METS:FLocat LOCTYPE='URL' xlink:href='{name}.html'/></METS:file>")
+        attrs = f"TYPE='page' ORDER='{order}'"
+        if label:
+            attrs += f" ORDERLABEL='{label}'"
+        if admid:
+            attrs += f" ADMID='{admid}'"
+        divs.append(f"<METS:div {attrs}><METS:fptr FILEID='IMG{name}'/>"
+                    f"<METS:fptr FILEID='TXT{name}'/><METS:fptr FILEID='HTML{name}'/></METS:div>")
+        (directory / f"{name}.html").write_text(hocr, encoding="utf-8")
+        (directory / f"{name}.txt").write_text(f"page {order}\n", encoding="utf-8")
+    mets = METS_FILE.format(barcode=barcode, images="\n".join(images), texts="\n".join(texts),
+                            html="\n".join(html), divs="\n".join(divs))
+    (directory / f"{barcode}.mets.xml").write_text(mets, encoding="utf-8")
+    return directory
+
+
+def write_epub(path:Path, barcode:str, pages) -> Path:
+    """Write an EPUB for nlp.volume.EPubVolume from volume_pages()."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with zipfile.ZipFile(path, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr("mimetype", "application/epub+zip", compress_type=zipfile.ZIP_STORED)
+        archive.writestr("META-INF/container.xml", CONTAINER)
+        items = []
+        for order, (label, admid, hocr) in enumerate(pages, start=1):
+            name = f"xhtml/{order:08d}.xhtml"
+            archive.writestr(f"OEBPS/{name}", hocr)
+            if admid == "CHAPTER_START":
+                items.append(f"<li><a href='{name}'>{label}</a></li>")
+        archive.writestr("OEBPS/toc.xhtml", TOC.format(barcode=barcode, items="\n".join(items)))
+    return path
+
+
+def write_corpus(root:Path, volumes:int=10, pages:int=200, rows:int=60, words_per_line:int=8,
+                 epub:bool=True, seed:int=0) -> Path:
+    root = Path(root)
+    for n in range(volumes):
+        code = barcode(n + 1)
+        volume = volume_pages(pages, rows, words_per_line, seed=seed + n)
+        write_pg_volume(root / "pg" / code, code, volume)
+        if epub:
+            write_epub((root / "epub" / code).with_suffix(".epub"), code, volume)
+    return root
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Write a synthetic corpus of volumes and EPUBs.")
+    parser.add_argument("root", help="Directory to write pg/ and epub/ into")
+    parser.add_argument("--volumes", type=int, default=10)
+    parser.add_argument("--pages", type=int, default=200, help="Pages per volume")
+    parser.add_argument("--rows", type=int, default=60, help="Rows of text per page")
+    parser.add_argument("--words", type=int, default=8, help="Words per line")
+    parser.add_argument("--no-epub", action="store_true", help="Write only the volume directories")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+    write_corpus(args.root, args.volumes, args.pages, args.rows, args.words,
+                 epub=not args.no_epub, seed=args.seed)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+# suite.py
+#
+# The benchmark suite of the nlp layout engine: every case is timed on
+# synthetic pages of each kind, the results are written as JSON, and a
+# run can be checked against an earlier one.
+#
+#   python -m benchmarks.suite --output bench.json
+#   python -m benchmarks.suite --compare bench.json --threshold 1.25
+#
+# --rows and --words set the density of the pages. A case regresses when
+# its best time is more than threshold times the baseline's; the exit
+# status is then 1.
+
+import argparse
+import json
+import platform
+import statistics
+import sys
+import time
+import timeit
+import benchmarks
+from benchmarks.synthetic import two_column_page, title_page, parse
+from nlp.page import Page
+
+
+RESULTS_VERSION = 1
+
+
+def page_kinds(rows, words_per_line):
+    """name -> hOCR source of each kind of page."""
+    return {
+        "two_column": two_column_page(rows=rows, words_per_line=words_per_line),
+        "fused": two_column_page(rows=rows, words_per_line=words_per_line, fused_every=2),
+        "title": title_page(rows=rows, words_per_line=words_per_line),
+    }
+
+
+def reset_scripts(page):
+    for token in page.tokens:
+        token._is_greek = None
+    return page
+
+
+def classify_scripts(page):
+    for token in page.tokens:
+        token.is_greek
+
+
+# name -> (setup, timed): setup(tree) builds what timed() works on, so
+# that every repetition starts from a freshly built page
+CASES = {
+    "page_build": (lambda tree: tree, Page),
+    "repair_fused_lines": (Page, lambda page: page.repair_fused_lines()),
+    "greek_columns": (Page, lambda page: page.greek_columns),
+    "detect_title_lines": (Page, lambda page: page.detect_title_lines()),
+    "page_xml": (Page, lambda page: page.xml()),
+    "token_is_greek": (lambda tree: reset_scripts(Page(tree)), classify_scripts),
+}
+
+
+def measure(setup, timed, tree, repeat):
+    times = []
+    for _ in range(repeat):
+        subject = setup(tree)
+        start = time.perf_counter()
+        timed(subject)
+        times.append(time.perf_counter() - start)
+    return {"min": min(times), "median": statistics.median(times), "repeat": repeat}
+
+
+def best_time(fn, number=5, repeat=3) -> float:
+    """The best time of one call of fn, in seconds."""
+    return min(timeit.repeat(fn, number=number, repeat=repeat)) / number
+
+
+def print_speedups(cases, before:str, after:str, number=5, megabytes=None):
+    """Time the two implementations of each (name, before_fn, after_fn)
+    of cases, labelled before and after, and print one line per case:
+    their best times, or with megabytes the MB/s each processes, and the
+    speed-up. Used by the bench_* scripts."""
+    for name, before_fn, after_fn in cases:
+        slow = best_time(before_fn, number)
+        fast = best_time(after_fn, number)
+        if megabytes is None:
+            times = f"{before} {slow * 1000:10.3f} ms   {after} {fast * 1000:10.3f} ms"
+        else:
+            times = f"{before} {megabytes / slow:8.1f} MB/s   {after} {megabytes / fast:8.1f} MB/s"
+        print(f"{name:20} {times}   x{slow / fast:,.1f}")
+
+
+def run(rows=60, words_per_line=8, repeat=7, only=None):
+    results = {}
+    for kind, source in page_kinds(rows, words_per_line).items():
+        tree = parse(source)
+        for case, (setup, timed) in CASES.items():
+            name = f"{kind}/{case}"
+            if only and only not in name:
+                continue
+            results[name] = measure(setup, timed, tree, repeat)
+    return {"version": RESULTS_VERSION,
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "params": {"rows": rows, "words_per_line": words_per_line, "repeat": repeat},
+            "results": results}
+
+
+def compare(baseline:dict, current:dict, threshold:float=1.25):
+    """(name, baseline s, current s, ratio, regressed) for every case of
+    current that baseline has too, comparing best times."""
+    rows = []
+    for name, result in current["results"].items():
+        if name in baseline["results"]:
+            before = baseline["results"][name]["min"]
+            after = result["min"]
+            ratio = after / before if before else float("inf")
+            rows.append((name, before, after, ratio, ratio > threshold))
+    return rows
+
+
+def print_results(run_results):
+    params = run_results["params"]
+    print(f"{params['rows']} rows, {params['words_per_line']} words per line, "
+          f"best of {params['repeat']}")
+    for name, result in run_results["results"].items():
+        print(f"{name:36} {result['min'] * 1000:10.3f} ms   median {result['median'] * 1000:10.3f} ms")
+
+
+def print_comparison(rows, threshold):
+    for name, before, after, ratio, regressed in rows:
+        flag = "  REGRESSION" if regressed else ""
+        print(f"{name:36} {before * 1000:10.3f} -> {after * 1000:10.3f} ms   x{ratio:5.2f}{flag}")
+    regressions = [row for row in rows if row[4]]
+    print(f"{len(regressions)} of {len(rows)} cases slower than x{threshold}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the nlp layout engine on synthetic pages.")
+    parser.add_argument("--rows", type=int, default=60, help="Rows of text per page")
+    parser.add_argument("--words", type=int, default=8, help="Words per line")
+    parser.add_argument("--repeat", type=int, default=7, help="Repetitions of each case")
+    parser.add_argument("--only", default=None, help="Run only the cases whose name contains this")
+    parser.add_argument("--output", default=None, help="Write the results to this JSON file")
+    parser.add_argument("--compare", default=None, help="Compare with the results in this JSON file")
+    parser.add_argument("--threshold", type=float, default=1.25,
+                        help="Slowdown ratio above which a case counts as a regression")
+    args = parser.parse_args(argv)
+
+    results = run(args.rows, args.words, args.repeat, args.only)
+    print_results(results)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=1, sort_keys=True)
+            f.write("\n")
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        if baseline["params"] != results["params"]:
+            print(f"warning: baseline parameters {baseline['params']} differ from {results['params']}")
+        if print_comparison(compare(baseline, results, args.threshold), args.threshold):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
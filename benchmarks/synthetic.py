@@ -0,0 +1,86 @@
+# synthetic.py
+#
+# Synthetic hOCR pages for the benchmarks.
+
+import random
+from lxml import etree
+
+GREEK = "ἐν ἀρχῇ ἦν ὁ λόγος καὶ ὁ λόγος ἦν πρὸς τὸν θεόν καὶ θεὸς ἦν ὁ λόγος οὗτος".split()
+LATIN = "in principio erat verbum et verbum erat apud deum et deus erat verbum hoc".split()
+PUNCT = [",", ".", ";", "·"]
+
+XHTML_PAGE = """<?xml version="1.0" encoding="UTF-8"?>
+<!DOCTYPE html PUBLIC "-//W3C//DTD XHTML 1.0 Transitional//EN" "http://www.w3.org/TR/xhtml1/DTD/xhtml1-transitional.dtd">
+<html xmlns="http://www.w3.org/1999/xhtml"><head><title></title></head><body>
+<div class='ocr_page' title='bbox 0 0 {width} {height}'>
+{blocks}
+</div>
+</body></html>
+"""
+
+
+def hocr_line(left, top, right, words, height=40, style=None):
+    step = max(1, (right - left) // len(words))
+    spans = []
+    for i, word in enumerate(words):
+        x = left + i * step
+        x_max = right if i == len(words) - 1 else x + step - 10
+        spans.append(f"<span class='ocrx_word' title='bbox {x} {top} {x_max} {top + height}'>{word}</span>")
+    style = f" style='{style}'" if style else ""
+    return (f"<span class='ocr_line' title='bbox {left} {top} {right} {top + height}'{style}>"
+            + " ".join(spans) + "</span>")
+
+
+def words(rng, vocabulary, n, punct=0.1):
+    result = []
+    for _ in range(n):
+        result.append(rng.choice(vocabulary))
+        if rng.random() < punct:
+            result.append(rng.choice(PUNCT))
+    return result
+
+
+def two_column_page(rows=60, words_per_line=8, fused_every=0, seed=0) -> str:
+    """A Patrologia Graeca style page: a running head, then rows of a
+    Greek left column and a Latin right column. Every fused_every-th row
+    is a single fused line running across both columns."""
+    rng = random.Random(seed)
+    lines = [hocr_line(100, 100, 1900, ["ΠΑΤΡΟΛΟΓΙΑ", "ΕΛΛΗΝΙΚΗ"], 30)]
+    for row in range(rows):
+        top = 200 + row * 45
+        if fused_every and row % fused_every == fused_every - 1:
+            fused = words(rng, GREEK, words_per_line) + words(rng, LATIN, words_per_line)
+            lines.append(hocr_line(100, top, 1900, fused))
+        else:
+            lines.append(hocr_line(100, top, 900, words(rng, GREEK, words_per_line)))
+            lines.append(hocr_line(1000, top, 1900, words(rng, LATIN, words_per_line)))
+    body = "\n".join(lines)
+    block = (f"<div class='ocrx_block' title='bbox 100 100 1900 {300 + rows * 45}'>"
+             f"<p class='ocr_par' title='bbox 100 100 1900 {300 + rows * 45}'>\n{body}\n</p></div>")
+    return XHTML_PAGE.format(width=2000, height=400 + rows * 45, blocks=block)
+
+
+def title_page(rows=30, words_per_line=8, seed=0) -> str:
+    """A chapter opening: a running head, a few centered upper-case title
+    lines (an author's name and a two-line title), then rows of
+    full-width text."""
+    rng = random.Random(seed)
+    lines = [hocr_line(100, 100, 1900, ["ΠΑΤΡΟΛΟΓΙΑ", "ΕΛΛΗΝΙΚΗ"], 30)]
+    # PageLayout's print region for this page is 300-1900 wide and starts
+    # at 300, so the titles are centered on 1100, below 300; the bold
+    # ones are names
+    for row in range(4):
+        title = [word.upper() for word in words(rng, LATIN if row % 2 else GREEK, 3, punct=0)]
+        style = "font-size:14pt;font-family:Times" + (";font-style:bold" if row == 0 else "")
+        top = 320 + row * 60 + (200 if row == 3 else 0)
+        lines.append(hocr_line(800, top, 1400, title, 50, style=style))
+    for row in range(rows):
+        lines.append(hocr_line(100, 800 + row * 45, 1900, words(rng, LATIN, words_per_line * 2)))
+    body = "\n".join(lines)
+    block = (f"<div class='ocrx_block' title='bbox 100 100 1900 {800 + rows * 45}'>"
+             f"<p class='ocr_par' title='bbox 100 100 1900 {800 + rows * 45}'>\n{body}\n</p></div>")
+    return XHTML_PAGE.format(width=2000, height=900 + rows * 45, blocks=block)
+
+
+def parse(page_xml:str):
+    return etree.fromstring(page_xml.encode("utf-8"))
@@ -0,0 +1,143 @@
+# throughput.py
+#
+# End-to-end throughput of the two transformation paths on a synthetic
+# corpus (see corpus.py): METS volumes through volume_transformer
+# (MetsVolume -> Loader -> PgVolume.serialize) and EPUBs through
+# EPubVolume.serialize.
+#
+#   python -m benchmarks.corpus /tmp/corpus --volumes 8 --pages 100
+#   python -m benchmarks.throughput /tmp/corpus --jobs 1,2,4 --output throughput.json
+#
+# Every run is a fresh child process writing to an empty directory, so
+# its wall time, CPU time and peak RSS (of the largest of its processes)
+# are its own. --scale volumes runs volumes in parallel worker processes,
+# --scale pages runs the pages of each volume in parallel instead; the
+# speedup of each job count is relative to the first one.
+
+import argparse
+import json
+import logging
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+import benchmarks
+
+
+REPO = Path(__file__).parent.parent
+
+
+def input_pages(corpus:Path, path:str) -> tuple[int, int]:
+    """(volumes, pages) of the corpus for path."""
+    if path == "pg":
+        volumes = [d for d in (corpus / "pg").iterdir() if d.is_dir()]
+        return len(volumes), sum(len(list(d.glob("*.html"))) for d in volumes)
+    epubs = sorted((corpus / "epub").glob("*.epub"))
+    pages = 0
+    for epub in epubs:
+        with zipfile.ZipFile(epub) as archive:
+            pages += sum(1 for name in archive.namelist() if name.startswith("OEBPS/xhtml/"))
+    return len(epubs), pages
+
+
+def _serialize_epub(epub, outdir, page_jobs):
+    from nlp.volume import EPubVolume
+    volume = EPubVolume(epub)
+    try:
+        volume.serialize(Path(outdir), jobs=page_jobs)
+    finally:
+        volume.close()
+
+
+def transform(path:str, corpus:Path, outdir:Path, jobs:int, scale:str):
+    """The work of one run, in the child process."""
+    volume_jobs = jobs if scale == "volumes" else 1
+    page_jobs = jobs if scale == "pages" else 1
+    if path == "pg":
+        from volume_transformer import Transformer
+        logging.getLogger().setLevel(logging.WARNING)
+        Transformer(corpus / "pg", outdir, jobs=volume_jobs, page_jobs=page_jobs).transform_all_volumes()
+        return
+    epubs = sorted((corpus / "epub").glob("*.epub"))
+    if volume_jobs > 1:
+        with ProcessPoolExecutor(max_workers=volume_jobs) as executor:
+            for future in [executor.submit(_serialize_epub, epub, outdir, page_jobs) for epub in epubs]:
+                future.result()
+    else:
+        for epub in epubs:
+            _serialize_epub(epub, outdir, page_jobs)
+
+
+def measure(path:str, corpus:Path, jobs:int, scale:str) -> dict:
+    with tempfile.TemporaryDirectory() as outdir:
+        start = time.perf_counter()
+        child = subprocess.Popen([sys.executable, "-m", "benchmarks.throughput", "--child",
+                                  path, str(corpus), outdir, str(jobs), scale], cwd=REPO)
+        _, status, usage = os.wait4(child.pid, 0)
+        wall = time.perf_counter() - start
+        child.returncode = os.waitstatus_to_exitcode(status)
+        if child.returncode != 0:
+            raise RuntimeError(f"{path} run with {jobs} jobs failed ({child.returncode})")
+    # ru_maxrss is in KiB on Linux and in bytes on macOS
+    rss = usage.ru_maxrss / (1 << 20 if sys.platform == "darwin" else 1 << 10)
+    return {"jobs": jobs, "wall": round(wall, 3),
+            "cpu": round(usage.ru_utime + usage.ru_stime, 3), "peak_rss_mb": round(rss, 1)}
+
+
+def run(corpus:Path, path:str="pg", jobs=(1,), scale:str="volumes") -> dict:
+    volumes, pages = input_pages(corpus, path)
+    runs = []
+    for n in jobs:
+        result = measure(path, corpus, n, scale)
+        result["pages_per_second"] = round(pages / result["wall"], 2)
+        result["volumes_per_hour"] = round(volumes * 3600 / result["wall"], 1)
+        result["speedup"] = round(runs[0]["wall"] / result["wall"], 2) if runs else 1.0
+        runs.append(result)
+    return {"path": path, "scale": scale, "volumes": volumes, "pages": pages,
+            "cpus": os.cpu_count(), "runs": runs}
+
+
+def print_results(results):
+    print(f"{results['path']}: {results['volumes']} volumes, {results['pages']} pages, "
+          f"parallel {results['scale']}, {results['cpus']} CPUs")
+    print(f"{'jobs':>5}{'wall s':>10}{'pages/s':>10}{'vols/h':>10}{'speedup':>9}{'peak MB':>9}")
+    for r in results["runs"]:
+        print(f"{r['jobs']:>5}{r['wall']:>10.2f}{r['pages_per_second']:>10.1f}"
+              f"{r['volumes_per_hour']:>10.0f}{r['speedup']:>9.2f}{r['peak_rss_mb']:>9.1f}")
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if argv and argv[0] == "--child":
+        path, corpus, outdir, jobs, scale = argv[1:]
+        transform(path, Path(corpus), Path(outdir), int(jobs), scale)
+        return 0
+
+    parser = argparse.ArgumentParser(description="Measure end-to-end throughput on a synthetic corpus.")
+    parser.add_argument("corpus", help="A corpus written by benchmarks.corpus")
+    parser.add_argument("--path", choices=["pg", "epub", "both"], default="both")
+    parser.add_argument("--jobs", default="1", help="Comma-separated job counts, e.g. 1,2,4")
+    parser.add_argument("--scale", choices=["volumes", "pages"], default="volumes",
+                        help="Run volumes, or the pages of each volume, in parallel")
+    parser.add_argument("--output", default=None, help="Write the results to this JSON file")
+    args = parser.parse_args(argv)
+
+    corpus = Path(args.corpus).resolve()
+    jobs = [int(n) for n in args.jobs.split(",")]
+    paths = ["pg", "epub"] if args.path == "both" else [args.path]
+    results = [run(corpus, path, jobs, args.scale) for path in paths]
+    for result in results:
+        print_results(result)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=1)
+            f.write("\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,8 +1,11 @@
 # A transformer class
 import argparse
 import logging
+from contextlib import nullcontext
 from pathlib import Path
+from nlp import instrument
 from nlp.volume import EPubVolume
+import incremental
 
 
 # Configure basic logging to the console
@@ -14,20 +17,34 @@ class Transformer():
     volumes. It assumes its input direcory
     contains subdirectories named by barcode
     or other id."""
-    def __init__(self, indir, outdir) -> None:
+    def __init__(self, indir, outdir, incremental=False, read_ahead=0) -> None:
         self.indir = Path(indir)
         self.outdir = Path(outdir)
+        self.incremental = incremental
+        self.read_ahead = read_ahead
 
     def transform_volume(self, epub):
         barcode = Path(epub).stem
         file_path = (self.outdir / barcode).with_suffix(".xml")
+        with instrument.volume(barcode):
+            self._transform_volume(epub, barcode, file_path)
 
-        if file_path.is_file():
+    def _transform_volume(self, epub, barcode, file_path):
+        if self.incremental:
+            volume = EPubVolume(epub, read_ahead=self.read_ahead)
+            try:
+                incremental.build_epub_volume(volume, self.outdir, greek_only=True)
+            finally:
+                volume.close()
+        elif file_path.is_file():
             logging.info(f"{file_path} already exists")
         else:
             logging.info(f"transforming volume {barcode}")
-            volume = EPubVolume(epub)
-            volume.serialize(self.outdir, greek_only=True)
+            volume = EPubVolume(epub, read_ahead=self.read_ahead)
+            try:
+                volume.serialize(self.outdir, greek_only=True)
+            finally:
+                volume.close()
             logging.info(f"finished transforming volume {barcode}")
 
 
@@ -48,15 +65,35 @@ def main():
     parser.add_argument("input_dir", help="Path to the input directory containing barcoded folders")
     parser.add_argument("output_dir", help="Path to the output directory where XML files will be written")
     parser.add_argument("--barcode", help="Optional specific barcode to transform")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Rebuild only the volumes and pages whose inputs or pipeline changed")
+    parser.add_argument("--read-ahead", type=int, default=0,
+                        help="Number of pages to decompress in the background ahead of the current one")
+    parser.add_argument("--timings", default=None,
+                        help="Write per-stage, per-page and per-volume timings to this JSON file")
+    parser.add_argument("--count-calls", action="store_true",
+                        help="Also count calls of the expensive layout properties (with --timings)")
+    parser.add_argument("--profile", default=None,
+                        help="Profile the run (best with --barcode) into this file")
+    parser.add_argument("--profile-format", choices=sorted(instrument.PROFILERS), default="pstats",
+                        help="pstats for pstats/snakeviz, collapsed for flame graphs")
 
     args = parser.parse_args()
 
-    transformer = Transformer(args.input_dir, args.output_dir)
+    transformer = Transformer(args.input_dir, args.output_dir, incremental=args.incremental,
+                              read_ahead=args.read_ahead)
 
-    if args.barcode:
-        transformer.transform_volume(args.barcode)
-    else:
-        transformer.transform_all_volumes()
+    recording = instrument.recording(args.count_calls) if args.timings else nullcontext()
+    profiling = instrument.profile(args.profile, args.profile_format) if args.profile else nullcontext()
+    with recording as report, profiling:
+        if args.barcode:
+            transformer.transform_volume(args.barcode)
+        else:
+            transformer.transform_all_volumes()
+
+    if report:
+        report.write(args.timings)
+        logging.info(f"timings written to {args.timings}\n{report.summary()}")
 
 if __name__ == "__main__":
     main()
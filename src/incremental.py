@@ -0,0 +1,197 @@
+# incremental.py
+#
+# Content-hash incremental rebuilds of volume XML files.
+#
+# Next to its outputs a transformer keeps a .build directory holding, for
+# each volume, a build manifest and the <page> fragment of every page:
+#
+#   <outdir>/.build/<barcode>/manifest.json
+#   <outdir>/.build/<barcode>/pages/<page>.xml
+#
+# The manifest records a key for every page: a hash of the pipeline
+# fingerprint (the source of the code that builds fragments, plus the
+# build parameters), the page's METS entry and the content of its input.
+# A volume whose keys all match and whose output exists is skipped; any
+# other volume is rewritten, rebuilding only the pages whose keys
+# changed and splicing the cached fragments of the others back in.
+
+import hashlib
+import json
+import logging
+import os
+from pathlib import Path
+
+
+BUILD_DIR = ".build"
+MANIFEST_NAME = "manifest.json"
+
+# the code whose behaviour shapes the fragments
+PIPELINE_SOURCES = ["pg.py", "models/*.py", "nlp/*.py"]
+
+_source_digest = None
+
+
+def source_digest() -> str:
+    """A hash of the pipeline source files, computed once per process."""
+    global _source_digest
+    if _source_digest is None:
+        src = Path(__file__).parent
+        digest = hashlib.sha256()
+        for pattern in PIPELINE_SOURCES:
+            for path in sorted(src.glob(pattern)):
+                digest.update(path.relative_to(src).as_posix().encode("utf-8"))
+                digest.update(path.read_bytes())
+        _source_digest = digest.hexdigest()
+    return _source_digest
+
+
+def pipeline_fingerprint(**params) -> str:
+    """A hash of the pipeline code and the build parameters."""
+    digest = hashlib.sha256(source_digest().encode("ascii"))
+    digest.update(json.dumps(params, sort_keys=True).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def file_digest(path:Path) -> str:
+    with open(path, 'rb') as f:
+        return hashlib.file_digest(f, "sha256").hexdigest()
+
+
+def page_key(fingerprint:str, *inputs) -> str:
+    digest = hashlib.sha256(fingerprint.encode("ascii"))
+    for value in inputs:
+        digest.update(b"\x00")
+        digest.update(json.dumps(value, sort_keys=True).encode("utf-8"))
+    return digest.hexdigest()
+
+
+class BuildManifest:
+    """The page keys of the last build of a volume, and where its
+    page fragments are cached."""
+    def __init__(self, directory:Path, pages:dict | None=None):
+        self.directory = Path(directory)
+        self.pages = pages or {}
+
+    @property
+    def path(self) -> Path:
+        return self.directory / MANIFEST_NAME
+
+    @classmethod
+    def load(cls, directory:Path):
+        try:
+            with open(Path(directory) / MANIFEST_NAME, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return cls(directory)
+        return cls(directory, data.get("pages", {}))
+
+    def save(self):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix(f".{os.getpid()}.tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({"pages": self.pages}, f)
+        os.replace(tmp_path, self.path)
+
+    def fragment_path(self, page) -> Path:
+        return self.directory / "pages" / f"{page}.xml"
+
+    def cached_fragment(self, page, key):
+        """The cached fragment of page as bytes (b'' for a page that
+        produced nothing), or None if it is missing or was built from
+        other inputs."""
+        entry = self.pages.get(str(page))
+        if entry is None or entry["key"] != key:
+            return None
+        if not entry["fragment"]:
+            return b''
+        try:
+            return self.fragment_path(page).read_bytes()
+        except OSError:
+            return None
+
+    def store_fragment(self, page, key, fragment):
+        path = self.fragment_path(page)
+        if fragment:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_bytes(fragment)
+        else:
+            path.unlink(missing_ok=True)
+        self.pages[str(page)] = {"key": key, "fragment": bool(fragment)}
+
+
+def pg_page_keys(volume, fingerprint:str) -> dict:
+    """page number -> key for the pages of a pg.PgVolume."""
+    keys = {}
+    for pagenum in volume.page_list:
+        mets_page = volume.metsvol.page(pagenum)
+        entry = volume.metsvol.page_index[pagenum]
+        try:
+            content = file_digest(mets_page.coordOCR_file)
+        except (IndexError, OSError):
+            content = None
+        keys[pagenum] = page_key(fingerprint, entry, content)
+    return keys
+
+
+def epub_page_keys(volume, fingerprint:str) -> dict:
+    """page index -> key for the pages of an nlp.volume.EPubVolume; the
+    content hash of a member is the CRC-32 the archive already stores."""
+    infos = {info.filename: info for info in volume.epub.infos}
+    keys = {}
+    if volume.page_list:
+        for i in range(0, len(volume.page_list)-1):
+            info = infos[volume.page_list[i]]
+            keys[i] = page_key(fingerprint, info.filename, info.CRC, info.file_size)
+    return keys
+
+
+def build_volume(volume, keys:dict, out_path:Path, build_dir:Path, **write_args) -> str:
+    """Bring out_path up to date with the pages of volume, whose current
+    keys are given; returns 'skipped' or 'done'.
+
+    volume is a PgVolume or an EPubVolume: anything with
+    page_fragment_items(pages=...) and write(f, fragments=...)."""
+    manifest = BuildManifest.load(build_dir)
+    cached = {page: manifest.cached_fragment(page, key) for page, key in keys.items()}
+    stale = [page for page, fragment in cached.items() if fragment is None]
+    up_to_date = set(manifest.pages) == {str(page) for page in keys}
+    if not stale and up_to_date and out_path.is_file():
+        logging.info(f"{out_path} is up to date")
+        return "skipped"
+
+    logging.info(f"rebuilding {len(stale)} of {len(keys)} pages of {out_path.name}")
+    greek_only = write_args.get("greek_only", True)
+    if stale:
+        for page, fragment in volume.page_fragment_items(greek_only=greek_only, pages=stale):
+            manifest.store_fragment(page, keys[page], fragment)
+            cached[page] = fragment or b''
+    for page in set(manifest.pages) - {str(page) for page in keys}:
+        manifest.fragment_path(page).unlink(missing_ok=True)
+        del manifest.pages[page]
+
+    tmp_path = out_path.with_suffix(f".{os.getpid()}.tmp")
+    try:
+        with open(tmp_path, 'wb') as f:
+            volume.write(f, fragments=(fragment for fragment in cached.values() if fragment),
+                         **write_args)
+        os.replace(tmp_path, out_path)
+    finally:
+        tmp_path.unlink(missing_ok=True)
+    manifest.save()
+    return "done"
+
+
+def build_pg_volume(volume, outdir:Path, greek_only=True) -> str:
+    """Incrementally (re)build <outdir>/<barcode>.xml from a PgVolume."""
+    fingerprint = pipeline_fingerprint(volume="pg", greek_only=greek_only)
+    out_path = (Path(outdir) / volume.barcode).with_suffix(".xml")
+    return build_volume(volume, pg_page_keys(volume, fingerprint), out_path,
+                        Path(outdir) / BUILD_DIR / volume.barcode, greek_only=greek_only)
+
+
+def build_epub_volume(volume, outdir:Path, greek_only=True) -> str:
+    """Incrementally (re)build <outdir>/<barcode>.xml from an EPubVolume."""
+    fingerprint = pipeline_fingerprint(volume="epub", greek_only=greek_only)
+    out_path = (Path(outdir) / volume.barcode).with_suffix(".xml")
+    return build_volume(volume, epub_page_keys(volume, fingerprint), out_path,
+                        Path(outdir) / BUILD_DIR / volume.barcode, greek_only=greek_only)
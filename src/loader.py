@@ -1,7 +1,7 @@
 from pathlib import Path
-import re
 from lxml import etree
 import nlp
+from nlp import ingest
 from nlp.page import Page
 import logging
 
@@ -11,13 +11,6 @@ logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(
 
 ns = {"xhtml": "http://www.w3.org/1999/xhtml"}
 
-def fix_entities(xml_string:str) -> str:
-    # Remove XML declaration to avoid ValueError
-    xml_string = re.sub(r'<\?xml.*?\?>', '', xml_string, flags=re.DOTALL)
-    # Replace bad entities (example: replace &shy; with actual soft hyphen)
-    xml_string = xml_string.replace("&shy;", "\u00AD")
-    xml_string = xml_string.replace("&quot;", "\u0022")
-    return xml_string
 
 
 
@@ -29,10 +22,7 @@ class Loader:
     def load_page(self, page_file:Path, page_number):
         # tree = etree.parse(page_file)
         # clean the file's contents first
-        with page_file.open('r') as pf:
-            raw_data = pf.read()
-        clean_data = fix_entities(raw_data)
-        tree = etree.fromstring(clean_data)
+        tree = ingest.parse_file(page_file)
         try:
             page_element =  tree.xpath("//xhtml:div[@class = 'ocr_page']", namespaces=ns)[0]
             return Page(page_element, page_number)
@@ -2,10 +2,12 @@
 #
 # Models of METS objects
 
+import json
+import logging
+import os
 from pathlib import Path
-import re
 from lxml import etree
-from models.ocr_doc import OCRPage, OCRBlock, OCRLine, OCRWord
+from nlp import ingest
 
 
 namespaces = {
@@ -14,34 +16,32 @@ namespaces = {
     'html' : "http://www.w3.org/1999/xhtml"
     }
 
-def fix_entities(xml_string:str) -> str:
-    # Remove XML declaration to avoid ValueError
-    xml_string = re.sub(r'<\?xml.*?\?>', '', xml_string, flags=re.DOTALL)
-    # Replace bad entities (example: replace &shy; with actual soft hyphen)
-    xml_string = xml_string.replace("&shy;", "\u00AD")
-    xml_string = xml_string.replace("&", "&amp;")
-    return xml_string
+METS = "{%s}" % namespaces['mets']
+XLINK = "{%s}" % namespaces['xlink']
+
+MANIFEST_NAME = "mets_manifest.json"
+MANIFEST_VERSION = 2
+
 
 class Mets:
     def __init__(self, directory:Path):
         self.directory = directory
 
 class MetsPage(Mets):
-    def __init__(self, root:etree.Element, directory:Path):
-        self.root = root
+    """A page of a METS volume, built from its MetsManifest entry.
+    Nothing is read from disk until html or doc is asked for."""
+    def __init__(self, entry:dict, files:dict, directory:Path):
         self.directory = directory
-        attributes = self.root.attrib
-        self.physical_order = attributes.get("ORDER")
-        self.logical_order = attributes.get("ORDERLABEL")
-        if attributes.get("ADMID"):
-            self.tags = attributes.get("ADMID")
-        else:
-            self.tags = []
-        
-        self.fileids = self.root.xpath("mets:fptr/@FILEID", namespaces=namespaces)
+        self.files = files
+        self.physical_order = entry["order"]
+        self.logical_order = entry.get("label")
+        # the ADMID string, as in the METS file: tags are matched with
+        # `tag in page.tags`, a substring test
+        self.tags = entry["tags"]
+        self.fileids = entry["fileids"]
         self._xml = None
         self._html = None
-        self.doc = OCRPage(self.html)
+        self._doc = None
 
     @property
     def coordOCR_file(self):
@@ -55,37 +55,36 @@ class MetsPage(Mets):
     def image_file(self):
         return self.file_by_use('image')
 
+    @property
+    def doc(self):
+        if self._doc is None:
+            from models.ocr_doc import OCRPage
+            self._doc = OCRPage(self.html)
+        return self._doc
+
     @property
     def html(self):
         if self._html is None:
-            # read file into a string and fix entity references
-            with open(self.coordOCR_file, 'r') as f:
-                file_content = f.read()
-            data = fix_entities(file_content)
-            # self._html = etree.parse(data)
-            if len(data) > 1:
-                self._html = etree.XML(data)
+            # fix entity references, escaping stray ampersands
+            self._html = ingest.parse_file(self.coordOCR_file, escape_ampersands=True)
         return self._html
 
     def file_by_use(self, use):
-        files = [self.file(id) for id in self.fileids]
-        file_element = [f for f in files if use in self.fileuse(f)][0]
-        flocat = file_element.xpath("./mets:FLocat/@xlink:href", namespaces=namespaces)[0]
-        return self.directory / flocat
+        for fileid in self.fileids:
+            if self.fileuse(fileid) == use:
+                return self.filepath(fileid)
+        raise IndexError(f"page {self.physical_order} has no {use} file")
             
 
     def file(self, fileid):
-        fgroup = self.root.xpath("ancestor::mets:mets/mets:fileSec/mets:fileGrp/mets:file", namespaces=namespaces)
-        file = [f for f in fgroup if f.get('ID') == fileid][0]
-        return file
+        """The (USE, href) pair of a file."""
+        return self.files[fileid]
 
-    def fileuse(self, file):
-        return file.xpath("./parent::*/@USE", namespaces=namespaces)
+    def fileuse(self, fileid):
+        return self.files[fileid][0]
 
     def filepath(self, fileid):
-        fgroup = self.root.xpath("ancestor::mets:mets/mets:fileSec/mets:fileGrp/mets:file", namespaces=namespaces)
-        file = [f for f in fgroup if f.get('ID') == fileid][0]
-        return fgroup
+        return self.directory / self.files[fileid][1]
 
     # @property
     # def physical_order(self):
@@ -112,26 +111,122 @@ class MetsPage(Mets):
         return page
 
 
+class MetsManifest:
+    """A compact index of a METS file, built in a single pass: the
+    object id, a FILEID -> (USE, href) map, and one entry per page div
+    with its ORDER, ORDERLABEL, ADMID tags and FILEIDs."""
+    def __init__(self, objid:str | None, files:dict, pages:list, source:dict | None=None):
+        self.objid = objid
+        self.files = files
+        self.pages = pages
+        self.source = source
+
+    @classmethod
+    def from_mets(cls, mets_path:Path):
+        objid = None
+        files = {}
+        pages = []
+        for event, elem in etree.iterparse(str(mets_path), events=("start", "end")):
+            if event == "start":
+                if objid is None and elem.tag == METS + "mets":
+                    objid = elem.get("OBJID")
+            elif elem.tag == METS + "file":
+                flocat = elem.find(METS + "FLocat")
+                href = flocat.get(XLINK + "href") if flocat is not None else None
+                files[elem.get("ID")] = (elem.getparent().get("USE"), href)
+                elem.clear()
+            elif elem.tag == METS + "div" and elem.get("TYPE") == "page":
+                if elem.get("ORDER"):
+                    pages.append({
+                        "order": elem.get("ORDER"),
+                        "label": elem.get("ORDERLABEL"),
+                        "tags": elem.get("ADMID") or [],
+                        "fileids": [fptr.get("FILEID") for fptr in elem.iterfind(METS + "fptr")],
+                    })
+                elem.clear()
+        return cls(objid, files, pages, source=cls.stat(mets_path))
+
+    @staticmethod
+    def stat(mets_path:Path) -> dict:
+        st = mets_path.stat()
+        return {"name": mets_path.name, "size": st.st_size, "mtime_ns": st.st_mtime_ns}
+
+    @classmethod
+    def load(cls, manifest_path:Path, mets_path:Path):
+        """Read a saved manifest; returns None if it is missing or
+        does not match the current METS file."""
+        try:
+            with open(manifest_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if data.get("version") != MANIFEST_VERSION or data.get("source") != cls.stat(mets_path):
+            return None
+        files = {fileid: tuple(value) for fileid, value in data["files"].items()}
+        return cls(data["objid"], files, data["pages"], source=data["source"])
+
+    def save(self, manifest_path:Path):
+        data = {"version": MANIFEST_VERSION, "source": self.source, "objid": self.objid,
+                "files": self.files, "pages": self.pages}
+        tmp_path = manifest_path.with_suffix(f".{os.getpid()}.tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f)
+        os.replace(tmp_path, manifest_path)
+
+
+def find_mets_file(directory:Path) -> Path:
+    """The METS file of a volume directory: the first .xml file, by name,
+    whose root element is <METS:mets>. Only the start of each file is
+    read."""
+    for path in sorted(Path(directory).glob("*.xml")):
+        try:
+            with open(path, 'rb') as f:
+                for _, elem in etree.iterparse(f, events=("start",)):
+                    if elem.tag == METS + "mets":
+                        return path
+                    break
+        except etree.XMLSyntaxError:
+            pass
+    raise FileNotFoundError(f"no METS file in {directory}")
+
+
 class MetsVolume(Mets):
-    def __init__(self, directory:Path):
-        self.directory = directory
-        self.mets = etree.parse(list(self.directory.glob("*.xml"))[0])
-        self.id = self.mets.xpath("../mets:mets/@OBJID", namespaces=namespaces)
-        self.filepaths:dict = {}
-        self.fileuses:dict = {}
-        for f in list(self.mets.xpath(".//mets:fileSec//mets:file", namespaces=namespaces)):
-            id = f.xpath("@ID", namespaces=namespaces)[0]
-            fpath = f.xpath("./mets:FLocat/@xlink:href", namespaces=namespaces)
-            use = f.xpath("parent::mets:fileGrp/@USE", namespaces=namespaces)
-            self.filepaths[id] = fpath
-            self.fileuses[id] = use
-        self._pages = {}
+    """A volume described by the METS file in its directory.
+
+    The METS file is read once, into a MetsManifest. With
+    persist_manifest=True the manifest is saved next to the volume as
+    mets_manifest.json and reused, as long as the METS file is unchanged,
+    when the volume is opened again.
+
+    MetsPages are kept in page_cache, a dict by default; pass an
+    nlp.page_cache.PageCache to keep only the most recently used ones."""
+    def __init__(self, directory:Path, persist_manifest:bool=False,
+                 manifest:MetsManifest | None=None, page_cache=None):
+        self.directory = Path(directory)
+        self.mets_file = find_mets_file(self.directory)
+        if manifest is None and persist_manifest:
+            manifest = MetsManifest.load(self.directory / MANIFEST_NAME, self.mets_file)
+        if manifest is None:
+            manifest = MetsManifest.from_mets(self.mets_file)
+            if persist_manifest:
+                try:
+                    manifest.save(self.directory / MANIFEST_NAME)
+                except OSError as e:
+                    logging.warning(f"could not save METS manifest for {self.directory}: {e}")
+        self.manifest = manifest
+        self.id = [manifest.objid] if manifest.objid else []
+        self._mets = None
+        self._pages = page_cache if page_cache is not None else {}
         self._xml = None
         self.page_index = {}
-        for page_div in self.mets.xpath("//mets:div[@TYPE='page']", namespaces=namespaces):
-            pnum = page_div.get("ORDER")
-            if pnum:
-                self.page_index[int(pnum)] = page_div
+        for entry in manifest.pages:
+            self.page_index[int(entry["order"])] = entry
+
+    @property
+    def mets(self):
+        if self._mets is None:
+            self._mets = etree.parse(self.mets_file)
+        return self._mets
 
     @property
     def page_list(self):
@@ -143,10 +238,7 @@ class MetsVolume(Mets):
 
     def fileuse(self, id):
         """Determines the use of a file (coordOCR, OCR, or image). """
-
-        file = self.mets.xpath("mets:fileSec/mets:fileGrp/mets:file[@ID=id]", namespaces=namespaces)
-        use = file.xpath("parent::mets:fileGrp/@USE", namespaces=namespaces)
-        return use[0]
+        return self.manifest.files[id][0]
 
     
     def page(self, pagenum):
@@ -154,9 +246,10 @@ class MetsVolume(Mets):
             return page
 
         if self.page_index.get(pagenum) is not None:
-            pdiv = self.page_index[pagenum]
-            self._pages[pagenum] = MetsPage(pdiv, self.directory)
-            return self._pages[pagenum]
+            entry = self.page_index[pagenum]
+            page = MetsPage(entry, self.manifest.files, self.directory)
+            self._pages[pagenum] = page
+            return page
         
         raise IndexError("no such page")
 
@@ -166,7 +259,7 @@ class MetsVolume(Mets):
         if self._xml is None:
             self._xml = '<?xml version="1.0" encoding="UTF-8"?>\n'
             self._xml += '<text>\n'
-            for page in self._pages:
+            for page in list(self._pages.values()):
                 self._xml += f"\n{page.text}"
             self._xml += "\n</text>"
         return self._xml
@@ -7,26 +7,25 @@ class Block(Span):
         super().__init__(tree)
 
 
-    def __str__(self):
-        block = ''
-        for o in self.objects:
-            block += str(o)
-        return block
-    
-
     @property
     def paras(self):
         return [o for o in self.objects if o.type == 'ocr_par']
 
     @property
     def lines(self):
-        return flatten([para.lines for para in self.paras])
+        if self._lines is None:
+            self._lines = flatten([para.lines for para in self.paras])
+        return self._lines
         
     @property
     def words(self):
-        return flatten([para.words for para in self.paras])
+        if self._words is None:
+            self._words = flatten([para.words for para in self.paras])
+        return self._words
 
     @property
     def tokens(self):
-        return flatten([para.tokens for para in self.paras])
+        if self._tokens is None:
+            self._tokens = flatten([para.tokens for para in self.paras])
+        return self._tokens
 
@@ -1,3 +1,4 @@
+import io
 from nlp.utils import flatten
 from nlp.line import Line
 from nlp.token import Token
@@ -17,9 +18,16 @@ class Column:
         return f"<Column side='{self.side}' n='{self.number}'>"
         
     def __str__(self):
-        coltext =''
-        coltext += '\n'.join([str(line) for line in self.lines])
-        return coltext
+        with io.StringIO() as buffer:
+            self.write_to(buffer)
+            return buffer.getvalue()
+
+    def write_to(self, sink, plain=False):
+        """Write the lines of the column to sink, one per line."""
+        for i, line in enumerate(self.lines):
+            if i:
+                sink.write('\n')
+            line.write_to(sink, plain)
 
     @property
     def tokens(self) -> list[Token] | None:
@@ -38,9 +46,9 @@ class Column:
 
     @property
     def percent_greek(self) -> int:
-        if self.words is None:
+        words = self.words
+        if words is None:
             return 0
         else:
-            greek_words = [word for word in self.words if word.is_greek]
-            return round(100 * (len(greek_words) / len(self.words)))
+            return round(100 * (sum(word.is_greek for word in words) / len(words)))
 
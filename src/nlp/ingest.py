@@ -0,0 +1,65 @@
+"""Reading hOCR and XHTML files into lxml trees.
+
+The coordOCR files reference XHTML entities (&shy;, &quot;) without
+loading the DTD that declares them, and some have stray ampersands, so
+they cannot be handed to lxml as they are. fix_entities() repairs them
+in a single regex scan over the raw bytes, and parse() feeds the result
+straight to a configured lxml parser: the file is never decoded to a
+str, and the XML declaration no longer has to be stripped (lxml only
+rejects it on str input)."""
+
+import re
+import threading
+from pathlib import Path
+from lxml import etree
+from nlp import instrument
+
+
+SOFT_HYPHEN = "\u00AD".encode("utf-8")
+
+# &shy; and &quot; become the characters they stand for
+_ENTITY = re.compile(rb"&(shy|quot);")
+_ENTITIES = {b"shy": SOFT_HYPHEN, b"quot": b'"'}
+
+# &shy; becomes a soft hyphen and every other & is escaped
+_AMPERSAND = re.compile(rb"&(shy;)?")
+
+_parsers = threading.local()
+
+
+def parser() -> etree.XMLParser:
+    """The XMLParser of the current thread (lxml parsers must not be
+    shared between threads)."""
+    if not hasattr(_parsers, "parser"):
+        _parsers.parser = etree.XMLParser(no_network=True, huge_tree=True)
+    return _parsers.parser
+
+
+def fix_entities(data:bytes, escape_ampersands:bool=False) -> bytes:
+    """Replace &shy; and &quot; in one pass. With escape_ampersands every
+    other & is escaped as well (and so &quot; is kept as text), which is
+    what the METS page reader has always done."""
+    if b"&" not in data:
+        return data
+    if escape_ampersands:
+        return _AMPERSAND.sub(lambda m: SOFT_HYPHEN if m.group(1) else b"&amp;", data)
+    return _ENTITY.sub(lambda m: _ENTITIES[m.group(1)], data)
+
+
+def parse(data:bytes, escape_ampersands:bool=False) -> etree._Element | None:
+    """The root element of an hOCR document, or None for an empty file."""
+    if not data.strip():
+        return None
+    with instrument.timer("fix_entities"):
+        data = fix_entities(data, escape_ampersands)
+    with instrument.timer("lxml"):
+        return etree.fromstring(data, parser())
+
+
+def read(path:Path) -> bytes:
+    with Path(path).open('rb') as f:
+        return f.read()
+
+
+def parse_file(path:Path, escape_ampersands:bool=False) -> etree._Element | None:
+    return parse(read(path), escape_ampersands)
@@ -0,0 +1,398 @@
+"""Timing, call counting and profiling of the page pipeline.
+
+Nothing is measured until enable() (or recording()) is called, and until
+then every hook costs one attribute lookup. Once enabled:
+
+- timer(name) measures the wall and thread CPU time of a block. Pipeline
+  stages are timed under their stage names (load, parse, repair,
+  classify, serialize, analyze), and the hot paths inside them under
+  fix_entities, lxml and spans. Stage times include the hot-path times
+  measured inside them.
+- The times of each page are kept on its PageJob, so they come back
+  from page worker processes too, and are added up per page, per
+  volume and over the whole run.
+- With count_calls, the expensive properties in COUNTED count their
+  calls. Counts are only kept in the process that enabled them.
+
+profile() is separate: it runs cProfile, or a collapsed-stack profiler
+for flame graphs, over a block of code and every thread it starts.
+Report.write() saves everything as JSON with sorted keys, so the reports
+of two runs can be diffed."""
+
+import cProfile
+import importlib
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from pathlib import Path
+
+
+REPORT_VERSION = 1
+
+# (module, class, property, counter): the class defines the property
+# itself, so overrides are counted under the name of the base property
+COUNTED = [
+    ("nlp.span", "Span", "lines", "Span.lines"),
+    ("nlp.block", "Block", "lines", "Span.lines"),
+    ("nlp.page", "BlankPage", "lines", "Span.lines"),
+    ("nlp.page", "Page", "print_region", "Page.print_region"),
+    ("nlp.page", "BlankPage", "print_region", "Page.print_region"),
+    ("nlp.token", "Token", "is_greek", "Token.is_greek"),
+]
+
+_report = None
+_local = threading.local()
+_installed = {}
+
+
+class Stats:
+    __slots__ = ("count", "wall", "cpu", "max_wall")
+
+    def __init__(self):
+        self.count = 0
+        self.wall = 0.0
+        self.cpu = 0.0
+        self.max_wall = 0.0
+
+    def add(self, wall:float, cpu:float, count:int=1):
+        self.count += count
+        self.wall += wall
+        self.cpu += cpu
+        self.max_wall = max(self.max_wall, wall)
+
+    def to_dict(self) -> dict:
+        return {"count": self.count, "wall": round(self.wall, 6), "cpu": round(self.cpu, 6),
+                "max_wall": round(self.max_wall, 6)}
+
+
+class Report:
+    """Timers, call counters and per-page and per-volume times of a run."""
+    def __init__(self):
+        self.timers = {}
+        self.counters = Counter()
+        self.pages = []
+        self.volumes = {}
+        self._lock = threading.Lock()
+
+    def add(self, name:str, wall:float, cpu:float):
+        with self._lock:
+            if name not in self.timers:
+                self.timers[name] = Stats()
+            self.timers[name].add(wall, cpu)
+
+    def add_page(self, volume:str, page, timings:dict):
+        with self._lock:
+            for name, (wall, cpu) in timings.items():
+                if name not in self.timers:
+                    self.timers[name] = Stats()
+                self.timers[name].add(wall, cpu)
+            self.pages.append({"volume": volume, "page": page,
+                               "timers": {name: [round(wall, 6), round(cpu, 6)]
+                                          for name, (wall, cpu) in timings.items()}})
+
+    def add_volume(self, barcode:str, wall:float, cpu:float, pages:int):
+        with self._lock:
+            self.volumes[barcode] = {"wall": round(wall, 6), "cpu": round(cpu, 6), "pages": pages}
+
+    def merge(self, data:dict):
+        """Add the to_dict() of another report, e.g. from a worker process."""
+        with self._lock:
+            for name, stats in data["timers"].items():
+                if name not in self.timers:
+                    self.timers[name] = Stats()
+                self.timers[name].add(stats["wall"], stats["cpu"], stats["count"])
+                self.timers[name].max_wall = max(self.timers[name].max_wall, stats["max_wall"])
+            self.counters.update(data["counters"])
+            self.pages.extend(data["pages"])
+            self.volumes.update(data["volumes"])
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            return {"version": REPORT_VERSION,
+                    "timers": {name: stats.to_dict() for name, stats in self.timers.items()},
+                    "counters": dict(self.counters),
+                    "volumes": dict(self.volumes),
+                    "pages": sorted(self.pages, key=lambda p: (p["volume"], p["page"]))}
+
+    def write(self, path:Path):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(), f, indent=1, sort_keys=True)
+            f.write("\n")
+
+    def summary(self) -> str:
+        lines = [f"{'timer':<16}{'count':>8}{'wall s':>10}{'cpu s':>10}"]
+        for name, stats in sorted(self.timers.items(), key=lambda item: -item[1].wall):
+            lines.append(f"{name:<16}{stats.count:>8}{stats.wall:>10.3f}{stats.cpu:>10.3f}")
+        for name, count in sorted(self.counters.items()):
+            lines.append(f"{name:<24}{count:>8}")
+        return "\n".join(lines)
+
+
+def enabled() -> bool:
+    return _report is not None
+
+def report() -> Report | None:
+    return _report
+
+
+def enable(count_calls:bool=False) -> Report:
+    """Start recording into a new Report, and return it."""
+    global _report
+    _report = Report()
+    if count_calls:
+        _install_counters()
+    return _report
+
+def disable():
+    global _report
+    _remove_counters()
+    _report = None
+
+
+@contextmanager
+def recording(count_calls:bool=False):
+    """Record the enclosed code into a new Report, then restore whatever
+    was being recorded before."""
+    global _report
+    previous, counting = _report, bool(_installed)
+    enable(count_calls)
+    try:
+        yield _report
+    finally:
+        _remove_counters()
+        _report = previous
+        if counting:
+            _install_counters()
+
+
+# Timers
+
+class _NullTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+_NULL = _NullTimer()
+
+
+def _record(name, wall, cpu, timings):
+    if timings is not None:
+        totals = timings.get(name)
+        if totals is None:
+            timings[name] = [wall, cpu]
+        else:
+            totals[0] += wall
+            totals[1] += cpu
+    elif _report is not None:
+        _report.add(name, wall, cpu)
+
+
+class _Timer:
+    __slots__ = ("name", "timings", "wall", "cpu")
+
+    def __init__(self, name, timings):
+        self.name = name
+        self.timings = timings
+
+    def __enter__(self):
+        self.wall = time.perf_counter()
+        self.cpu = time.thread_time()
+        return self
+
+    def __exit__(self, *exc):
+        _record(self.name, time.perf_counter() - self.wall, time.thread_time() - self.cpu,
+                self.timings)
+        return False
+
+
+def timer(name:str):
+    """A context manager timing a block under name: into the timings of
+    the page being processed by this thread, if there is one, or else
+    into the current Report."""
+    timings = getattr(_local, "timings", None)
+    if timings is None and _report is None:
+        return _NULL
+    return _Timer(name, timings)
+
+
+class Timed:
+    """A pipeline stage function that times each call under the stage's
+    name. While it runs, timer() blocks record into the item's timings
+    (see PageJob), so that they travel with the page. Picklable if fn is."""
+    def __init__(self, name:str, fn):
+        self.name = name
+        self.fn = fn
+
+    def __call__(self, item):
+        timings = getattr(item, "timings", None)
+        previous = getattr(_local, "timings", None)
+        _local.timings = timings
+        try:
+            with _Timer(self.name, timings):
+                return self.fn(item)
+        finally:
+            _local.timings = previous
+
+
+def record_page(volume:str, page, timings:dict | None):
+    if timings and _report is not None:
+        _report.add_page(volume, page, timings)
+
+
+class _VolumeTimer:
+    def __init__(self, barcode):
+        self.barcode = barcode
+
+    def __enter__(self):
+        self.pages = len(_report.pages)
+        self.wall = time.perf_counter()
+        self.cpu = time.process_time()
+        return self
+
+    def __exit__(self, *exc):
+        if _report is not None:
+            _report.add_volume(self.barcode, time.perf_counter() - self.wall,
+                               time.process_time() - self.cpu, len(_report.pages) - self.pages)
+        return False
+
+
+def volume(barcode:str):
+    """A context manager timing the whole of a volume (CPU time is that
+    of this process only)."""
+    if _report is None:
+        return _NULL
+    return _VolumeTimer(barcode)
+
+
+# Call counters
+
+def _counting(counter, prop):
+    fget = prop.fget
+
+    def counted(self):
+        if _report is not None:
+            _report.counters[counter] += 1
+        return fget(self)
+    return property(counted, prop.fset, prop.fdel, prop.__doc__)
+
+
+def _install_counters():
+    if _installed:
+        return
+    for module, class_name, attr, counter in COUNTED:
+        cls = getattr(importlib.import_module(module), class_name)
+        prop = cls.__dict__[attr]
+        _installed[(cls, attr)] = prop
+        setattr(cls, attr, _counting(counter, prop))
+
+
+def _remove_counters():
+    for (cls, attr), prop in _installed.items():
+        setattr(cls, attr, prop)
+    _installed.clear()
+
+
+# Profiling
+
+class _CProfiler:
+    """cProfile over the current thread and every thread started while
+    it runs (cProfile itself only sees the thread that enabled it)."""
+    def __init__(self):
+        self.profiles = []
+        self._lock = threading.Lock()
+
+    def _new(self):
+        profile = cProfile.Profile()
+        with self._lock:
+            self.profiles.append(profile)
+        return profile
+
+    def _start_thread(self, frame, event, arg):
+        self._new().enable()
+
+    def start(self):
+        threading.setprofile(self._start_thread)
+        self._main = self._new()
+        self._main.enable()
+
+    def stop(self):
+        self._main.disable()
+        threading.setprofile(None)
+
+    def write(self, path):
+        import pstats
+        profiles = [profile for profile in self.profiles if profile.getstats()]
+        if profiles:
+            pstats.Stats(*profiles).dump_stats(path)
+
+
+class _StackProfiler:
+    """A deterministic profiler writing collapsed stacks ("a;b;c usec"
+    lines), the input format of flamegraph.pl and speedscope."""
+    def __init__(self):
+        self.stacks = Counter()
+        self._threads = threading.local()
+        self._lock = threading.Lock()
+
+    def _hook(self, frame, event, arg):
+        now = time.perf_counter_ns()
+        state = self._threads.__dict__
+        if "stack" not in state:
+            state["stack"] = [threading.current_thread().name]
+            state["last"] = now
+        stack = state["stack"]
+        elapsed = now - state["last"]
+        if elapsed and len(stack) > 1:
+            with self._lock:
+                self.stacks[stack[-1]] += elapsed
+        if event == "call":
+            code = frame.f_code
+            stack.append(f"{stack[-1]};{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+        elif event == "c_call":
+            stack.append(f"{stack[-1]};{getattr(arg, '__qualname__', repr(arg))}")
+        elif len(stack) > 1:
+            stack.pop()
+        state["last"] = time.perf_counter_ns()
+
+    def start(self):
+        threading.setprofile(self._hook)
+        sys.setprofile(self._hook)
+
+    def stop(self):
+        sys.setprofile(None)
+        threading.setprofile(None)
+
+    def write(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            for stack, ns in sorted(self.stacks.items()):
+                if ns >= 1000:
+                    f.write(f"{stack} {ns // 1000}\n")
+
+
+PROFILERS = {"pstats": _CProfiler, "collapsed": _StackProfiler}
+
+
+@contextmanager
+def profile(path:Path, format:str="pstats"):
+    """Profile the enclosed code and the threads it starts, and write the
+    result to path: a pstats file, or collapsed stacks for a flame graph.
+    Page worker processes are not profiled; profile with jobs=1."""
+    if format not in PROFILERS:
+        raise ValueError(f"unknown profile format {format!r}")
+    profiler = PROFILERS[format]()
+    profiler.start()
+    try:
+        yield profiler
+    finally:
+        profiler.stop()
+        profiler.write(path)
+        logging.info(f"wrote {format} profile to {path}")
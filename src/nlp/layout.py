@@ -0,0 +1,228 @@
+from bisect import bisect_left, bisect_right
+from fractions import Fraction
+from nlp.bbox import BBox
+from nlp.utils import percent_greek
+
+
+class LineIndex:
+    """A page's lines sorted once by bottom, top and left.
+
+    Range queries ("lines whose baseline is within k of y", "lines
+    starting left of x", "the next line below") are answered with bisect
+    instead of scanning every line. Results that are sets of lines come
+    back in document order, like the scans they replace; ties in the
+    sorted orders keep document order too, since the sorts are stable."""
+    def __init__(self, lines):
+        self.lines = lines
+        self.position = {line: i for i, line in enumerate(lines)}
+        self.by_bottom = sorted(lines, key=lambda line: line.bottom)
+        self.bottoms = [line.bottom for line in self.by_bottom]
+        self.by_top = sorted(lines, key=lambda line: line.top)
+        self.tops = [line.top for line in self.by_top]
+        self.by_left = sorted(lines, key=lambda line: line.left)
+        self.lefts = [line.left for line in self.by_left]
+
+    def in_document_order(self, lines):
+        position = self.position
+        return sorted(lines, key=lambda line: position[line])
+
+    def near_baseline(self, y, tolerance=10):
+        """The lines whose bottom is within tolerance of y."""
+        lo = bisect_left(self.bottoms, y - tolerance)
+        hi = bisect_right(self.bottoms, y + tolerance)
+        return self.in_document_order(self.by_bottom[lo:hi])
+
+    def left_of(self, x):
+        """The lines whose left edge is at or before x."""
+        return self.in_document_order(self.by_left[:bisect_right(self.lefts, x)])
+
+    def top_rank(self, line) -> int:
+        """The position of line in by_top."""
+        i = bisect_left(self.tops, line.top)
+        while self.by_top[i] is not line:
+            i += 1
+        return i
+
+    def next_below(self, line):
+        """The first line (by top) that starts at or below line's bottom."""
+        i = bisect_left(self.tops, line.bottom)
+        if i < len(self.by_top):
+            return self.by_top[i]
+        return None
+
+
+class TopOrder:
+    """A page's lines sorted by top, kept sorted while lines are
+    replaced and inserted, so that a run of edits costs one sort.
+
+    Lines with the same top stay in document order, as in
+    LineIndex.by_top. Document order is kept as a number per line;
+    a line inserted between two others gets the midpoint of theirs."""
+    def __init__(self, lines):
+        lines = list(lines)
+        self.position = {line: i for i, line in enumerate(lines)}
+        self._next = dict(zip(lines, lines[1:]))
+        self._previous = dict(zip(lines[1:], lines))
+        self.lines = sorted(lines, key=lambda line: line.top)
+        self.keys = [(line.top, self.position[line]) for line in self.lines]
+
+    def rank(self, line) -> int:
+        """The position of line in lines."""
+        return bisect_left(self.keys, (line.top, self.position[line]))
+
+    def _add(self, line, position):
+        self.position[line] = position
+        key = (line.top, position)
+        i = bisect_right(self.keys, key)
+        self.keys.insert(i, key)
+        self.lines.insert(i, line)
+
+    def replace(self, old, new):
+        """Put new where old was in the document."""
+        i = self.rank(old)
+        del self.keys[i], self.lines[i]
+        position = self.position.pop(old)
+        previous, following = self._previous.pop(old, None), self._next.pop(old, None)
+        self._link(previous, new)
+        self._link(new, following)
+        self._add(new, position)
+
+    def insert_before(self, line, new):
+        """Add new just before line in the document."""
+        previous = self._previous.get(line)
+        position = self.position[line]
+        if previous is None:
+            self._add(new, position - 1)
+        else:
+            self._add(new, (self.position[previous] + position) / Fraction(2))
+        self._link(previous, new)
+        self._link(new, line)
+
+    def insert_after(self, line, new):
+        """Add new just after line in the document."""
+        following = self._next.get(line)
+        position = self.position[line]
+        if following is None:
+            self._add(new, position + 1)
+        else:
+            self._add(new, (position + self.position[following]) / Fraction(2))
+        self._link(line, new)
+        self._link(new, following)
+
+    def _link(self, first, second):
+        if first is not None and second is not None:
+            self._next[first] = second
+            self._previous[second] = first
+
+
+class PageLayout:
+    """The layout analysis of a Page: margins and print region, the
+    lines aligned with each side of the print region, column numbers,
+    which columns are Greek, the running head and the title candidates.
+
+    Each result is computed the first time it is asked for and kept.
+    The page throws its PageLayout away whenever its tree changes (see
+    Span.invalidate), so nothing here has to be recomputed by hand."""
+    def __init__(self, page):
+        self.page = page
+        self._margins = None
+        self._print_region = None
+        self._left_lines = {}
+        self._right_lines = {}
+        self._column_numbers = None
+        self._greek_sides = None
+        self._running_head = None
+        self._title_lines = None
+        self._line_index = None
+
+    @property
+    def line_index(self) -> LineIndex:
+        if self._line_index is None:
+            self._line_index = LineIndex(self.page.lines)
+        return self._line_index
+
+    @property
+    def margins(self):
+        """(left, right, top, bottom), in one pass over the lines."""
+        if self._margins is None:
+            page = self.page
+            lines = page.lines
+            if lines:
+                min_left = min_top = None
+                max_right = max_bottom = None
+                for line in lines:
+                    bbox = line.bbox
+                    if min_left is None or bbox.left < min_left:
+                        min_left = bbox.left
+                    if max_right is None or bbox.right > max_right:
+                        max_right = bbox.right
+                    if min_top is None or bbox.top < min_top:
+                        min_top = bbox.top
+                    if max_bottom is None or bbox.bottom > max_bottom:
+                        max_bottom = bbox.bottom
+                self._margins = (page.left + min_left, page.right - max_right,
+                                 page.top + min_top, page.bottom - max_bottom)
+            else:
+                self._margins = (page.left, page.right, page.top, page.bottom)
+        return self._margins
+
+    @property
+    def print_region(self):
+        if self._print_region is None:
+            page = self.page
+            margin_left, margin_right, margin_top, margin_bottom = self.margins
+            self._print_region = BBox(page.left + margin_left,
+                                      page.top + margin_top,
+                                      page.right - margin_right,
+                                      page.bottom - margin_bottom)
+        return self._print_region
+
+    def left_lines(self, tolerance):
+        if tolerance not in self._left_lines:
+            region_left = self.print_region.left
+            self._left_lines[tolerance] = self.line_index.left_of(region_left + tolerance)
+        return self._left_lines[tolerance]
+
+    def right_lines(self, tolerance):
+        if tolerance not in self._right_lines:
+            region_right = self.print_region.right
+            self._right_lines[tolerance] = [line for line in self.page.lines
+                                            if abs(region_right - line.right) <= tolerance]
+        return self._right_lines[tolerance]
+
+    @property
+    def column_numbers(self):
+        if self._column_numbers is None:
+            self._column_numbers = self.page.find_column_numbers()
+        return self._column_numbers
+
+    @property
+    def greek_sides(self):
+        """The sides ('left', 'right') whose columns are mostly Greek."""
+        if self._greek_sides is None:
+            sides = []
+            for column in (self.page.left_column, self.page.right_column):
+                if column and percent_greek(column.tokens) > .5:
+                    sides.append(column.side)
+            self._greek_sides = sides
+        return self._greek_sides
+
+    @property
+    def running_head(self):
+        if self._running_head is None:
+            ptop = self.print_region.top
+            header_line_height = 35
+            self._running_head = [line for line in self.page.lines
+                                  if line.top == ptop and line.height <= header_line_height]
+        return self._running_head
+
+    @property
+    def title_lines(self):
+        if self._title_lines is None:
+            print_region = self.print_region
+            centered_lines = [line for line in self.page.lines
+                              if line.bbox.is_horizontally_centered_within(print_region, 100)
+                              and str(line).strip().isupper()]
+            running_head = self.running_head
+            self._title_lines = [line for line in centered_lines if line not in running_head]
+        return self._title_lines
@@ -0,0 +1,208 @@
+"""A persistent on-disk cache of parsed page layouts.
+
+A page's Span tree (the classes, types, bounding boxes, styles and token
+texts of its blocks, paragraphs, lines and tokens) is flattened into
+nested tuples and stored with marshal, keyed by the sha256 of the hOCR
+file it was parsed from. Restoring a page from the cache skips reading
+entities, parsing XHTML and parsing every bbox and style attribute.
+
+Entries are written to a temporary file and renamed into place, so any
+number of processes can share one cache directory: a reader sees either
+a whole entry or none. When the cache grows past max_bytes the least
+recently used entries are evicted."""
+
+import hashlib
+import logging
+import marshal
+import os
+import sys
+import threading
+from collections import deque
+from pathlib import Path
+from nlp.bbox import BBox
+from nlp.block import Block
+from nlp.line import Line
+from nlp.page import Page, BlankPage
+from nlp.par import Par
+from nlp.span import Span
+from nlp.style import Style
+from nlp.token import Token
+
+
+# Bump FORMAT_VERSION whenever the layout model or the way it is built
+# from hOCR changes, so that stale entries are ignored. marshal's format
+# depends on the Python version, which is part of the header too.
+FORMAT_VERSION = 1
+MAGIC = b"PGLC" + bytes([FORMAT_VERSION, sys.version_info[0], sys.version_info[1], marshal.version])
+
+TOKEN, SPAN, LINE, PAR, BLOCK, PAGE = range(6)
+CODES = {Line: LINE, Par: PAR, Block: BLOCK, Page: PAGE, BlankPage: PAGE}
+CLASSES = {SPAN: Span, LINE: Line, PAR: Par, BLOCK: Block, PAGE: Page}
+
+
+def file_key(data:bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def _style_string(obj):
+    return obj._style.style_string if obj._style else None
+
+def _flatten(obj):
+    bbox = obj.bbox
+    box = (bbox.left, bbox.top, bbox.right, bbox.bottom)
+    if isinstance(obj, Token):
+        return (TOKEN, box, _style_string(obj), obj.text, obj.tail, obj.is_greek)
+    children = tuple(_flatten(child) for child in obj.objects)
+    return (CODES.get(type(obj), SPAN), obj.type, box, _style_string(obj), children)
+
+
+def dump_page(page:Page) -> bytes:
+    """The binary form of page's layout, as parsed (before any repairs)."""
+    return MAGIC + marshal.dumps(_flatten(page))
+
+
+def _restore(node, styles, page_class=None):
+    if node[0] == TOKEN:
+        _, box, style, text, tail, is_greek = node
+        obj = Token.__new__(Token)
+        obj.parent = None
+        obj.text = text
+        obj.tail = tail
+        obj.type = "token"
+        obj._is_greek = is_greek
+    else:
+        code, type_, box, style, children = node
+        cls = page_class if code == PAGE and page_class else CLASSES[code]
+        obj = cls.__new__(cls)
+        Span.__init__(obj, None)
+        obj.type = type_
+        objects = obj.objects
+        for child in children:
+            child_obj = _restore(child, styles)
+            child_obj.parent = obj
+            objects.append(child_obj)
+        if code == PAGE:
+            obj.root = None
+            obj.number = 0
+            obj._layout = None
+            obj._repaired = False
+    obj._bbox = BBox(*box)
+    if style is None:
+        obj._style = {}
+    else:
+        if style not in styles:
+            styles[style] = Style(style)
+        obj._style = styles[style]
+    return obj
+
+
+def load_page(data:bytes, number:int=0, blank:bool=False) -> Page:
+    """Rebuild a Page from dump_page() output. Like pg.Loader, it builds
+    a BlankPage if blank is set or if the page has no classed elements."""
+    if not data.startswith(MAGIC):
+        raise ValueError("not a layout cache entry for this version")
+    node = marshal.loads(data[len(MAGIC):])
+    blank = blank or len(node[4]) == 0
+    page = _restore(node, {}, BlankPage if blank else Page)
+    page.number = number
+    if blank:
+        page.type = "blank"
+    return page
+
+
+class LayoutCache:
+    """A directory of dump_page() entries, named by file key and sharded
+    by its first two characters, holding at most about max_bytes."""
+    def __init__(self, directory:Path, max_bytes:int=1 << 30, check_every:int=64):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self.check_every = check_every
+        self._writes = 0
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def __reduce__(self):
+        # workers get their own instance over the same directory
+        return (LayoutCache, (self.directory, self.max_bytes, self.check_every))
+
+    def path(self, key:str) -> Path:
+        return self.directory / key[:2] / f"{key}.bin"
+
+    def get(self, key:str) -> bytes | None:
+        path = self.path(key)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+        except OSError:
+            return None
+        if not data.startswith(MAGIC):
+            return None
+        try:
+            # mark the entry as recently used for eviction
+            os.utime(path)
+        except OSError:
+            pass
+        return data
+
+    def put(self, key:str, data:bytes):
+        path = self.path(key)
+        path.parent.mkdir(exist_ok=True)
+        tmp_path = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+        try:
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logging.warning(f"could not write layout cache entry {path}: {e}")
+            tmp_path.unlink(missing_ok=True)
+            return
+        self._writes += 1
+        if self._writes % self.check_every == 1:
+            self.evict()
+
+    def load_page(self, key:str, number:int=0, blank:bool=False) -> Page | None:
+        data = self.get(key)
+        if data is None:
+            return None
+        try:
+            return load_page(data, number, blank)
+        except (ValueError, EOFError, TypeError, KeyError, IndexError) as e:
+            logging.warning(f"ignoring unreadable layout cache entry {key}: {e}")
+            return None
+
+    def store_page(self, key:str, page:Page):
+        self.put(key, dump_page(page))
+
+    def entries(self):
+        """(mtime, size, path) of every entry."""
+        found = []
+        pending = deque([self.directory])
+        while pending:
+            with os.scandir(pending.popleft()) as it:
+                for entry in it:
+                    if entry.is_dir(follow_symlinks=False):
+                        pending.append(entry.path)
+                    elif entry.name.endswith(".bin"):
+                        try:
+                            st = entry.stat()
+                        except OSError:
+                            continue
+                        found.append((st.st_mtime_ns, st.st_size, entry.path))
+        return found
+
+    def evict(self):
+        """Remove the least recently used entries until the cache is
+        below 90% of max_bytes. Other processes may be evicting at the
+        same time, so entries that are already gone are skipped."""
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        if total <= self.max_bytes:
+            return
+        target = self.max_bytes * 9 // 10
+        for _, size, path in sorted(entries):
+            if total <= target:
+                break
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+            total -= size
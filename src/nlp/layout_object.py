@@ -2,24 +2,27 @@ from lxml import etree
 from nlp.bbox import BBox
 from nlp.style import Style
 
+def bbox_values(element:etree.Element) -> list[int]:
+    """The bounding box of an hOCR element, from its title or data-coords."""
+    if element.get('title'):
+        bbox_string = element.get('title').split(';')[0].split(' ')[1:]
+    elif element.get('class') == 'ocrx_word' and element.get('data-coords'):
+        bbox_string = element.get('data-coords').split(' ')
+    else:
+        bbox_string = ['0', '0', '0', '0']
+    return [int(v) for v in bbox_string]
+
+
 class LayoutObject:
     def __init__(self, element:etree.Element | None):
         self._bbox = BBox(0,0,0,0)
+        self._style = {}
+        self.parent:LayoutObject | None = None
         if element is not None:
-            if element.get('title'):
-                bbox_string = element.get('title').split(';')[0].split(' ')[1:]
-            elif element.get('class') == 'ocrx_word' and element.get('data-coords'):
-                bbox_string = element.get('data-coords').split(' ')
-            else:
-                bbox_string = ['0', '0', '0', '0']
-
-            values = [int(v) for v in bbox_string]
-            self._bbox = BBox(*values)
-            self._style = {}
+            self._bbox = BBox(*bbox_values(element))
             style_string = element.get('style')
             if style_string:
                 self._style = Style(style_string)
-            self.parent:LayoutObject | None = None
             self.type:str = element.get('class')
 
 
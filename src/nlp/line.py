@@ -1,5 +1,7 @@
+from collections import deque
 from nlp.utils import percent_greek
 from nlp.span import Span
+from nlp.token import Token
 from nlp.bbox import BBox
 from lxml import etree
 
@@ -10,14 +12,6 @@ class Line(Span):
             self.parent = None
         self.type = 'ocr_line'
 
-    def __str__(self):
-        p = ''
-        for o in self.objects:
-            p = p + str(o)
-        # p += '\n'
-        return p
-
-
     def __repr__(self):
         txt = ''
         for token in self.tokens:
@@ -45,9 +39,7 @@ class Line(Span):
 
     @property
     def is_fused(self) -> bool:
-        condition1 = self.starts_greek and not(self.ends_greek)
-        condition2 = not(self.starts_greek) and self.ends_greek
-        return any([condition1, condition2])
+        return self.starts_greek != self.ends_greek
 
 
     def split(self):
@@ -55,15 +47,20 @@ class Line(Span):
         line_right = Line(None)
 
         line_left.objects = self.objects.copy()
-        line_left.reset_bbox()
+        line_left.invalidate()
 
         mid = round(self.length / 2)
 
-
-        while line_left.length > mid:
-            tok = line_left.pop()
-            if tok:
-                line_right.prepend(tok)
+        if all(isinstance(obj, Token) for obj in line_left.objects):
+            # one token per object: cut the line at mid in one go
+            # (empty tokens are dropped from the right half, as pop()
+            # and prepend() below drop them)
+            line_right.extend(tok for tok in line_left.splice(mid, len(line_left.objects)) if tok)
+        else:
+            while line_left.length > mid:
+                tok = line_left.pop()
+                if tok:
+                    line_right.prepend(tok)
 
         line_left.reset_bbox()
         line_right.reset_bbox()
@@ -71,6 +68,61 @@ class Line(Span):
         return line_left, line_right
 
     def unfuse(self):
+        """Split a fused line into its Greek and its other half.
+
+        The line is first cut in the middle, as split() does; then, while
+        the other half still has Greek in it (by percent_greek, which
+        rounds, so a trace of Greek in a long half does not count), its
+        first (or last) token moves over to the Greek half, and any
+        punctuation after it follows. Prefix sums of the token flags find
+        where that stops in one pass over the line."""
+        tokens = list(self.objects)
+        if not all(isinstance(token, Token) and token for token in tokens):
+            return self._unfuse_stepwise()
+        n = len(tokens)
+        mid = round(n / 2)
+        punct = [token.is_punct for token in tokens]
+        # words[i], greek[i]: the words, and the Greek words, in tokens[:i]
+        words = [0] * (n + 1)
+        greek = [0] * (n + 1)
+        for i, token in enumerate(tokens):
+            is_word = not punct[i]
+            words[i + 1] = words[i] + is_word
+            greek[i + 1] = greek[i] + (is_word and token.is_greek)
+
+        def has_greek(w, g):
+            return w > 0 and round(100 * (g / w)) > 0
+
+        cut = mid
+        if self.starts_greek:
+            while has_greek(words[n] - words[cut], greek[n] - greek[cut]):
+                cut += 1
+                while cut < n and punct[cut]:
+                    cut += 1
+        elif self.ends_greek:
+            while has_greek(words[cut], greek[cut]):
+                cut -= 1
+                while cut > 0 and punct[cut - 1]:
+                    cut -= 1
+
+        left = Line(None)
+        right = Line(None)
+        left.objects = deque(tokens[:cut])
+        right.objects = deque(tokens[cut:])
+        # as when the halves were built token by token, the tokens of the
+        # first half of the line keep their parent
+        for token in tokens[mid:cut]:
+            token.parent = left
+        for token in tokens[cut:]:
+            token.parent = right
+        left.reset_bbox()
+        right.reset_bbox()
+        return left, right
+
+
+    def _unfuse_stepwise(self):
+        """unfuse() one token at a time, for lines holding objects other
+        than Tokens, or empty tokens, which the one-pass version skips."""
         left,right = self.split()
         if self.starts_greek:
             while right.percent_greek > 0:
@@ -1,27 +1,52 @@
-import io
 import re
 from lxml import etree
-from nlp.utils import ns, percent_greek
+from nlp.utils import ns
 from nlp.span import Span
-from nlp.token import Token
+from nlp.token import Token, label_greek
 from nlp.bbox import BBox
 from nlp.column import Column
+from nlp.layout import PageLayout, TopOrder
+from nlp.writer import XMLWriter, xml_bytes, running_head_text
 
 
 
+def ocr_page(tree:etree.Element) -> etree.Element:
+    """The ocr_page div of tree, which is either that div itself or a
+    document containing it."""
+    if tree.get('class') == 'ocr_page':
+        return tree
+    return tree.xpath("//xhtml:div[@class='ocr_page']", namespaces=ns)[0]
+
+
+def is_empty(root:etree.Element) -> bool:
+    """True if an ocr_page div has no classed children, i.e. its Page
+    would have no objects."""
+    return all(child.get('class') is None for child in root)
+
+
 class Page(Span):
     def __init__(self, tree:etree.Element, number:int=0):
-        self.root = tree.xpath("//xhtml:div[@class='ocr_page']", namespaces=ns)[0]
+        self.root = ocr_page(tree)
         super().__init__(self.root)
         self.number = number
         self.type = "page"
+        self._layout = None
+        self._repaired = False
+        # classify every token's script in one pass up front; the
+        # percent-Greek heuristics then only sum the cached flags
+        label_greek(self.tokens)
+
 
+    @property
+    def layout(self) -> PageLayout:
+        """The page's layout analysis, rebuilt only after the page changes."""
+        if self._layout is None:
+            self._layout = PageLayout(self)
+        return self._layout
 
-    def __str__(self):
-        page = ''
-        for o in self.objects:
-            page += str(o)
-        return page
+    def drop_caches(self):
+        super().drop_caches()
+        self._layout = None
 
 
     @property
@@ -35,7 +60,7 @@ class Page(Span):
         if not self.lines:
             return []
         groups = []
-        sorted_lines = sorted(self.lines, key=lambda x: x.bottom)
+        sorted_lines = self.layout.line_index.by_bottom
         current_group = [sorted_lines[0]]
         current_baseline = sorted_lines[0].bottom
         for line in sorted_lines[1:]:
@@ -63,41 +88,29 @@ class Page(Span):
 
     @property
     def margin_left(self):
-        if self.lines:
-            return self.left + min([line.left for line in self.lines])
-        else:
-            return self.left
+        return self.layout.margins[0]
 
     @property
     def margin_right(self):
-        if self.lines:
-            return self.right - max([line.right for line in self.lines])
-        else:
-            return self.right
+        return self.layout.margins[1]
 
     @property
     def margin_top(self):
-        if self.lines:
-            return self.top + min([line.top for line in self.lines])
-        else:
-            return self.top
+        return self.layout.margins[2]
 
     @property
     def margin_bottom(self):
-        if self.lines:
-            return self.bottom - max([line.bottom for line in self.lines])
-        else:
-            return self.bottom
+        return self.layout.margins[3]
 
     @property
     def print_region(self):
-        return BBox(self.left + self.margin_left,
-                    self.top + self.margin_top,
-                    self.right - self.margin_right,
-                    self.bottom - self.margin_bottom)
+        return self.layout.print_region
 
     def lines_adjacent(self, a_line):
-        return [line for line in self.lines if abs(a_line.bottom - line.bottom) <= 10]
+        return self.layout.line_index.near_baseline(a_line.bottom, 10)
+
+    def line_below(self, a_line):
+        return self.layout.line_index.next_below(a_line)
 
     
     @property
@@ -106,7 +119,7 @@ class Page(Span):
 
     def lines_aligned_left(self, x, padding=30):
         # return [line for line in self.lines if abs(line.left - x) <= padding]
-        return [line for line in self.lines if line.left <= x]
+        return self.layout.line_index.left_of(x)
 
     def blocks_aligned_left(self, x, padding=30):
         # return [line for line in self.lines if abs(line.left - x) <= padding]
@@ -115,6 +128,9 @@ class Page(Span):
 
     @property
     def column_numbers(self):
+        return self.layout.column_numbers
+
+    def find_column_numbers(self):
         # p = re.compile(r'.*?(\d+).*^')
         col_nums = {}
         if self.lines and len(self.lines) > 1:
@@ -129,9 +145,7 @@ class Page(Span):
 
     @property
     def running_head(self):
-        ptop = self.print_region.top
-        header_line_height = 35
-        return [line for line in self.lines if line.top == ptop and line.height <= header_line_height]
+        return self.layout.running_head
 
 
     def aligned_left(self, line, tolerance=20):
@@ -141,12 +155,10 @@ class Page(Span):
         return abs(self.print_region.right - line.right) <= tolerance
 
     def left_lines(self, tolerance=30):
-        return [line for line in self.lines
-                if self.aligned_left(line, tolerance=tolerance)]
+        return self.layout.left_lines(tolerance)
 
     def right_lines(self, tolerance=10):
-        return [line for line in self.lines
-                if self.aligned_right(line, tolerance=tolerance)]
+        return self.layout.right_lines(tolerance)
 
     @property
     def left_column(self):
@@ -165,25 +177,22 @@ class Page(Span):
     
     @property
     def greek_column(self):
-        left_column = self.left_column
-        if left_column and percent_greek(left_column.tokens) > .5:
-            return left_column
-        else:
-            right_column = self.right_column
-            if right_column and percent_greek(right_column.tokens) > .5:
-                return right_column
+        greek_sides = self.layout.greek_sides
+        if 'left' in greek_sides:
+            return self.left_column
+        elif 'right' in greek_sides:
+            return self.right_column
             
     # some pages have two columns in Greek
     @property
     def greek_columns(self):
         columns = []
-        left_column = self.left_column
-        if left_column and percent_greek(left_column.tokens) > .5:
-            columns.append(left_column)
+        greek_sides = self.layout.greek_sides
+        if 'left' in greek_sides:
+            columns.append(self.left_column)
 
-        right_column = self.right_column
-        if right_column and percent_greek(right_column.tokens) > .5:
-            columns.append(right_column)
+        if 'right' in greek_sides:
+            columns.append(self.right_column)
 
         return columns
             
@@ -191,41 +200,53 @@ class Page(Span):
     @property
     def fused_lines(self):
         fused = []
+        midline = self.midline
         for line in self.left_column.lines:
-            condition1 = line.width > self.midline
-            condition2 = len(line.tokens) > 4
-            condition3 = line.is_fused
-            if all([condition1, condition2, condition3]):
+            if line.width > midline and len(line.tokens) > 4 and line.is_fused:
                 fused.append(line)
 
         return fused
 
-    def repair_fused_line(self, fused_line):
+    def repair_fused_line(self, fused_line, order=None):
+        """Split fused_line in two: the left line replaces it, and the
+        right line goes in above the line two lines below it (by top),
+        or at the end of its parent if there is none. order is the
+        TopOrder of the page's lines, kept up to date for the next
+        repair; repair_fused_lines() passes one in so that the lines
+        are sorted once for all the repairs of the page."""
+        if order is None:
+            order = TopOrder(self.lines)
         lefty, righty = fused_line.unfuse()
-        # Get an sorted list of the page lines,
-        # ordered by line top. Replace the fused
-        # line with the new left line, and insert
-        # the right line above the line two lines later.
-        sorted_lines = sorted(self.lines, key=lambda line: line.top)
-        idx = sorted_lines.index(fused_line)
-        sorted_lines[idx].parent.replace(fused_line, lefty)
-        try:
-            next_line = sorted_lines[idx+2]
+        idx = order.rank(fused_line)
+        next_line = order.lines[idx+2] if idx + 2 < len(order.lines) else None
+        parent = fused_line.parent
+        last_line = parent.lines[-1] if next_line is None and parent else None
+        parent.replace(fused_line, lefty)
+        order.replace(fused_line, lefty)
+        if next_line is not None:
             if next_line and next_line.parent:
                 next_idx = next_line.parent.index(next_line)
                 next_line.parent.insert(next_idx, righty)
-
-        except IndexError:
+                order.insert_before(next_line, righty)
+        elif parent:
             # the fused line is the last line;
             # just insert the right line after the left
-            if sorted_lines[idx].parent:
-                sorted_lines[idx].parent.append(righty)
+            parent.append(righty)
+            order.insert_after(lefty if last_line is fused_line else last_line, righty)
 
 
 
     def repair_fused_lines(self):
-        for line in self.fused_lines:
-            self.repair_fused_line(line)
+        # repairing is done once; later calls (e.g. from a second xml())
+        # must not split the already repaired lines again
+        if self._repaired:
+            return
+        fused = self.fused_lines
+        if fused:
+            order = TopOrder(self.lines)
+            for line in fused:
+                self.repair_fused_line(line, order)
+        self._repaired = True
 
     @property
     def gutters(self):
@@ -239,11 +260,7 @@ class Page(Span):
         
 
     def detect_title_lines(self, start:int=3, end:int=-20):
-        # centered_lines = [line for line in self.lines[start:end]
-        centered_lines = [line for line in self.lines
-                 if line.bbox.is_horizontally_centered_within(self.print_region, 100)
-                 and str(line).strip().isupper()]
-        return [line for line in centered_lines if line not in self.running_head]
+        return self.layout.title_lines
 
     def cluster_lines(self, lines) -> list:
         clusters = []
@@ -313,14 +330,21 @@ class Page(Span):
                     print(f"\t\t\t\t\t\t\t{line}")
 
 
-    def xml(self, greek_only=True):
+    def xml(self, greek_only=True) -> str:
+        return self.xml_bytes(greek_only).decode('utf-8')
+
+    def xml_bytes(self, greek_only=True) -> bytes:
+        return xml_bytes(self.write_xml, greek_only)
+
+    def write_xml(self, writer:XMLWriter, greek_only=True):
+        """Write the <page> element of this page, with a <column> element
+        for each of its (Greek) columns, to writer."""
         self.repair_fused_lines()
-        with io.StringIO() as buffer:
-            buffer.write(f"<page n='{self.number}' ")
-            if self.running_head:
-                head_txt = ' '.join(str(line) for line in self.running_head)
-                buffer.write(f"running_head='{head_txt.strip()}'")
-            buffer.write(">\n")
+        attrib = {'n': str(self.number)}
+        if self.running_head:
+            attrib['running_head'] = running_head_text(self.running_head)
+        with writer.element('page', attrib):
+            writer.write("\n")
             if greek_only is True:
                 columns = self.greek_columns
             else:
@@ -328,22 +352,25 @@ class Page(Span):
 
             if columns:
                 for column in columns:
-                    buffer.write(f"<column n='{column.number}' side='{column.side}'>")
-                    buffer.write(str(column))
-                    buffer.write("\n</column>\n")
-
-            buffer.write("</page>\n")
-            content = buffer.getvalue()
-        return content
-            
-
-        
+                    with writer.element('column', {'n': str(column.number), 'side': str(column.side)}):
+                        with writer.markup() as sink:
+                            column.write_to(sink)
+                            sink.write("\n")
+                    writer.write("\n")
 
 
 class BlankPage(Page):
     def __init__(self, tree:etree.Element| None, number:int=0):
         if tree is not None:
             super().__init__(tree, number)
+        else:
+            # known to be blank without looking at its hOCR: an empty
+            # page, built without reading or parsing anything
+            Span.__init__(self, None)
+            self.root = None
+            self.number = number
+            self._layout = None
+            self._repaired = False
         self.type = "blank"
 
     # stunt all relevant properties and methods
@@ -0,0 +1,89 @@
+import threading
+from collections import OrderedDict
+
+
+class PageCache:
+    """A least-recently-used cache of pages, shared by the volume classes.
+
+    It holds at most max_entries pages and, if max_weight is given, pages
+    whose total weight(page) is at most max_weight; the default weight
+    is 1 per page. The most recently used page is always kept, even if
+    it alone is over the weight budget. get(), cache[key] = page and
+    values() let it stand in for a dict.
+
+    Every operation takes a lock, so one PageCache can be shared by the
+    threads of a pipeline and by read-ahead threads."""
+    def __init__(self, max_entries:int=32, max_weight:int | None=None, weight=None):
+        self.max_entries = max_entries
+        self.max_weight = max_weight
+        self.weight = weight or (lambda page: 1)
+        self._pages = OrderedDict()
+        self._weights = {}
+        self.total_weight = 0
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.RLock()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return len(self._pages)
+
+    def __contains__(self, key) -> bool:
+        return key in self._pages
+
+    def keys(self):
+        with self._lock:
+            return list(self._pages.keys())
+
+    def values(self):
+        with self._lock:
+            return list(self._pages.values())
+
+    def get(self, key):
+        with self._lock:
+            page = self._pages.get(key)
+            if page is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._pages.move_to_end(key)
+            return page
+
+    def peek(self, key):
+        """The cached page, without counting as a use."""
+        return self._pages.get(key)
+
+    def put(self, key, page):
+        weight = self.weight(page)
+        with self._lock:
+            self.discard(key)
+            self._pages[key] = page
+            self._weights[key] = weight
+            self.total_weight += weight
+            while len(self._pages) > 1 and (
+                    len(self._pages) > self.max_entries
+                    or (self.max_weight is not None and self.total_weight > self.max_weight)):
+                self.discard(next(iter(self._pages)))
+        return page
+
+    __setitem__ = put
+
+    def discard(self, key):
+        with self._lock:
+            if key in self._pages:
+                del self._pages[key]
+                self.total_weight -= self._weights.pop(key)
+
+    def clear(self):
+        with self._lock:
+            self._pages.clear()
+            self._weights.clear()
+            self.total_weight = 0
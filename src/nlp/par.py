@@ -1,8 +1,6 @@
 from nlp.span import Span
 
 class Par(Span):
-    def __str__(self):
-        p = '\n'
-        for o in self.objects:
-            p = p + str(o)
-        return p
+    def write_to(self, sink, plain=False):
+        sink.write('\n')
+        super().write_to(sink, plain)
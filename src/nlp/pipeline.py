@@ -0,0 +1,250 @@
+"""A staged page processing pipeline.
+
+A Pipeline is a list of Stages connected by bounded queues. Each stage
+runs in its own thread and hands its items to the stage's workers: the
+stage thread itself when workers == 1, a thread pool for I/O bound
+stages or a process pool for CPU bound ones. Consecutive stages with a
+single thread worker share one thread, unless they are marked io.
+Items leave every stage in the order they entered it, so a pipeline
+yields its results in input order whatever the concurrency, and the
+bounded queues keep a fast stage from running far ahead of a slow one.
+
+An exception raised by a stage travels down the pipeline in place of
+its item and is raised again by Pipeline.run(), which then stops every
+stage."""
+
+import queue
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from nlp import instrument
+
+
+_DONE = object()
+
+
+class PageJob:
+    """The unit of work of the volume pipelines: a page number, where to
+    read it from, and what each stage has made of it so far."""
+    def __init__(self, number, source=None):
+        self.number = number
+        self.source = source
+        self.data:bytes | None = None
+        self.page = None
+        self.fragment:bytes | None = None
+        # the TokenRows of the fragment, when a token table is written
+        self.tokens = None
+        # name -> [wall, cpu] seconds, while instrumentation is enabled
+        self.timings:dict | None = {} if instrument.enabled() else None
+
+    def __repr__(self):
+        return f"<PageJob {self.number}>"
+
+
+class Stage:
+    """A step of a Pipeline. kind is 'thread' or 'process'; process
+    stages need a picklable fn, and are set up with initializer and
+    initargs like a ProcessPoolExecutor. At most window items (default
+    2 * workers) are in the stage's hands at once. An io stage always
+    has a thread of its own, even with a single worker, so that its
+    waits overlap with the work of the other stages."""
+    def __init__(self, name:str, fn, workers:int=1, kind:str="thread",
+                 initializer=None, initargs=(), window:int | None=None, io:bool=False):
+        if kind not in ("thread", "process"):
+            raise ValueError(f"unknown stage kind {kind!r}")
+        self.name = name
+        self.fn = fn
+        self.workers = workers
+        self.kind = kind
+        self.initializer = initializer
+        self.initargs = initargs
+        self.window = window or 2 * workers
+        self.io = io
+
+    def __repr__(self):
+        return f"<Stage {self.name} {self.kind} x{self.workers}>"
+
+    def executor(self):
+        if self.kind == "process":
+            return ProcessPoolExecutor(max_workers=self.workers, initializer=self.initializer,
+                                       initargs=self.initargs)
+        if self.workers > 1:
+            return ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix=self.name)
+        if self.initializer is not None:
+            self.initializer(*self.initargs)
+        return None
+
+
+class _Chain:
+    """Consecutive single-worker thread stages, run one after the other
+    in one thread: handing items between threads only costs time when
+    neither side waits on I/O."""
+    def __init__(self, fns):
+        self.fns = fns
+
+    def __call__(self, item):
+        for fn in self.fns:
+            item = fn(item)
+        return item
+
+
+def _timed(stage):
+    return Stage(stage.name, instrument.Timed(stage.name, stage.fn), stage.workers, stage.kind,
+                 stage.initializer, stage.initargs, stage.window, stage.io)
+
+
+def _fused(stages):
+    fused = []
+    for stage in stages:
+        serial = (stage.kind == "thread" and stage.workers == 1 and stage.initializer is None
+                  and not stage.io)
+        if serial and fused and isinstance(fused[-1].fn, _Chain):
+            fused[-1].fn.fns.append(stage.fn)
+        elif serial:
+            fused.append(Stage(stage.name, _Chain([stage.fn]), window=stage.window))
+        else:
+            fused.append(stage)
+    return fused
+
+
+class _Failure:
+    def __init__(self, exception):
+        self.exception = exception
+
+
+class _Done:
+    """A finished result, for items the stage did not hand to an executor."""
+    def __init__(self, value):
+        self.value = value
+
+    def done(self):
+        return True
+
+    def result(self):
+        return self.value
+
+
+def _result(future):
+    try:
+        return future.result()
+    except Exception as e:
+        return _Failure(e)
+
+
+def _put(q, item, stop) -> bool:
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            pass
+    return False
+
+
+def _get(q, stop):
+    while not stop.is_set():
+        try:
+            return q.get(timeout=0.1)
+        except queue.Empty:
+            pass
+    return _DONE
+
+
+class Pipeline:
+    def __init__(self, stages:list[Stage], queue_size:int=8):
+        self.stages = stages
+        self.queue_size = queue_size
+
+    def __repr__(self):
+        return " -> ".join(stage.name for stage in self.stages)
+
+    def run(self, items):
+        """Yield the result of passing each of items through every stage, in order."""
+        stop = threading.Event()
+        stages = self.stages
+        if instrument.enabled():
+            stages = [_timed(stage) for stage in stages]
+        stages = _fused(stages)
+        queues = [queue.Queue(maxsize=self.queue_size) for _ in range(len(stages) + 1)]
+        threads = [threading.Thread(target=self._feed, args=(items, queues[0], stop),
+                                    name="pipeline-feed", daemon=True)]
+        for stage, inq, outq in zip(stages, queues, queues[1:]):
+            threads.append(threading.Thread(target=self._run_stage, args=(stage, inq, outq, stop),
+                                            name=f"pipeline-{stage.name}", daemon=True))
+        for thread in threads:
+            thread.start()
+        try:
+            while True:
+                item = queues[-1].get()
+                if item is _DONE:
+                    return
+                if isinstance(item, _Failure):
+                    raise item.exception
+                yield item
+        finally:
+            stop.set()
+            for thread in threads:
+                thread.join()
+
+    @staticmethod
+    def _feed(items, outq, stop):
+        try:
+            for item in items:
+                if not _put(outq, item, stop):
+                    return
+        except Exception as e:
+            _put(outq, _Failure(e), stop)
+        _put(outq, _DONE, stop)
+
+    @staticmethod
+    def _run_stage(stage, inq, outq, stop):
+        try:
+            executor = stage.executor()
+        except Exception as e:
+            _put(outq, _Failure(e), stop)
+            return
+        pending = deque()
+        try:
+            while True:
+                item = _get(inq, stop)
+                if item is _DONE:
+                    break
+                if isinstance(item, _Failure):
+                    pending.append(_Done(item))
+                elif executor is None:
+                    try:
+                        pending.append(_Done(stage.fn(item)))
+                    except Exception as e:
+                        pending.append(_Done(_Failure(e)))
+                else:
+                    pending.append(executor.submit(stage.fn, item))
+                while pending and (len(pending) >= stage.window or pending[0].done()):
+                    if not _put(outq, _result(pending.popleft()), stop):
+                        return
+            while pending:
+                if not _put(outq, _result(pending.popleft()), stop):
+                    return
+            _put(outq, _DONE, stop)
+        finally:
+            if executor is not None:
+                executor.shutdown(cancel_futures=True)
+
+
+# Stages shared by the volume pipelines. A job's page is an nlp Page or
+# anything wrapping one in _nlp_page (pg.PgPage).
+
+def nlp_page(page):
+    return getattr(page, "_nlp_page", page)
+
+def repair_job(job:PageJob) -> PageJob:
+    if job.page is not None:
+        nlp_page(job.page).repair_fused_lines()
+    return job
+
+def classify_job(job:PageJob) -> PageJob:
+    """Work out which columns are Greek (cached in the page's layout)."""
+    if job.page is not None:
+        page = nlp_page(job.page)
+        if page.type == "page":
+            page.layout.greek_sides
+    return job
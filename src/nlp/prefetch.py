@@ -0,0 +1,74 @@
+"""Reading ahead of a loader in background threads.
+
+PgVolume's Loader reads coordOCR files and Epub decompresses archive
+members; both know which ones they will want next, in order, and read
+them ahead with a Prefetcher, so that I/O overlaps with parsing and
+layout analysis."""
+
+from concurrent.futures import ThreadPoolExecutor
+
+
+class Prefetcher:
+    """Calls read(key), which returns bytes or None, in background
+    threads for the keys about to be used.
+
+    prefetch(keys) is given those keys in order; at most window of them
+    are read ahead, and no more reads are started while what has been
+    read ahead and not yet taken adds up to max_bytes or more. Reads of
+    keys that are no longer among the first window are dropped, so that
+    they neither hold memory nor take the place of the ones wanted now.
+
+    A Prefetcher belongs to the thread that loads the items; only read()
+    runs in its background threads."""
+    def __init__(self, read, window:int=0, max_bytes:int | None=None, workers:int=1):
+        self.read = read
+        self.window = window
+        self.max_bytes = max_bytes
+        self.workers = workers
+        self._executor = None
+        self._ahead = {}
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state.update(_executor=None, _ahead={})
+        return state
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(cancel_futures=True)
+            self._executor = None
+        self._ahead = {}
+
+    def take(self, key):
+        """The Future of the read of key, if it was read ahead, or None;
+        it is no longer held by the Prefetcher."""
+        return self._ahead.pop(key, None)
+
+    def submit(self, key):
+        """Start reading key now, whatever the window; returns the Future,
+        which is not held by the Prefetcher."""
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers,
+                                                thread_name_prefix="prefetch")
+        return self._executor.submit(self.read, key)
+
+    def prefetch(self, keys):
+        if self.window <= 0:
+            return
+        window = list(keys)[:self.window]
+        for key in [key for key in self._ahead if key not in window]:
+            self._ahead.pop(key).cancel()
+        for key in window:
+            if self.max_bytes is not None and self.ahead_bytes() >= self.max_bytes:
+                break
+            if key not in self._ahead:
+                self._ahead[key] = self.submit(key)
+
+    def keys(self) -> list:
+        """The keys read, or being read, ahead and not yet taken."""
+        return list(self._ahead)
+
+    def ahead_bytes(self) -> int:
+        """The size of what has been read ahead and not yet taken."""
+        return sum(len(future.result() or b'') for future in self._ahead.values()
+                   if future.done() and not future.cancelled() and future.exception() is None)
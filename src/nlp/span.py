@@ -1,3 +1,4 @@
+import io
 from copy import deepcopy, copy
 from collections import deque
 from lxml import etree
@@ -11,6 +12,12 @@ class Span(LayoutObject):
     def __init__(self, element: etree.Element | None):
         super().__init__(element)
         self.objects:deque = deque()
+        # flattened views of the tree below this span, built on first
+        # access and dropped by invalidate() whenever the tree changes
+        self._tokens = None
+        self._words = None
+        self._lines = None
+        self._blocks = None
         if element is not None:
             children = [child for child in element if child.get('class') is not None]
             for child in children:
@@ -24,62 +31,98 @@ class Span(LayoutObject):
 
 
     def __str__(self):
-        txt = ''
+        with io.StringIO() as buffer:
+            self.write_to(buffer)
+            return buffer.getvalue()
+
+    def write_to(self, sink, plain=False):
+        """Write the text of this span to sink, anything with a
+        write(str) method. The text is markup, as read from the page,
+        unless plain is True (see Token.write_to)."""
         for object in self.objects:
-            txt += str(object)
-        return txt
+            object.write_to(sink, plain)
 
     def __len__(self) -> int:
         return len(self.objects)
     
 
+    @property
+    def bbox(self):
+        # computed on first access after a change, from the boxes of the
+        # first and last objects, so a run of edits costs one BBox
+        if self._bbox is None:
+            objects = self.objects
+            if len(objects) == 0:
+                self._bbox = BBox(0,0,0,0)
+            elif len(objects) == 1:
+                self._bbox = copy(objects[0].bbox)
+            else:
+                first = objects[0]
+                last = objects[-1]
+                self._bbox = BBox(first.left, first.top, last.right, last.bottom)
+        return self._bbox
+
     def reset_bbox(self):
-        if len(self.objects) == 0:
-            self._bbox = BBox(0,0,0,0)
-        elif len(self.objects) == 1:
-            obj = self.objects[0]
-            self._bbox = copy(obj.bbox)
-        else:
-            first = self.objects[0]
-            last = self.objects[-1]
-            self._bbox = BBox(first.left, first.top, last.right, last.bottom)
-            
-    
+        """Recompute the box of this span the next time it is asked for.
+        As before, the boxes of the spans above it are left alone."""
+        self._bbox = None
+
+    def invalidate(self):
+        """Drop the cached token, word, line and block lists of this
+        span and of every span above it. Called by all the methods that
+        change self.objects."""
+        span = self
+        while span is not None:
+            span.drop_caches()
+            span = span.parent
+
+    def drop_caches(self):
+        self._tokens = self._words = self._lines = self._blocks = None
+
+    # The lists returned by tokens, words, lines and blocks are shared
+    # caches: callers must copy them before changing them.
 
     @property
     def tokens(self):
-        token_list = []
-        for obj in self.objects:
-            if isinstance(obj, Token):
-                token_list.append(obj)
-            else:
-                token_list = token_list + obj.tokens
-        return token_list
+        if self._tokens is None:
+            token_list = []
+            for obj in self.objects:
+                if isinstance(obj, Token):
+                    token_list.append(obj)
+                else:
+                    token_list.extend(obj.tokens)
+            self._tokens = token_list
+        return self._tokens
 
     @property
     def words(self):
-        tokens = self.tokens
-        return [tok for tok in tokens if not(tok.is_punct)]
+        if self._words is None:
+            self._words = [tok for tok in self.tokens if not(tok.is_punct)]
+        return self._words
 
     @property
     def lines(self):
-        line_list = []
-        if self.type == 'ocr_line':
-            line_list.append(self)
-        else:
-            for o in self.objects:
-                line_list = line_list + o.lines
-        return line_list
+        if self._lines is None:
+            line_list = []
+            if self.type == 'ocr_line':
+                line_list.append(self)
+            else:
+                for o in self.objects:
+                    line_list.extend(o.lines)
+            self._lines = line_list
+        return self._lines
 
     @property
     def blocks(self):
-        block_list = []
-        if self.type == 'ocrx_block':
-            block_list.append(self)
-        else:
-            for o in self.objects:
-                block_list = block_list + o.blocks
-        return block_list
+        if self._blocks is None:
+            block_list = []
+            if self.type == 'ocrx_block':
+                block_list.append(self)
+            else:
+                for o in self.objects:
+                    block_list.extend(o.blocks)
+            self._blocks = block_list
+        return self._blocks
         
     
 
@@ -87,17 +130,20 @@ class Span(LayoutObject):
         object.parent = self
         self.objects.append(object)
         self.reset_bbox()
+        self.invalidate()
             
 
     def prepend(self, object:LayoutObject):
         object.parent = self
         self.objects.appendleft(object)
         self.reset_bbox()
+        self.invalidate()
 
     def pop(self):
         if len(self.objects) > 0:
             object = self.objects.pop()
             self.reset_bbox()
+            self.invalidate()
             object.parent = None
             return object
             
@@ -105,6 +151,7 @@ class Span(LayoutObject):
         if len(self.objects) > 0:
             object = self.objects.popleft()
             self.reset_bbox()
+            self.invalidate()
             object.parent = None
             return object
 
@@ -119,6 +166,7 @@ class Span(LayoutObject):
     def clear(self):
         self.objects.clear()
         self.reset_bbox()
+        self.invalidate()
 
     def index(self, x):
         return self.objects.index(x)
@@ -126,22 +174,53 @@ class Span(LayoutObject):
     def insert(self, i, x):
         self.objects.insert(i, x)
         self.reset_bbox()
+        self.invalidate()
 
     def remove(self, x):
         self.objects.remove(x)
         self.reset_bbox()
+        self.invalidate()
 
     def replace(self, a, b):
-        idx = self.objects.index(a)
-        self.objects.remove(a)
-        self.objects.insert(idx, b)
+        self.objects[self.objects.index(a)] = b
         self.reset_bbox()
-    
-        
+        self.invalidate()
+
+    # Bulk edits: one pass over self.objects and one invalidate() for
+    # any number of objects, where a loop of pop()s and append()s pays
+    # for each object.
+
+    def extend(self, objects):
+        """append() each of objects."""
+        objects = list(objects)
+        for object in objects:
+            object.parent = self
+        self.objects.extend(objects)
+        self.reset_bbox()
+        self.invalidate()
+
+    def splice(self, i:int, j:int, objects=()) -> list:
+        """Replace self.objects[i:j] with objects, like list slice
+        assignment, and return the objects taken out. The new objects
+        get this span as their parent; the old ones lose it, as with
+        pop()."""
+        old = list(self.objects)
+        removed = old[i:j]
+        new = list(objects)
+        old[i:j] = new
+        self.objects = deque(old)
+        for object in removed:
+            object.parent = None
+        for object in new:
+            object.parent = self
+        self.reset_bbox()
+        self.invalidate()
+        return removed
+
     @property
     def percent_greek(self):
-        if len(self.words) == 0:
+        words = self.words
+        if len(words) == 0:
             return 0
         else:
-            greek_words = [word for word in self.words if word.is_greek]
-            return round(100 * (len(greek_words) / len(self.words)))
+            return round(100 * (sum(word.is_greek for word in words) / len(words)))
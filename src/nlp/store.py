@@ -0,0 +1,528 @@
+"""Array-backed pages.
+
+A CompactPage keeps the tokens and lines of a page in the flat arrays of
+a PageStore instead of a tree of Span objects, and answers the layout
+questions the volume writers ask with passes over those arrays. It is
+several times smaller and quicker to build than a Page, but it cannot
+be edited: PgVolume(compact_pages=True) builds one for every page
+without fused lines, and a Page, which can be repaired, for the others
+(see pg.Loader.build_page)."""
+
+import re
+from array import array
+from itertools import compress
+from xml.sax.saxutils import unescape
+from lxml import etree
+from nlp.bbox import BBox
+from nlp.column import Column
+from nlp.layout_object import bbox_values
+from nlp.page import ocr_page
+from nlp.token import clean_text, classify_greek, is_punct_text
+
+
+class PageStore:
+    """The tokens and lines of a page in flat arrays.
+
+    Token i's text is text[text_start[i]:text_end[i]] and its tail is
+    text[text_end[i]:tail_end[i]], so a whole line is one slice of the
+    page's text buffer. Geometry, line membership and the Greek and
+    punctuation flags are integer arrays indexed by token or line.
+
+    The store is built straight from the hOCR tree and follows the
+    same rules as the Span tree: only elements with a class count,
+    blocks contribute only the lines of their paragraphs, and a span's
+    bbox is taken from its first and last children."""
+    def __init__(self, root:etree.Element):
+        self.text_start = array('l')
+        self.text_end = array('l')
+        self.tail_end = array('l')
+        self.token_left = array('l')
+        self.token_top = array('l')
+        self.token_right = array('l')
+        self.token_bottom = array('l')
+        self.token_line = array('l')
+        self.punct = array('b')
+
+        self.line_first = array('l')
+        self.line_last = array('l')
+        self.line_left = array('l')
+        self.line_top = array('l')
+        self.line_right = array('l')
+        self.line_bottom = array('l')
+
+        self._pieces = []
+        self._length = 0
+        self.bbox = self._walk(root, record=True, line=-1)
+        self.text = ''.join(self._pieces)
+        del self._pieces
+        self.greek = array('b', classify_greek([self.text[start:end] for start, end
+                                                in zip(self.text_start, self.text_end)]))
+
+    def __len__(self) -> int:
+        return len(self.text_start)
+
+    @property
+    def line_count(self) -> int:
+        return len(self.line_first)
+
+    def _add_token(self, element, line):
+        text = clean_text(element.text or '')
+        tail = element.tail or ''
+        left, top, right, bottom = bbox_values(element)
+        self.text_start.append(self._length)
+        self.text_end.append(self._length + len(text))
+        self.tail_end.append(self._length + len(text) + len(tail))
+        self._pieces.append(text)
+        self._pieces.append(tail)
+        self._length += len(text) + len(tail)
+        self.token_left.append(left)
+        self.token_top.append(top)
+        self.token_right.append(right)
+        self.token_bottom.append(bottom)
+        self.token_line.append(line)
+        self.punct.append(is_punct_text(text))
+        return (left, top, right, bottom)
+
+    def _walk(self, element, record, line):
+        """Record the tokens and lines below element and return its bbox."""
+        cls = (element.get('class') or '').strip()
+        if 'ocrx_word' in cls and 'ocr_line' not in cls and 'ocr_page' not in cls \
+           and 'ocrx_block' not in cls and 'ocr_par' not in cls:
+            if record:
+                return self._add_token(element, line)
+            return tuple(bbox_values(element))
+
+        new_line = record and 'ocr_line' in cls and line < 0
+        if new_line:
+            line = len(self.line_first)
+            self.line_first.append(len(self.text_start))
+            for values in (self.line_last, self.line_left, self.line_top,
+                           self.line_right, self.line_bottom):
+                values.append(0)
+
+        in_block = 'ocrx_block' in cls and 'ocr_line' not in cls and 'ocr_page' not in cls
+        boxes = []
+        for child in element:
+            if child.get('class') is None:
+                continue
+            child_record = record and (not in_block or child.get('class') == 'ocr_par')
+            boxes.append(self._walk(child, child_record, line))
+
+        if len(boxes) == 0:
+            bbox = (0, 0, 0, 0)
+        elif len(boxes) == 1:
+            bbox = boxes[0]
+        else:
+            bbox = (boxes[0][0], boxes[0][1], boxes[-1][2], boxes[-1][3])
+
+        if new_line:
+            self.line_last[line] = len(self.text_start)
+            self.line_left[line], self.line_top[line], self.line_right[line], self.line_bottom[line] = bbox
+        return bbox
+
+    def greek_fraction(self, token_indexes) -> float:
+        """Fraction of the given tokens that are Greek (cf. utils.percent_greek)."""
+        count = len(token_indexes)
+        if count == 0:
+            return 0
+        greek = self.greek
+        return sum(greek[i] for i in token_indexes) / count
+
+
+class TokenView:
+    """A Token-like view of one token of a PageStore."""
+    __slots__ = ('store', 'index')
+    type = 'token'
+
+    def __init__(self, store:PageStore, index:int):
+        self.store = store
+        self.index = index
+
+    def __repr__(self) -> str:
+        return f"Token({self.text!r})"
+
+    def __str__(self) -> str:
+        return self.text_with_ws
+
+    def write_to(self, sink, plain=False):
+        if plain:
+            sink.write(unescape(self.text))
+            if tail := self.tail:
+                sink.write(tail)
+        else:
+            sink.write(self.text_with_ws)
+
+    def __len__(self) -> int:
+        return len(self.text_with_ws)
+
+    @property
+    def tokens(self):
+        return [self]
+
+    @property
+    def text(self) -> str:
+        store = self.store
+        return store.text[store.text_start[self.index]:store.text_end[self.index]]
+
+    @property
+    def tail(self):
+        store = self.store
+        return store.text[store.text_end[self.index]:store.tail_end[self.index]] or None
+
+    @property
+    def text_with_ws(self) -> str:
+        store = self.store
+        return store.text[store.text_start[self.index]:store.tail_end[self.index]]
+
+    @property
+    def bbox(self):
+        store, i = self.store, self.index
+        return BBox(store.token_left[i], store.token_top[i], store.token_right[i], store.token_bottom[i])
+
+    @property
+    def left(self):
+        return self.store.token_left[self.index]
+
+    @property
+    def top(self):
+        return self.store.token_top[self.index]
+
+    @property
+    def right(self):
+        return self.store.token_right[self.index]
+
+    @property
+    def bottom(self):
+        return self.store.token_bottom[self.index]
+
+    @property
+    def width(self):
+        return self.right - self.left
+
+    @property
+    def height(self):
+        return self.bottom - self.top
+
+    @property
+    def is_greek(self) -> bool:
+        return bool(self.store.greek[self.index])
+
+    @property
+    def is_punct(self) -> bool:
+        return bool(self.store.punct[self.index])
+
+
+class LineView:
+    """A Line-like view of one line of a PageStore."""
+    __slots__ = ('store', 'index')
+    type = 'ocr_line'
+
+    def __init__(self, store:PageStore, index:int):
+        self.store = store
+        self.index = index
+
+    def __repr__(self):
+        return f"|{self}|"
+
+    def __str__(self):
+        store, i = self.store, self.index
+        first, last = store.line_first[i], store.line_last[i]
+        if first == last:
+            return ''
+        return store.text[store.text_start[first]:store.tail_end[last - 1]]
+
+    def write_to(self, sink, plain=False):
+        """Like Line.write_to: the line's markup is one slice of the
+        store's text."""
+        if plain:
+            for token in self.tokens:
+                token.write_to(sink, plain)
+        else:
+            sink.write(str(self))
+
+    def __len__(self) -> int:
+        return self.store.line_last[self.index] - self.store.line_first[self.index]
+
+    @property
+    def token_indexes(self) -> range:
+        return range(self.store.line_first[self.index], self.store.line_last[self.index])
+
+    @property
+    def word_indexes(self) -> list[int]:
+        punct = self.store.punct
+        return [i for i in self.token_indexes if not punct[i]]
+
+    @property
+    def tokens(self):
+        return [TokenView(self.store, i) for i in self.token_indexes]
+
+    @property
+    def words(self):
+        return [TokenView(self.store, i) for i in self.word_indexes]
+
+    @property
+    def lines(self):
+        return [self]
+
+    @property
+    def length(self) -> int:
+        return len(self)
+
+    @property
+    def bbox(self):
+        store, i = self.store, self.index
+        return BBox(store.line_left[i], store.line_top[i], store.line_right[i], store.line_bottom[i])
+
+    @property
+    def left(self):
+        return self.store.line_left[self.index]
+
+    @property
+    def top(self):
+        return self.store.line_top[self.index]
+
+    @property
+    def right(self):
+        return self.store.line_right[self.index]
+
+    @property
+    def bottom(self):
+        return self.store.line_bottom[self.index]
+
+    @property
+    def width(self):
+        return self.right - self.left
+
+    @property
+    def height(self):
+        return self.bottom - self.top
+
+    @property
+    def percent_greek(self):
+        words = self.word_indexes
+        if len(words) == 0:
+            return 0
+        return round(100 * self.store.greek_fraction(words))
+
+    @property
+    def starts_greek(self) -> bool:
+        words = self.word_indexes
+        return self.store.greek_fraction(words[0:int(len(words) / 2)]) > .5
+
+    @property
+    def ends_greek(self) -> bool:
+        words = self.word_indexes
+        return self.store.greek_fraction(words[int(len(words) / 2):]) > .5
+
+    @property
+    def is_fused(self) -> bool:
+        starts_greek = self.starts_greek
+        ends_greek = self.ends_greek
+        return starts_greek != ends_greek
+
+
+class CompactPage:
+    """A read-only page backed by a PageStore.
+
+    It answers the same layout questions as Page (print region, aligned
+    lines, columns, Greek columns, running head, fused lines) with passes
+    over the store's arrays, and hands out TokenView and LineView objects
+    instead of a tree of Token and Line objects. The answers are kept, as
+    the page never changes. It is its own layout: page.layout.greek_sides
+    works as it does for a Page.
+
+    It cannot repair fused lines, so repair_fused_lines() raises
+    ValueError on a page that has any."""
+    def __init__(self, tree:etree.Element, number:int=0):
+        self.store = PageStore(ocr_page(tree))
+        self.number = number
+        self.type = "page"
+        self._lines = None
+        self._print_region = None
+        self._left = {}
+        self._right = {}
+        self._greek_sides = None
+        self._fused_lines = None
+
+    def __len__(self) -> int:
+        return self.store.line_count
+
+    def __str__(self):
+        return self.store.text
+
+    @property
+    def bbox(self):
+        return BBox(*self.store.bbox)
+
+    @property
+    def left(self):
+        return self.store.bbox[0]
+
+    @property
+    def top(self):
+        return self.store.bbox[1]
+
+    @property
+    def right(self):
+        return self.store.bbox[2]
+
+    @property
+    def bottom(self):
+        return self.store.bbox[3]
+
+    @property
+    def width(self):
+        return self.right - self.left
+
+    @property
+    def height(self):
+        return self.bottom - self.top
+
+    @property
+    def lines(self):
+        if self._lines is None:
+            self._lines = [LineView(self.store, i) for i in range(self.store.line_count)]
+        return self._lines
+
+    @property
+    def tokens(self):
+        return [TokenView(self.store, i) for i in range(len(self.store))]
+
+    @property
+    def words(self):
+        punct = self.store.punct
+        return [TokenView(self.store, i) for i in range(len(self.store)) if not punct[i]]
+
+    @property
+    def margins(self):
+        store = self.store
+        if store.line_count:
+            return (self.left + min(store.line_left), self.right - max(store.line_right),
+                    self.top + min(store.line_top), self.bottom - max(store.line_bottom))
+        return (self.left, self.right, self.top, self.bottom)
+
+    @property
+    def print_region(self):
+        if self._print_region is None:
+            margin_left, margin_right, margin_top, margin_bottom = self.margins
+            self._print_region = BBox(self.left + margin_left,
+                                      self.top + margin_top,
+                                      self.right - margin_right,
+                                      self.bottom - margin_bottom)
+        return self._print_region
+
+    @property
+    def midline(self):
+        return self.print_region.width / 2
+
+    def left_line_indexes(self, tolerance=30):
+        if tolerance not in self._left:
+            limit = self.print_region.left + tolerance
+            self._left[tolerance] = list(compress(range(self.store.line_count),
+                                                  map(limit.__ge__, self.store.line_left)))
+        return self._left[tolerance]
+
+    def right_line_indexes(self, tolerance=10):
+        if tolerance not in self._right:
+            region_right = self.print_region.right
+            low, high = region_right - tolerance, region_right + tolerance
+            self._right[tolerance] = [i for i, right in enumerate(self.store.line_right)
+                                      if low <= right <= high]
+        return self._right[tolerance]
+
+    def left_lines(self, tolerance=30):
+        lines = self.lines
+        return [lines[i] for i in self.left_line_indexes(tolerance)]
+
+    def right_lines(self, tolerance=10):
+        lines = self.lines
+        return [lines[i] for i in self.right_line_indexes(tolerance)]
+
+    @property
+    def column_numbers(self):
+        col_nums = {}
+        if self.store.line_count > 1:
+            nums_left = re.findall(r"\d+", str(self.lines[0]).strip())
+            nums_right = re.findall(r"\d+", str(self.lines[1]).strip())
+            if nums_left:
+                col_nums['left'] = nums_left[0]
+                if nums_right:
+                    col_nums['right'] = nums_right[0]
+        return col_nums
+
+    @property
+    def left_column(self):
+        return Column(self.left_lines(tolerance=50), 'left', self.column_numbers.get('left'))
+
+    @property
+    def right_column(self):
+        return Column(self.right_lines(tolerance=50), 'right', self.column_numbers.get('right'))
+
+    @property
+    def columns(self):
+        return self.left_column, self.right_column
+
+    def _is_greek_column(self, line_indexes) -> bool:
+        store = self.store
+        tokens = [i for line in line_indexes
+                  for i in range(store.line_first[line], store.line_last[line])]
+        return store.greek_fraction(tokens) > .5
+
+    @property
+    def layout(self):
+        return self
+
+    def drop_caches(self):
+        """Forget the answers kept so far, as Page.drop_caches does; they
+        are recomputed when next asked for."""
+        self._lines = None
+        self._print_region = None
+        self._left = {}
+        self._right = {}
+        self._greek_sides = None
+        self._fused_lines = None
+
+    @property
+    def greek_sides(self):
+        """The sides ('left', 'right') whose columns are mostly Greek."""
+        if self._greek_sides is None:
+            self._greek_sides = [side for side, lines in
+                                 (('left', self.left_line_indexes(tolerance=50)),
+                                  ('right', self.right_line_indexes(tolerance=50)))
+                                 if lines and self._is_greek_column(lines)]
+        return self._greek_sides
+
+    @property
+    def greek_columns(self):
+        columns = []
+        if 'left' in self.greek_sides:
+            columns.append(self.left_column)
+        if 'right' in self.greek_sides:
+            columns.append(self.right_column)
+        return columns
+
+    @property
+    def fused_lines(self):
+        """The lines Page.fused_lines would repair: long lines of the
+        left column that start in one script and end in the other."""
+        if self._fused_lines is None:
+            store, midline = self.store, self.midline
+            lines = self.lines
+            self._fused_lines = [lines[i] for i in self.left_line_indexes(tolerance=50)
+                                 if store.line_right[i] - store.line_left[i] > midline
+                                 and store.line_last[i] - store.line_first[i] > 4
+                                 and lines[i].is_fused]
+        return self._fused_lines
+
+    def repair_fused_lines(self):
+        if self.fused_lines:
+            raise ValueError(f"page {self.number} has fused lines, which a CompactPage cannot repair")
+
+    @property
+    def running_head(self):
+        store = self.store
+        ptop = self.print_region.top
+        header_line_height = 35
+        lines = self.lines
+        return [lines[i] for i, top in enumerate(store.line_top)
+                if top == ptop and store.line_bottom[i] - top <= header_line_height]
@@ -1,4 +1,6 @@
+import re
 import unicodedata
+from xml.sax.saxutils import unescape
 from lxml import etree
 from nlp.layout_object import LayoutObject
 
@@ -8,6 +10,8 @@ class Token(LayoutObject):
         self.text = self.clean_text(element.text)
         self.tail = element.tail
         self.type = "token"
+        # script flag, classified on first use or by label_greek()
+        self._is_greek = None
 
 
     def __repr__(self) -> str:
@@ -16,6 +20,13 @@ class Token(LayoutObject):
     def __str__(self) -> str:
         return self.text_with_ws
 
+    def write_to(self, sink, plain=False):
+        """Write text_with_ws to sink; with plain, the text is unescaped
+        first (clean_text escapes &, < and >)."""
+        sink.write(unescape(self.text) if plain else self.text)
+        if self.tail:
+            sink.write(self.tail)
+
     def __len__(self) -> int:
         return len(self.text_with_ws)
 
@@ -33,20 +44,9 @@ class Token(LayoutObject):
 
     @property
     def is_greek(self) -> bool:
-        greek_count = 0
-        alpha_count = 0
-        threshold:float = 0.5
-        for char in self.text:
-            alpha_count += 1
-            codepoint = ord(char)
-                # is it in the Greek and Coptic code block or the Extended Greek code block?
-            if (0x0370 <= codepoint <= 0x03FF) or (0x1F00 <= codepoint <= 0x1FFF):
-                greek_count += 1
-                
-        if alpha_count == 0:
-                return False  # No letters at all
-                
-        return (greek_count / alpha_count) >= threshold
+        if self._is_greek is None:
+            self._is_greek = is_greek_text(self.text)
+        return self._is_greek
 
 
     @property
@@ -54,15 +54,69 @@ class Token(LayoutObject):
         """
         Returns True if the character is punctuation based on Unicode category.
         """
-        if len(self.text) != 1:
-            return False
-        return unicodedata.category(self.text).startswith('P')
+        return is_punct_text(self.text)
 
         
     def clean_text(self,text):
-        # Replace bad entities (example: replace &shy; with actual soft hyphen)
-        text = text.replace("&shy;", "\u00AD")
-        text = text.replace("&", "&amp;")
-        text = text.replace("<", "&lt;")
-        text = text.replace(">", "&gt;")
-        return text
+        return clean_text(text)
+
+
+def clean_text(text):
+    # Replace bad entities (example: replace &shy; with actual soft hyphen)
+    text = text.replace("&shy;", "\u00AD")
+    text = text.replace("&", "&amp;")
+    text = text.replace("<", "&lt;")
+    text = text.replace(">", "&gt;")
+    return text
+
+
+def is_greek_text(text:str) -> bool:
+    greek_count = 0
+    alpha_count = 0
+    threshold:float = 0.5
+    for char in text:
+        alpha_count += 1
+        codepoint = ord(char)
+        # is it in the Greek and Coptic code block or the Extended Greek code block?
+        if (0x0370 <= codepoint <= 0x03FF) or (0x1F00 <= codepoint <= 0x1FFF):
+            greek_count += 1
+
+    if alpha_count == 0:
+        return False  # No letters at all
+
+    return (greek_count / alpha_count) >= threshold
+
+
+# everything that is neither Greek (Greek and Coptic, Greek Extended)
+# nor the separator used by classify_greek
+NON_GREEK = re.compile('[^\u0370-\u03FF\u1F00-\u1FFF\x1f]+')
+
+
+def classify_greek(texts:list[str]) -> list[bool]:
+    """is_greek_text for many strings at once.
+
+    The texts are joined with a separator, every non-Greek character is
+    removed with one regex pass, and the Greek character count of each
+    text is the length of its piece of the result."""
+    joined = '\x1f'.join(texts)
+    if joined.count('\x1f') != len(texts) - 1:
+        # a text contains the separator itself
+        return [is_greek_text(text) for text in texts]
+    greek_counts = map(len, NON_GREEK.sub('', joined).split('\x1f'))
+    return [len(text) > 0 and 2 * greek >= len(text)
+            for text, greek in zip(texts, greek_counts)]
+
+
+def label_greek(tokens:list[Token]):
+    """Classify the tokens that have not been classified yet in one batch."""
+    pending = [token for token in tokens if token._is_greek is None]
+    if pending:
+        flags = classify_greek([token.text for token in pending])
+        for token, flag in zip(pending, flags):
+            token._is_greek = flag
+
+
+def is_punct_text(text:str) -> bool:
+    if len(text) != 1:
+        return False
+    return unicodedata.category(text).startswith('P')
@@ -0,0 +1,197 @@
+"""Token tables: the tokens of a volume as columns of a binary file.
+
+PgVolume.serialize(..., tokens=True) writes <barcode>.tokens next to
+<barcode>.xml, from the same pass over the pages. It has one row per
+token of the columns written to the XML, in the same order:
+
+    page      physical page number
+    column    column number (the n of the <column>), -1 if it has none
+    side      0 for left, 1 for right, -1 if unknown
+    line      index of the token's line in its column
+    left, top, right, bottom
+    is_greek  0 or 1
+    text      the token's text (unescaped, without its tail)
+
+The file starts with MAGIC, the length of a JSON header as a 4-byte
+little-endian integer, and the header, which gives the number of rows
+and the type and file offset of each column. Columns are little-endian
+arrays aligned on 8 bytes; text is a UTF-8 buffer, token i being
+text[text_end[i-1]:text_end[i]]. TokenTable maps the file and reads the
+columns in place; with NumPy, numpy.memmap(path, dtype=column["type"],
+mode="r", offset=column["offset"], shape=(rows,)) does the same."""
+
+import json
+import mmap
+import sys
+from array import array
+from pathlib import Path
+from xml.sax.saxutils import unescape
+
+
+MAGIC = b"PGTOKENS"
+TABLE_VERSION = 1
+SIDES = {'left': 0, 'right': 1}
+
+# name -> array typecode; the header gives them as NumPy dtypes
+FIELDS = {
+    "page": 'i', "column": 'i', "side": 'b', "line": 'i',
+    "left": 'i', "top": 'i', "right": 'i', "bottom": 'i',
+    "is_greek": 'b',
+}
+DTYPES = {'i': '<i4', 'b': '|i1', 'q': '<i8'}
+
+
+def _number(n) -> int:
+    try:
+        return int(n)
+    except (TypeError, ValueError):
+        return -1
+
+
+def _little_endian(values:array) -> bytes:
+    if sys.byteorder == 'big' and values.itemsize > 1:
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+
+
+class TokenRows:
+    """Token rows being collected, page by page. Small enough to pickle
+    back from page worker processes."""
+    def __init__(self):
+        self.columns = {name: array(code) for name, code in FIELDS.items()}
+        self.text_end = array('q')
+        self.text = bytearray()
+
+    def __len__(self) -> int:
+        return len(self.text_end)
+
+    def add_column(self, page, number, side, column):
+        """Add a row for each token of column, a Column of the page."""
+        columns = self.columns
+        page = _number(page)
+        number = _number(number)
+        side = SIDES.get(side, -1)
+        text = self.text
+        for line_index, line in enumerate(column.lines):
+            for token in line.tokens:
+                bbox = token.bbox
+                columns["page"].append(page)
+                columns["column"].append(number)
+                columns["side"].append(side)
+                columns["line"].append(line_index)
+                columns["left"].append(bbox.left)
+                columns["top"].append(bbox.top)
+                columns["right"].append(bbox.right)
+                columns["bottom"].append(bbox.bottom)
+                columns["is_greek"].append(bool(token.is_greek))
+                text += unescape(token.text).encode('utf-8')
+                self.text_end.append(len(text))
+
+    def extend(self, other:"TokenRows"):
+        for name, values in self.columns.items():
+            values.extend(other.columns[name])
+        base = len(self.text)
+        self.text_end.extend(array('q', (end + base for end in other.text_end)))
+        self.text += other.text
+
+    def write(self, path:Path, volume:str):
+        """Write the rows to path as a token table of volume."""
+        blocks = [(name, _little_endian(values)) for name, values in self.columns.items()]
+        blocks.append(("text_end", _little_endian(self.text_end)))
+        header = {"version": TABLE_VERSION, "volume": volume, "rows": len(self),
+                  "sides": list(SIDES)}
+        # the data starts after the header, whose length depends on the
+        # offsets it gives: grow the start until the header fits
+        start = 0
+        while True:
+            header = self._header(header, blocks, start)
+            encoded = json.dumps(header).encode('utf-8')
+            end = _align(len(MAGIC) + 4 + len(encoded))
+            if end <= start:
+                break
+            start = end
+        with open(path, 'wb') as f:
+            f.write(MAGIC)
+            f.write(len(encoded).to_bytes(4, 'little'))
+            f.write(encoded)
+            for name, data in blocks:
+                f.write(b"\0" * (header["columns"][name]["offset"] - f.tell()))
+                f.write(data)
+            f.write(b"\0" * (header["text"]["offset"] - f.tell()))
+            f.write(self.text)
+
+    def _header(self, header, blocks, offset):
+        header = dict(header, columns={})
+        typecodes = dict(FIELDS, text_end='q')
+        for name, data in blocks:
+            header["columns"][name] = {"type": DTYPES[typecodes[name]], "offset": offset}
+            offset = _align(offset + len(data))
+        header["text"] = {"offset": offset, "length": len(self.text)}
+        return header
+
+
+def _align(n:int) -> int:
+    return (n + 7) & ~7
+
+
+class TokenTable:
+    """A token table file, memory-mapped. column(name) is a memoryview
+    of the column in the file (on little-endian machines); release the
+    views before close()."""
+    def __init__(self, path:Path):
+        self.path = Path(path)
+        with open(self.path, 'rb') as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.buffer = memoryview(self._map)
+        self._columns = {}
+        if bytes(self.buffer[:len(MAGIC)]) != MAGIC:
+            self.close()
+            raise ValueError(f"{path} is not a token table")
+        length = int.from_bytes(self.buffer[len(MAGIC):len(MAGIC) + 4], 'little')
+        self.header = json.loads(bytes(self.buffer[len(MAGIC) + 4:len(MAGIC) + 4 + length]))
+        self.volume = self.header["volume"]
+        self.rows = self.header["rows"]
+        self._text_end = self.column("text_end")
+
+    def __len__(self) -> int:
+        return self.rows
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+    def column(self, name:str) -> memoryview:
+        if name not in self._columns:
+            spec = self.header["columns"][name]
+            typecode = {dtype: code for code, dtype in DTYPES.items()}[spec["type"]]
+            size = array(typecode).itemsize
+            offset = spec["offset"]
+            self._columns[name] = self.buffer[offset:offset + self.rows * size].cast(typecode)
+        return self._columns[name]
+
+    def text(self, i:int) -> str:
+        start = self._text_end[i - 1] if i else 0
+        offset = self.header["text"]["offset"]
+        return str(self.buffer[offset + start:offset + self._text_end[i]], 'utf-8')
+
+    def __iter__(self):
+        """Each row as a dict."""
+        columns = {name: self.column(name) for name in FIELDS}
+        sides = self.header["sides"]
+        for i in range(self.rows):
+            row = {name: values[i] for name, values in columns.items()}
+            row["side"] = sides[row["side"]] if row["side"] >= 0 else None
+            row["is_greek"] = bool(row["is_greek"])
+            row["text"] = self.text(i)
+            yield row
+
+    def close(self):
+        for view in self._columns.values():
+            view.release()
+        self._columns = {}
+        self.buffer.release()
+        self._map.close()
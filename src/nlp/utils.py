@@ -43,31 +43,14 @@ def percent_greek(tok_list):
     if len(tok_list) == 0:
         return 0
     else:
-        tok_count = 0
-        greek_count = 0
-        for tok in tok_list:
-            tok_count +=1
-            if tok.is_greek:
-                greek_count += 1
-        return greek_count / tok_count
+        return sum(tok.is_greek for tok in tok_list) / len(tok_list)
     
 
 
-def fix_entities(xml_string:str) -> str:
-    # Remove XML declaration to avoid ValueError
-    xml_string = re.sub(r'<\?xml.*?\?>', '', xml_string, flags=re.DOTALL)
-    # Replace bad entities (example: replace &shy; with actual soft hyphen)
-    xml_string = xml_string.replace("&shy;", "\u00AD")
-    xml_string = xml_string.replace("&quot;", "\u0022")
-    return xml_string
-        
 
 def load_page_file(page_file:Path):
-    with page_file.open('r') as pf:
-        raw_data = pf.read()
-        clean_data = fix_entities(raw_data)
-        tree = etree.fromstring(clean_data)
-    return tree
+    from nlp.ingest import parse_file
+    return parse_file(page_file)
 
 
 def report(lines):
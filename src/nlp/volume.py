@@ -1,52 +1,127 @@
 import io
-import re
+import os
+import threading
+from functools import partial
 from zipfile import ZipFile
-import io
 from pathlib import Path
 from lxml import etree
-from nlp.page import Page
+from nlp.page import Page, ocr_page, is_empty
+from nlp.page_cache import PageCache
+from nlp.prefetch import Prefetcher
+from nlp.pipeline import Pipeline, Stage, PageJob, repair_job, classify_job
+from nlp.writer import write_volume, replacing
+from nlp import ingest, instrument
 
 
-def fix_entities(xml_string:str) -> str:
-    # Remove XML declaration to avoid ValueError
-    xml_string = re.sub(r'<\?xml.*?\?>', '', xml_string, flags=re.DOTALL)
-    # Replace bad entities (example: replace &shy; with actual soft hyphen)
-    xml_string = xml_string.replace("&shy;", "\u00AD")
-    xml_string = xml_string.replace("&quot;", "\u0022")
-    return xml_string
 
 
 class Epub:
-    def __init__(self, zipfile_path:str) -> None:
+    """An EPUB archive. The archive is opened once per process (and
+    reopened after a fork) and its members are read as bytes under a lock,
+    so one Epub can be shared by threads. With read_ahead > 0, prefetch()
+    decompresses members in a background thread ahead of get_member()."""
+    def __init__(self, zipfile_path:str, read_ahead:int=0) -> None:
         self.zipfile = Path(zipfile_path)
-        with ZipFile(self.zipfile, mode='r') as archive:
-            self.names = archive.namelist()
-            self.infos = archive.infolist()
+        self._archive = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._prefetcher = Prefetcher(self._read_locked, read_ahead)
+        self.names = self.archive.namelist()
+        self.infos = self.archive.infolist()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state.update(_archive=None, _pid=None, _lock=None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @property
+    def read_ahead(self) -> int:
+        return self._prefetcher.window
+
+    @property
+    def archive(self) -> ZipFile:
+        if self._archive is None or self._pid != os.getpid():
+            self._archive = ZipFile(self.zipfile, mode='r')
+            self._pid = os.getpid()
+        return self._archive
+
+    def close(self):
+        self._prefetcher.close()
+        if self._archive is not None and self._pid == os.getpid():
+            self._archive.close()
+        self._archive = None
+
+    def read(self, fname) -> bytes:
+        """The decompressed bytes of a member."""
+        future = self._prefetcher.take(fname)
+        if future is not None:
+            return future.result()
+        return self._read_locked(fname)
+
+    def prefetch(self, fnames):
+        """Start decompressing the given members, the ones about to be
+        read, in order; see nlp.prefetch.Prefetcher."""
+        self._prefetcher.prefetch(fnames)
+
+    def _read_locked(self, fname):
+        with self._lock:
+            return self.archive.read(fname)
 
     def get_member(self, fname, format='xml'):
-        with ZipFile(self.zipfile, mode='r') as archive:
-            with archive.open(fname, mode='r') as binary_file:
-                with io.TextIOWrapper(binary_file, encoding='utf-8') as text_file:
-                    string = text_file.read()
-            if format == 'xml':
-                clean_data = fix_entities(string)
-                return etree.fromstring(clean_data)
-            else:
-                return string
+        data = self.read(fname)
+        if format == 'xml':
+            return ingest.parse(data)
+        else:
+            return data.decode('utf-8')
 
 
 class Volume:
+    """A volume and its <volume> document. Subclasses give its barcode
+    and page_fragments(greek_only, jobs), the encoded <page> fragments
+    of its pages, in order."""
     def __init__(self):
         self._page_list = None
         self._xml = None
+
+    def write(self, f, greek_only=True, jobs=None, fragments=None):
+        """Stream the <volume> document to the binary file f,
+        one page fragment at a time. fragments, if given, replaces the
+        freshly built page fragments (see incremental.py)."""
+        if fragments is None:
+            fragments = self.page_fragments(greek_only=greek_only, jobs=jobs)
+        write_volume(f, self.barcode, fragments)
+
+    def xml(self, greek_only=True, jobs=None) -> str:
+        """The whole <volume> document as a string. It is built in
+        memory and cached, so prefer serialize() for large volumes."""
+        if self._xml is None:
+            with io.BytesIO() as buffer:
+                self.write(buffer, greek_only=greek_only, jobs=jobs)
+                self._xml = buffer.getvalue().decode('utf-8')
+        return self._xml
         
 
 class EPubVolume(Volume):
-    def __init__(self, epub_file_path):
+    def __init__(self, epub_file_path, read_ahead:int=0, page_cache:PageCache | None=None):
         super().__init__()
-        self.epub = Epub(epub_file_path)
+        self.epub = Epub(epub_file_path, read_ahead=read_ahead)
         self.barcode = Path(epub_file_path).stem
         self._page_list = None
+        # the most recently used pages; see iter_pages() for streaming
+        self._pages = page_cache if page_cache is not None else PageCache()
+
+    def close(self):
+        self.epub.close()
 
     @property
     def toc(self):
@@ -68,32 +143,118 @@ class EPubVolume(Volume):
 
 
     def page(self, index):
+        page = self._pages.get(index)
+        if page is None:
+            page = self.load_page(index)
+            if page is not None:
+                self._pages.put(index, page)
+        return page
+
+    def _cached_or_loaded(self, index):
+        """The cached page, or a freshly loaded one that is not cached."""
+        page = self._pages.peek(index)
+        if page is None:
+            page = self.load_page(index)
+        return page
+
+    def iter_pages(self, pages=None):
+        """Yield the Page of each page (default: all, in order) without
+        keeping them: each page can be freed once the caller is done."""
+        if pages is None:
+            pages = range(len(self.page_list)) if self.page_list else []
+        for i in pages:
+            if (page := self._cached_or_loaded(i)) is not None:
+                yield page
+
+    def load_page(self, index):
+        """Read and parse a page, bypassing the page cache."""
         if self.page_list:
             pname = self.page_list[index]
             if pname:
-                p_tree =  self.epub.get_member(pname)
+                data = self.epub.read(pname)
+                # decompress the following pages while this one is analyzed
+                self.epub.prefetch(self.page_list[index+1:index+1+self.epub.read_ahead])
+                p_tree = ingest.parse(data)
                 if p_tree is not None:
                     return Page(p_tree, number=index)
         
 
-    def xml(self, greek_only=True) -> str:
-        if self._xml is None:
-            with io.StringIO() as buffer:
-                buffer.write(f"<volume n='{self.barcode}'>\n")
-                if self.page_list:
-                    for i in range(0, len(self.page_list)-1):
-                        if page := self.page(i):
-                            page_buffer:str | None = page.xml(greek_only=greek_only)
-                            if page_buffer:
-                                buffer.write(page_buffer)
-                buffer.write("</volume>\n")
-                self._xml = buffer.getvalue()
-        return self._xml
+    def page_fragment_items(self, greek_only=True, pages=None, jobs=1):
+        """Yield (page index, fragment) for the given pages (default: all
+        but the last, as write() has always done); the fragment is None
+        for pages that produce nothing."""
+        if pages is None:
+            pages = range(0, len(self.page_list)-1) if self.page_list else []
+        for job in self.pipeline(greek_only, jobs).run(PageJob(i) for i in pages):
+            instrument.record_page(self.barcode, job.number, job.timings)
+            yield job.number, job.fragment
+
+
+    def pipeline(self, greek_only=True, jobs=1) -> Pipeline:
+        """The stages that turn PageJobs into <page> fragments: members
+        are decompressed in a thread of their own (and, with read_ahead,
+        prefetched in the Epub's background thread) while earlier pages
+        are parsed, repaired, classified and serialized, in one thread,
+        or in jobs worker processes if jobs > 1."""
+        if jobs <= 1:
+            return Pipeline([
+                Stage("load", partial(_load_job, self.epub, self.page_list, self._pages), io=True),
+                Stage("parse", _parse_job),
+                Stage("repair", repair_job),
+                Stage("classify", classify_job),
+                Stage("serialize", partial(_serialize_job, greek_only)),
+            ])
+        return Pipeline([
+            Stage("load", partial(_load_job, self.epub, self.page_list, None), io=True),
+            Stage("analyze", partial(_analyze_job, greek_only), workers=jobs, kind="process",
+                  window=4 * jobs),
+        ])
 
 
-    
-    def serialize(self, dir_path:Path, greek_only=True):
+    def page_fragments(self, greek_only=True, jobs=None):
+        """Yield the <page> fragment of every page but the last, in order."""
+        for _, fragment in self.page_fragment_items(greek_only, jobs=jobs or 1):
+            if fragment:
+                yield fragment
+
+
+    def serialize(self, dir_path:Path, greek_only=True, jobs=1):
+        """Write <barcode>.xml to dir_path, through a temporary file that
+        replaces it only once complete (see PgVolume.serialize)."""
         file_path = (dir_path / self.barcode).with_suffix(".xml")
-        with open(file_path, 'w+', encoding="utf-8") as f:
-            f.write(self.xml(greek_only=greek_only))
+        with replacing(file_path) as tmp_path, open(tmp_path, 'wb') as f:
+            self.write(f, greek_only=greek_only, jobs=jobs)
+
+
+
+# EPubVolume pipeline stages; see pg.py for their PgVolume counterparts.
+
+def _load_job(epub, page_list, page_cache, job):
+    if page_cache is not None:
+        job.page = page_cache.peek(job.number)
+    if job.page is None and page_list:
+        pname = page_list[job.number]
+        if pname:
+            job.data = epub.read(pname)
+            epub.prefetch(page_list[job.number+1:job.number+1+epub.read_ahead])
+    return job
+
+def _parse_job(job):
+    if job.page is None and job.data is not None:
+        # a page with nothing on it produces no fragment, so its Span
+        # tree is not built
+        tree = ingest.parse(job.data)
+        if tree is not None and not is_empty(root := ocr_page(tree)):
+            with instrument.timer("spans"):
+                job.page = Page(root, number=job.number)
+    job.data = None
+    return job
+
+def _serialize_job(greek_only, job):
+    job.fragment = (job.page.xml_bytes(greek_only=greek_only) or None) if job.page else None
+    job.page = None
+    return job
 
+def _analyze_job(greek_only, job):
+    job = classify_job(repair_job(_parse_job(job)))
+    return _serialize_job(greek_only, job)
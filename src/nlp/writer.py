@@ -0,0 +1,114 @@
+"""Streaming XML output.
+
+Tokens, spans, lines and columns write their text to any sink with a
+write(str) method (see Span.write_to), so str() and the XML writers
+share one code path and no text is built up by concatenation.
+
+The <volume>, <page> and <column> elements are written by lxml's
+incremental xmlfile writer, which escapes attribute values. The text
+inside columns is already markup (Token.clean_text escapes it when the
+page is read), so it goes to the same binary file through a text layer
+instead of being escaped again."""
+
+import io
+import os
+from contextlib import contextmanager
+from pathlib import Path
+from lxml import etree
+
+
+class _MarkupSink:
+    """A text sink that collects what is written to it and writes it
+    to the binary file f, encoded, on flush(). (A TextIOWrapper does
+    the same, but on a readable file such as BytesIO it resets its
+    decoder on every write.)"""
+    def __init__(self, f):
+        self.f = f
+        self.pieces = []
+        self.write = self.pieces.append
+
+    def flush(self):
+        if self.pieces:
+            self.f.write(''.join(self.pieces).encode('utf-8'))
+            self.pieces.clear()
+
+
+class XMLWriter:
+    """Writes one element to the binary file f, followed by a newline.
+
+    element() and write() are those of lxml's xmlfile; markup() is a
+    text sink for already escaped markup, written where the document has
+    got to; write_bytes() does the same for encoded fragments."""
+    def __init__(self, f):
+        self.f = f
+
+    def __enter__(self):
+        self._xmlfile = etree.xmlfile(self.f, encoding='utf-8')
+        self.xf = self._xmlfile.__enter__()
+        self._text = _MarkupSink(self.f)
+        return self
+
+    def __exit__(self, *exc):
+        self._xmlfile.__exit__(*exc)
+        if exc[0] is None:
+            self.f.write(b"\n")
+        return False
+
+    def element(self, tag:str, attrib:dict | None = None):
+        return self.xf.element(tag, attrib or {})
+
+    def write(self, text:str):
+        self.xf.write(text)
+
+    @contextmanager
+    def markup(self):
+        self.xf.flush()
+        yield self._text
+        self._text.flush()
+
+    def write_bytes(self, data:bytes):
+        self.xf.flush()
+        self.f.write(data)
+
+
+def xml_bytes(write, *args) -> bytes:
+    """What write(writer, *args) writes to an XMLWriter, as UTF-8."""
+    with io.BytesIO() as buffer:
+        with XMLWriter(buffer) as writer:
+            write(writer, *args)
+        return buffer.getvalue()
+
+
+def plain_text(obj) -> str:
+    """The text of a span, line or column with its markup unescaped, for
+    attribute values and other places where the writer escapes it."""
+    with io.StringIO() as buffer:
+        obj.write_to(buffer, plain=True)
+        return buffer.getvalue()
+
+
+def running_head_text(lines) -> str:
+    return ' '.join(plain_text(line) for line in lines).strip()
+
+
+def write_volume(f, barcode:str, fragments):
+    """Write a <volume> document holding the encoded <page> fragments
+    to the binary file f."""
+    with XMLWriter(f) as writer:
+        with writer.element('volume', {'n': barcode}):
+            writer.write("\n")
+            for fragment in fragments:
+                writer.write_bytes(fragment)
+
+
+@contextmanager
+def replacing(path:Path):
+    """A temporary path next to path, moved onto path when the with
+    block completes, so that an interrupted write never leaves a partial
+    file at path; on an error it is removed instead."""
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    try:
+        yield tmp_path
+        os.replace(tmp_path, path)
+    finally:
+        tmp_path.unlink(missing_ok=True)
@@ -1,11 +1,16 @@
-import io
 import logging
-import re
+from functools import partial
 from pathlib import Path
-from lxml import etree
 from models.mets import MetsVolume, MetsPage
-from nlp.page import Page, BlankPage
-from nlp.utils import ns
+from nlp.page import Page, BlankPage, ocr_page, is_empty
+from nlp import ingest, instrument, layout_cache
+from nlp.page_cache import PageCache
+from nlp.prefetch import Prefetcher
+from nlp.store import CompactPage
+from nlp.pipeline import Pipeline, Stage, PageJob, repair_job, classify_job
+from nlp.volume import Volume
+from nlp.writer import XMLWriter, xml_bytes, running_head_text, replacing
+from nlp.token_table import TokenRows
 
 
 
@@ -13,65 +18,177 @@ from nlp.utils import ns
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
 
-def fix_entities(xml_string:str) -> str:
-    # Remove XML declaration to avoid ValueError
-    xml_string = re.sub(r'<\?xml.*?\?>', '', xml_string, flags=re.DOTALL)
-    # Replace bad entities (example: replace &shy; with actual soft hyphen)
-    xml_string = xml_string.replace("&shy;", "\u00AD")
-    xml_string = xml_string.replace("&quot;", "\u0022")
-    return xml_string
 
-def new_page(tree:etree.Element):
-    root = tree.xpath("//xhtml:div[@class='ocr_page']", namespaces=ns)[0]
-    children = [child for child in root if child.get('class') is not None]
-    if children:
-        return 
+# pages with these METS tags are blank, whatever their coordOCR file holds
+BLANK_TAGS = ['BLANK', 'FRONT_COVER', 'BACK_COVER', "IMAGE_ON_PAGE"]
+
 
 class Loader:
-    def __init__(self, volpath):
+    """Builds the PgPage of each page of a volume. With a layout_cache
+    (nlp.layout_cache.LayoutCache), pages whose coordOCR file has been
+    seen before are rebuilt from the cache instead of being parsed.
+
+    With read_ahead > 0, prefetch() reads the coordOCR files of the pages
+    about to be loaded in background threads (see nlp.prefetch): at most
+    read_ahead files are read ahead, and no more are started while those
+    read ahead but not yet loaded add up to read_ahead_bytes or more."""
+    def __init__(self, volpath, metsvol:MetsVolume | None=None, layout_cache=None,
+                 read_ahead:int=0, read_ahead_bytes:int=64 * 1024 * 1024, io_workers:int=2):
         self.volpath = volpath
-        self.metsvol = MetsVolume(volpath)
+        if metsvol is None:
+            metsvol = MetsVolume(volpath)
+        self.metsvol = metsvol
+        self.layout_cache = layout_cache
+        self._prefetcher = Prefetcher(self._read_page_num, read_ahead,
+                                      max_bytes=read_ahead_bytes, workers=io_workers)
 
-    def load_page(self, page_num):
-        mets_page:MetsPage = self.metsvol.page(page_num)
-        coordOCR_file = self.load_page_file(mets_page.coordOCR_file)
-        if coordOCR_file is not None:
-            exception_tags = ['BLANK', 'FRONT_COVER', 'BACK_COVER', "IMAGE_ON_PAGE"]
-            if any([tag for tag in exception_tags if tag in mets_page.tags]):
-                nlp_page = BlankPage(coordOCR_file, page_num)
-            else:
-                root = coordOCR_file.xpath("//xhtml:div[@class='ocr_page']", namespaces=ns)[0]
-                children = [child for child in root if child.get('class') is not None]
-                if len(children) > 0:
-                    nlp_page = Page(coordOCR_file, page_num)
-                else:
-                    nlp_page = BlankPage(coordOCR_file, page_num)
+    @property
+    def read_ahead(self) -> int:
+        return self._prefetcher.window
+
+    def close(self):
+        self._prefetcher.close()
 
+    def load_page(self, page_num, following=()):
+        """Build the PgPage for a page. The coordOCR file is read, parsed
+        and searched for its ocr_page element exactly once, unless the
+        METS file tags the page as blank. following are the pages to read
+        ahead (see prefetch) while this one is built."""
+        mets_page:MetsPage = self.metsvol.page(page_num)
+        future = self._prefetcher.take(page_num)
+        if future is None and self.read_ahead > 0:
+            future = self._prefetcher.submit(page_num)
+        self.prefetch(following)
+        raw_data = future.result() if future is not None else self.read_page(mets_page)
+        return self.page_from_bytes(mets_page, page_num, raw_data)
+
+
+    def prefetch(self, page_nums):
+        """Start reading the coordOCR files of the given pages, the ones
+        about to be loaded, in order; see nlp.prefetch.Prefetcher."""
+        self._prefetcher.prefetch(page_nums)
+
+    def _read_page_num(self, page_num):
+        return self.read_page(self.metsvol.page(page_num))
+
+
+    def is_blank(self, mets_page) -> bool:
+        return any(tag in mets_page.tags for tag in BLANK_TAGS)
+
+
+    def read_page(self, mets_page) -> bytes | None:
+        """The content of a page's coordOCR file, or None for a page
+        tagged as blank, whose file is never read."""
+        if self.is_blank(mets_page):
+            return None
+        return ingest.read(mets_page.coordOCR_file)
+
+
+    def page_from_bytes(self, mets_page, page_num, raw_data, compact=False):
+        """Build the PgPage for a page from the content of its coordOCR
+        file, as returned by read_page(). With compact, see build_page."""
+        if raw_data is None:
+            # an empty file has never produced a page
+            if mets_page.coordOCR_file.stat().st_size == 0:
+                return None
+            return PgPage(mets_page, BlankPage(None, page_num))
+
+        key = None
+        if self.layout_cache is not None:
+            key = layout_cache.file_key(raw_data)
+            nlp_page = self.layout_cache.load_page(key, page_num)
+            if nlp_page is not None:
+                return PgPage(mets_page, nlp_page)
+
+        tree = ingest.parse(raw_data)
+        if tree is not None:
+            nlp_page = self.build_page(tree, page_num, compact=compact)
+            # the layout cache holds Span trees, which a CompactPage is not
+            if key is not None and isinstance(nlp_page, Page):
+                self.layout_cache.store_page(key, nlp_page)
             return PgPage(mets_page, nlp_page)
 
 
+    def build_page(self, tree, page_num, blank=False, compact=False):
+        """A Page, or an empty BlankPage if blank is set or the page has
+        nothing on it, in which case no Span tree is built. With compact,
+        a read-only CompactPage (see nlp.store) unless the page has fused
+        lines to repair."""
+        root = ocr_page(tree)
+        if blank or is_empty(root):
+            return BlankPage(None, page_num)
+        with instrument.timer("spans"):
+            if compact:
+                page = CompactPage(root, page_num)
+                if not page.fused_lines:
+                    return page
+            return Page(root, page_num)
+
+
     def load_page_file(self,page_file:Path):
-        with page_file.open('r') as pf:
-            raw_data = pf.read()
-            clean_data = fix_entities(raw_data)
-            if clean_data:
-                tree = etree.fromstring(clean_data)
-                return tree
+        return ingest.parse_file(page_file)
 
 
 
-class PgVolume:
-    def __init__(self, volpath:Path):
-        self.metsvol = MetsVolume(volpath)
-        self.loader = Loader(volpath)
-        self._pages = {}
-        self._xml = None
+class PgVolume(Volume):
+    def __init__(self, volpath:Path, jobs:int=1, window:int | None=None,
+                 persist_manifest:bool=False, layout_cache=None,
+                 page_cache:PageCache | None=None, read_ahead:int=0,
+                 read_ahead_bytes:int=64 * 1024 * 1024, compact_pages:bool=False):
+        super().__init__()
+        self.volpath = volpath
+        # MetsPages hold their parsed coordOCR tree once it is read,
+        # so only the most recently used ones are kept
+        self.metsvol = MetsVolume(volpath, persist_manifest=persist_manifest,
+                                  page_cache=PageCache())
+        # read_ahead: see Loader; page(), iter_pages() and
+        # iter_chapter_starts() read the pages that follow ahead
+        self.loader = Loader(volpath, self.metsvol, layout_cache,
+                             read_ahead=read_ahead, read_ahead_bytes=read_ahead_bytes)
+        self.jobs = jobs
+        self.window = window
+        # build the pages written by the pipeline as CompactPages where
+        # possible; page() and iter_pages() always give full Pages
+        self.compact_pages = compact_pages
+        # the most recently used pages; see iter_pages() for streaming
+        self._pages = page_cache if page_cache is not None else PageCache()
 
 
     def page(self, page_num):
-        if self._pages.get(page_num) is None:
-            self._pages[page_num] = self.loader.load_page(page_num)
-        return self._pages[page_num]
+        page = self._pages.get(page_num)
+        if page is None:
+            # read the pages that follow, in METS order, while this one is built
+            following = []
+            page_list = self.page_list
+            if self.loader.read_ahead > 0 and page_num in page_list:
+                start = page_list.index(page_num) + 1
+                following = page_list[start:start + self.loader.read_ahead]
+            page = self._pages.put(page_num, self._load(page_num, following))
+        return page
+
+    def _load(self, page_num, following):
+        return self.loader.load_page(page_num, [n for n in following if self._pages.peek(n) is None])
+
+    def _cached_or_loaded(self, page_num, following=()):
+        """The cached page, or a freshly loaded one that is not cached.
+        following are the pages the caller will ask for next."""
+        page = self._pages.peek(page_num)
+        if page is None:
+            page = self._load(page_num, following)
+        return page
+
+    def iter_pages(self, pages=None):
+        """Yield the PgPage of each page (default: all, in physical order)
+        without keeping them: each page can be freed once the caller is
+        done with it."""
+        pages = list(self.page_list if pages is None else pages)
+        read_ahead = self.loader.read_ahead
+        for i, pagenum in enumerate(pages):
+            if page := self._cached_or_loaded(pagenum, pages[i+1:i+1+read_ahead]):
+                yield page
+
+    def close(self):
+        self.loader.close()
     
     @property
     def page_list(self):
@@ -81,18 +198,27 @@ class PgVolume:
     def barcode(self):
         return self.metsvol.id[0]
 
+    def chapter_start_pages(self):
+        """The numbers of the pages tagged CHAPTER_START in the METS file."""
+        return [i for i, entry in self.metsvol.page_index.items()
+                if 'CHAPTER_START' in entry["tags"]]
+
+    def iter_chapter_starts(self):
+        """Yield (page number, PgPage) for each chapter start, one at a time."""
+        starts = self.chapter_start_pages()
+        read_ahead = self.loader.read_ahead
+        for k, i in enumerate(starts):
+            yield i, self._cached_or_loaded(i, starts[k+1:k+1+read_ahead])
+
     def chapter_starts(self):
         starts = {}
-        for i in self.metsvol.page_index:
-            mets_page = self.metsvol.page(i)
-            if 'CHAPTER_START' in mets_page.tags:
-                starts[i] = self.page(i)
+        for i in self.chapter_start_pages():
+            starts[i] = self.page(i)
         return starts
 
     def chapter_titles(self):
-        chapter_starts = self.chapter_starts()
         title_info = {}
-        for k,page in chapter_starts.items():
+        for k,page in self.iter_chapter_starts():
             titles = page._nlp_page.titles
             metadata = { "titles" : titles, "page_num" : k }
             if cnums := page.column_numbers:
@@ -102,10 +228,9 @@ class PgVolume:
         return title_info
 
     def works_xml(self):
-        chapter_starts = self.chapter_starts()
         txt = '<?xml version="1.0" encoding="UTF-8"?>\n'
         txt += "<works>\n"
-        for k,page in chapter_starts.items():
+        for k,page in self.iter_chapter_starts():
             titles = page._nlp_page.titles
             names = page._nlp_page.names_in_titles
             start = None
@@ -123,29 +248,140 @@ class PgVolume:
         txt += "</works>"
         return txt
 
-    
-    def xml(self, greek_only=True) -> str:
-        if self._xml is None:
-            with io.StringIO() as buffer:
-                buffer.write(f"<volume n='{self.barcode}'>\n")
-                for pagenum in self.page_list:
-                    if page := self.page(pagenum):
-                        page_buffer = page.xml(greek_only = greek_only)
-                        buffer.write(page_buffer)
-                buffer.write("</volume>\n")
-                self._xml = buffer.getvalue()
-        return self._xml
-
-
-        
 
-    def serialize(self, dir_path:Path, greek_only=True):
+    def page_fragments(self, greek_only=True, jobs=None):
+        """Yield the <page> fragment of every page, in physical order.
+
+        With jobs > 1 the fragments are built in worker processes; at most
+        `window` pages (default 4 * jobs) are in flight at once, and results
+        are yielded in page order, so the output is the same as the serial
+        path."""
+        for _, fragment in self.page_fragment_items(greek_only=greek_only, jobs=jobs):
+            if fragment:
+                yield fragment
+
+
+    def page_fragment_items(self, greek_only=True, jobs=None, pages=None):
+        """Yield (page number, fragment) for the given pages (default: all),
+        in order; the fragment is None for pages without a coordOCR tree."""
+        for job in self.page_jobs(greek_only, jobs, pages):
+            yield job.number, job.fragment
+
+
+    def page_jobs(self, greek_only=True, jobs=None, pages=None, tokens=False):
+        """Yield the finished PageJob of each of the given pages (default:
+        all), in order. With tokens, each also carries the TokenRows of
+        the columns in its fragment."""
+        if pages is None:
+            pages = self.page_list
+        for job in self.pipeline(greek_only, jobs, tokens).run(PageJob(n) for n in pages):
+            instrument.record_page(self.barcode, job.number, job.timings)
+            yield job
+
+
+    def pipeline(self, greek_only=True, jobs=None, tokens=False) -> Pipeline:
+        """The stages that turn PageJobs into <page> fragments.
+
+        Files are read by a small thread pool, so I/O overlaps with the
+        analysis. With jobs <= 1 the pages are then parsed, repaired,
+        classified and serialized by one stage each, in threads; already
+        cached pages skip the read and parse. With jobs > 1 those four
+        steps run together in a pool of worker processes, at most
+        `window` pages (default 4 * jobs) at a time."""
+        jobs = jobs or self.jobs
+        if jobs <= 1:
+            return Pipeline([
+                Stage("load", partial(_load_job, self.loader, self._pages), workers=2),
+                Stage("parse", partial(_parse_job, self.loader, compact=self.compact_pages)),
+                Stage("repair", repair_job),
+                Stage("classify", classify_job),
+                Stage("serialize", partial(_serialize_job, greek_only, tokens=tokens)),
+            ])
+        return Pipeline([
+            Stage("load", partial(_load_job, self.loader, None), workers=2),
+            Stage("analyze", partial(_analyze_job, greek_only, tokens=tokens, compact=self.compact_pages),
+                  workers=jobs, kind="process",
+                  initializer=_init_page_worker,
+                  initargs=(self.volpath, self.metsvol.manifest, self.loader.layout_cache),
+                  window=self.window or 4 * jobs),
+        ])
+
+
+    def serialize(self, dir_path:Path, greek_only=True, jobs=None, tokens=False):
+        """Write <barcode>.xml to dir_path and, with tokens, the token
+        table of the same pages to <barcode>.tokens (see token_table.py).
+
+        Both are written to temporary files that replace the outputs only
+        once complete, the token table first, so an interrupted run never
+        leaves a partial <barcode>.xml behind."""
         file_path = (dir_path / self.barcode).with_suffix(".xml")
-        with open(file_path, 'w+', encoding="utf-8") as f:
-            f.write(self.xml(greek_only=greek_only))
+        if not tokens:
+            with replacing(file_path) as tmp_path, open(tmp_path, 'wb') as f:
+                self.write(f, greek_only=greek_only, jobs=jobs)
+            return
+
+        rows = TokenRows()
+
+        def fragments():
+            for job in self.page_jobs(greek_only, jobs, tokens=True):
+                if job.tokens:
+                    rows.extend(job.tokens)
+                if job.fragment:
+                    yield job.fragment
+        with replacing(file_path) as tmp_path:
+            with open(tmp_path, 'wb') as f:
+                self.write(f, fragments=fragments())
+            with replacing(file_path.with_suffix(".tokens")) as tmp_tokens_path:
+                rows.write(tmp_tokens_path, self.barcode)
             
 
 
+# Pipeline stages. The load stage reads the coordOCR file of a page
+# (unless the page is cached), the parse stage builds its PgPage, and the
+# serialize stage replaces the page with its <page> fragment. Jobs only
+# carry the page number and bytes, so that they are cheap to pickle; both
+# stages look the MetsPage up again, from threads of their own, which the
+# locked PageCache of PgVolume.metsvol allows.
+
+def _load_job(loader, page_cache, job):
+    if page_cache is not None:
+        job.page = page_cache.peek(job.number)
+    if job.page is None:
+        job.data = loader.read_page(loader.metsvol.page(job.number))
+    return job
+
+def _parse_job(loader, job, compact=False):
+    if job.page is None:
+        job.page = loader.page_from_bytes(loader.metsvol.page(job.number), job.number, job.data,
+                                          compact=compact)
+    job.data = None
+    return job
+
+def _serialize_job(greek_only, job, tokens=False):
+    if job.page:
+        job.tokens = TokenRows() if tokens else None
+        job.fragment = job.page.xml_bytes(greek_only=greek_only, tokens=job.tokens)
+    else:
+        job.fragment = None
+    job.page = None
+    return job
+
+
+# Page workers: each worker process builds its own Loader once, from the
+# parent's METS manifest, and then turns loaded PageJobs into fragments.
+_worker_loader = None
+
+def _init_page_worker(volpath, manifest, layout_cache=None):
+    global _worker_loader
+    metsvol = MetsVolume(volpath, manifest=manifest, page_cache=PageCache())
+    _worker_loader = Loader(volpath, metsvol, layout_cache)
+
+def _analyze_job(greek_only, job, tokens=False, compact=False):
+    job = _parse_job(_worker_loader, job, compact)
+    job = classify_job(repair_job(job))
+    return _serialize_job(greek_only, job, tokens)
+
+
 class PgPage:
     def __init__(self, mets_page, nlp_page):
         self._mets_page = mets_page
@@ -186,42 +422,50 @@ class PgPage:
         return left_column, right_column
 
 
-    def xml(self, greek_only=True):
+    def xml(self, greek_only=True) -> str:
+        return self.xml_bytes(greek_only).decode('utf-8')
+
+    def xml_bytes(self, greek_only=True, tokens=None) -> bytes:
+        return xml_bytes(self.write_xml, greek_only, tokens)
+
+    def write_xml(self, writer:XMLWriter, greek_only=True, tokens=None):
+        """Write the <page> element of this page to writer; its columns
+        are numbered from the page's ORDERLABEL. The tokens of the
+        columns written are added to tokens, a TokenRows, if given."""
         self._nlp_page.repair_fused_lines()
-        with io.StringIO() as buffer:
-            buffer.write(f"<page n='{self.physical_order}'")
-            if self._nlp_page.running_head:
-                head_txt = ' '.join(str(line) for line in self._nlp_page.running_head)
-                buffer.write(f"running_head='{head_txt.strip()}'")
-            buffer.write(">\n")
+        attrib = {'n': str(self.physical_order)}
+        if self._nlp_page.running_head:
+            attrib['running_head'] = running_head_text(self._nlp_page.running_head)
+        with writer.element('page', attrib):
+            writer.write("\n")
             if greek_only:
                 for column in self._nlp_page.greek_columns:
-                    buffer.write("<column ")
+                    column_attrib = {}
                     if column.side == 'left' and self._mets_page.logical_order:
-                        buffer.write(f"n = '{self._mets_page.logical_order}'")
+                        column_attrib['n'] = str(self._mets_page.logical_order)
                     elif column.side == 'right' and self._mets_page.logical_order:
                         try:
-                            buffer.write(f"n= '{str(int(self._mets_page.logical_order) + 1)}'")
+                            column_attrib['n'] = str(int(self._mets_page.logical_order) + 1)
                         except ValueError:
                             pass
-                    else:
-                        pass
-                    buffer.write(">\n")
-                    buffer.write(str(column))
-                    buffer.write("\n</column>\n")
+                    self._write_column(writer, column, column_attrib, tokens)
             else:
                 if self._nlp_page.left_column and self._mets_page.logical_order:
-                    buffer.write(f"<column n='{self._mets_page.logical_order}'>\n")
-                    buffer.write(str(self._nlp_page.left_column))
-                    buffer.write("\n</column>\n")
+                    self._write_column(writer, self._nlp_page.left_column,
+                                       {'n': str(self._mets_page.logical_order)}, tokens)
                 if self._nlp_page.right_column and self._mets_page.logical_order:
-                    buffer.write(f"<column n='{int(self._mets_page.logical_order) + 1}'>\n")
-                    buffer.write(str(self._nlp_page.right_column))
-                    buffer.write("\n></column>\n")
-                
-            buffer.write("</page>\n")
-            content = buffer.getvalue()
-        return content
+                    self._write_column(writer, self._nlp_page.right_column,
+                                       {'n': str(int(self._mets_page.logical_order) + 1)}, tokens)
+
+    def _write_column(self, writer, column, attrib, tokens=None):
+        if tokens is not None:
+            tokens.add_column(self.physical_order, attrib.get('n'), column.side, column)
+        with writer.element('column', attrib):
+            with writer.markup() as sink:
+                sink.write("\n")
+                column.write_to(sink)
+                sink.write("\n")
+        writer.write("\n")
 
 
     def serialize(self, f, greek_only=True):
@@ -1,8 +1,16 @@
 # A transformer class
 import argparse
 import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
 from pathlib import Path
+from contextlib import nullcontext
 import pg
+import incremental
+from nlp import instrument
+from nlp.layout_cache import LayoutCache
 
 
 # Configure basic logging to the console
@@ -14,20 +22,71 @@ class Transformer():
     volumes. It assumes its input direcory
     contains subdirectories named by barcode
     or other id."""
-    def __init__(self, indir, outdir) -> None:
+    def __init__(self, indir, outdir, jobs=1, max_tasks_per_child=None, page_jobs=1,
+                 incremental=False, layout_cache=None, timings=False, count_calls=False,
+                 tokens=False, compact_pages=False) -> None:
         self.indir = Path(indir)
         self.outdir = Path(outdir)
+        self.jobs = jobs
+        self.max_tasks_per_child = max_tasks_per_child
+        self.page_jobs = page_jobs
+        self.incremental = incremental
+        self.layout_cache = layout_cache
+        self.timings = timings
+        self.count_calls = count_calls
+        self.tokens = tokens
+        self.compact_pages = compact_pages
+        # the merged instrumentation reports of the volume tasks
+        self.timing_report = instrument.Report()
 
     def transform_volume(self, barcode):
+        """Transform one volume and return 'done' or 'skipped'.
+
+        A <barcode>.xml.lock file holding the worker's PID is created
+        exclusively before the existence check, so concurrent workers
+        never transform the same volume twice; the lock of a process that
+        has died is broken (see claim_lock). The output is written to a
+        temporary file and moved into place once complete, so a failed
+        or killed run leaves no partial output behind; the temporary
+        files of a killed run are removed by the next one.
+
+        In incremental mode an existing output is not enough to skip the
+        volume: it is rebuilt, page by page, whenever its pages, its METS
+        file or the pipeline have changed since the last build."""
         file_path = (self.outdir / barcode).with_suffix(".xml")
+        lock_path = self._lock_path(barcode)
+        if not claim_lock(lock_path):
+            logging.info(f"{file_path} is already being transformed")
+            return "skipped"
+
+        try:
+            # the temporary files of a worker killed while writing this
+            # volume; no one else writes it while the lock is held
+            for tmp_path in self.outdir.glob(f"{barcode}.*.tmp"):
+                tmp_path.unlink(missing_ok=True)
+            with instrument.volume(barcode):
+                return self._transform_volume(barcode, file_path)
+        finally:
+            lock_path.unlink(missing_ok=True)
+
+
+    def _transform_volume(self, barcode, file_path):
+        if self.incremental:
+            volume = pg.PgVolume(self.indir / barcode, jobs=self.page_jobs,
+                                 layout_cache=self.layout_cache,
+                                 compact_pages=self.compact_pages)
+            return incremental.build_pg_volume(volume, self.outdir)
         if file_path.is_file():
             logging.info(f"{file_path} already exists")
-        else:
-            logging.info(f"transforming volume {barcode}")
-            vol_indir = self.indir / barcode
-            volume = pg.PgVolume(vol_indir)
-            volume.serialize(self.outdir)
-            logging.info(f"finished transforming volume {barcode}")
+            return "skipped"
+        logging.info(f"transforming volume {barcode}")
+        vol_indir = self.indir / barcode
+        volume = pg.PgVolume(vol_indir, jobs=self.page_jobs,
+                             layout_cache=self.layout_cache,
+                             compact_pages=self.compact_pages)
+        volume.serialize(self.outdir, tokens=self.tokens)
+        logging.info(f"finished transforming volume {barcode}")
+        return "done"
 
 
     def transform_all_volumes(self):
@@ -36,10 +95,177 @@ class Transformer():
         volume_count = len(barcodes)
         logging.info(f"processing {volume_count} volumes")
         logging.info(f"starting to process {len(barcoded_directories)}")
-        for i,barcode in enumerate(barcodes):
-            logging.info(f"processing volume {i}: barcode={barcode}")
-            self.transform_volume(barcode)
-            logging.info(f"done processing volume {i}")
+        if self.jobs > 1:
+            results = self._transform_parallel(barcodes)
+        else:
+            results = {}
+            for i,barcode in enumerate(barcodes):
+                logging.info(f"processing volume {i}: barcode={barcode}")
+                _, status, error, timings = transform_volume_task(
+                    self.indir, self.outdir, barcode, self.page_jobs, self.incremental,
+                    self.layout_cache, self.timings, self.count_calls, self.tokens,
+                    self.compact_pages)
+                results[barcode] = (status, error)
+                if timings:
+                    self.timing_report.merge(timings)
+                logging.info(f"done processing volume {i}")
+        self.report(results)
+        return results
+
+
+    def _transform_parallel(self, barcodes):
+        """Transform the volumes in a pool of worker processes.
+
+        A worker that dies (lxml can crash, or the kernel can kill it for
+        its memory) breaks the whole pool, and every volume that had not
+        finished is resubmitted to a new one. The volumes that were being
+        transformed when it broke, the ones whose lock is left behind by
+        a dead process, are first retried one at a time, each in a pool
+        of its own, so that a volume that kills its worker again is
+        reported as failed instead of breaking the run."""
+        results = {}
+        pending = list(barcodes)
+        while pending:
+            broken = self._run_pool(pending, self.jobs, results)
+            in_flight = [barcode for barcode in broken if self._held_by_dead_worker(barcode)]
+            for barcode in in_flight or broken:
+                if self._run_pool([barcode], 1, results):
+                    error = "the worker process died"
+                    logging.error(f"failed volume {barcode}: {error}")
+                    results[barcode] = ("failed", error)
+                    if self._held_by_dead_worker(barcode):
+                        self._lock_path(barcode).unlink(missing_ok=True)
+            pending = [barcode for barcode in broken if barcode not in results]
+        return results
+
+    def _run_pool(self, barcodes, workers, results):
+        """Transform the volumes in a pool of workers, adding their
+        (status, error) to results; returns the volumes that did not
+        finish because the pool broke."""
+        broken = set()
+        with ProcessPoolExecutor(max_workers=workers,
+                                 max_tasks_per_child=self.max_tasks_per_child) as executor:
+            futures = {executor.submit(transform_volume_task, self.indir, self.outdir, barcode,
+                                       self.page_jobs, self.incremental, self.layout_cache,
+                                       self.timings, self.count_calls, self.tokens,
+                                       self.compact_pages): barcode
+                       for barcode in barcodes}
+            for future in as_completed(futures):
+                try:
+                    barcode, status, error, timings = future.result()
+                except BrokenProcessPool:
+                    broken.add(futures[future])
+                    continue
+                except Exception as e:
+                    barcode, timings = futures[future], None
+                    status, error = "failed", f"{type(e).__name__}: {e}"
+                logging.info(f"{status} volume {barcode}")
+                results[barcode] = (status, error)
+                if timings:
+                    self.timing_report.merge(timings)
+        return [barcode for barcode in barcodes if barcode in broken]
+
+    def _lock_path(self, barcode) -> Path:
+        return (self.outdir / barcode).with_suffix(".xml.lock")
+
+    def _held_by_dead_worker(self, barcode) -> bool:
+        lock_path = self._lock_path(barcode)
+        return lock_path.exists() and _lock_is_stale(lock_path)
+
+
+    def report(self, results):
+        """Log a summary of the per-volume results."""
+        counts = {}
+        for status, _ in results.values():
+            counts[status] = counts.get(status, 0) + 1
+        summary = ', '.join(f"{n} {status}" for status, n in sorted(counts.items()))
+        logging.info(f"summary: {summary or 'no volumes'}")
+        for barcode, (status, error) in sorted(results.items()):
+            if status == "failed":
+                logging.error(f"volume {barcode} failed: {error}")
+
+
+# a lock file that is still empty this many seconds after it was created
+# belongs to a worker that died before writing its PID
+EMPTY_LOCK_TIMEOUT = 60
+
+
+def claim_lock(lock_path:Path) -> bool:
+    """Create lock_path holding this process's PID, unless another live
+    process holds it. A lock left behind by a process that no longer
+    exists (on this host) is stale: it is broken and claimed."""
+    for _ in range(2):
+        try:
+            fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            if not _break_stale_lock(lock_path):
+                return False
+            continue
+        with os.fdopen(fd, 'w') as f:
+            f.write(str(os.getpid()))
+        return True
+    return False
+
+
+def _lock_is_stale(lock_path:Path) -> bool:
+    try:
+        content = lock_path.read_text().strip()
+        age = time.time() - lock_path.stat().st_mtime
+    except FileNotFoundError:
+        return True
+    if not content.isdigit():
+        return age > EMPTY_LOCK_TIMEOUT
+    try:
+        os.kill(int(content), 0)
+    except ProcessLookupError:
+        return True
+    except PermissionError:
+        pass
+    return False
+
+
+def _break_stale_lock(lock_path:Path) -> bool:
+    """Remove lock_path if it is stale; False if it is held. The lock is
+    first renamed aside, so that of several workers finding the same
+    stale lock only one removes it, and checked again, in case it was
+    replaced by a live worker's lock in the meantime."""
+    if not _lock_is_stale(lock_path):
+        return False
+    aside = lock_path.with_name(f"{lock_path.name}.{os.getpid()}.stale")
+    try:
+        os.rename(lock_path, aside)
+    except FileNotFoundError:
+        return True
+    if not _lock_is_stale(aside):
+        try:
+            os.link(aside, lock_path)
+        except FileExistsError:
+            pass
+        aside.unlink()
+        return False
+    logging.warning(f"removing the stale lock {lock_path}")
+    aside.unlink()
+    return True
+
+
+def transform_volume_task(indir, outdir, barcode, page_jobs=1, incremental=False,
+                          layout_cache=None, timings=False, count_calls=False, tokens=False,
+                          compact_pages=False):
+    """Transform a single volume; returns (barcode, status, error, timings),
+    where timings is the to_dict() of its instrumentation report, if asked for.
+
+    Module-level so that it can be shipped to worker processes."""
+    recording = instrument.recording(count_calls) if timings else nullcontext()
+    with recording as report:
+        try:
+            status = Transformer(indir, outdir, page_jobs=page_jobs, incremental=incremental,
+                                 layout_cache=layout_cache, tokens=tokens,
+                                 compact_pages=compact_pages).transform_volume(barcode)
+            error = None
+        except Exception as e:
+            logging.exception(f"error transforming volume {barcode}")
+            status, error = "failed", f"{type(e).__name__}: {e}"
+    return barcode, status, error, report.to_dict() if report else None
 
 
 def main():
@@ -47,16 +273,60 @@ def main():
     parser.add_argument("input_dir", help="Path to the input directory containing barcoded folders")
     parser.add_argument("output_dir", help="Path to the output directory where XML files will be written")
     parser.add_argument("--barcode", help="Optional specific barcode to transform")
+    parser.add_argument("--jobs", type=int, default=1,
+                        help="Number of volumes to transform in parallel worker processes")
+    parser.add_argument("--max-tasks-per-child", type=int, default=None,
+                        help="Replace each worker process after it has transformed this many volumes")
+    parser.add_argument("--page-jobs", type=int, default=1,
+                        help="Number of worker processes building the pages of each volume")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Rebuild only the volumes and pages whose inputs or pipeline changed")
+    parser.add_argument("--layout-cache", default=None,
+                        help="Directory of a parsed page layout cache, shared by all workers")
+    parser.add_argument("--layout-cache-size", type=int, default=1024,
+                        help="Size in MB above which the layout cache evicts old entries")
+    parser.add_argument("--tokens", action="store_true",
+                        help="Also write a <barcode>.tokens table of the tokens and their boxes")
+    parser.add_argument("--compact-pages", action="store_true",
+                        help="Build pages without fused lines as compact arrays instead of object trees")
+    parser.add_argument("--timings", default=None,
+                        help="Write per-stage, per-page and per-volume timings to this JSON file")
+    parser.add_argument("--count-calls", action="store_true",
+                        help="Also count calls of the expensive layout properties (with --timings)")
+    parser.add_argument("--profile", default=None,
+                        help="Profile the run (best with --barcode and --page-jobs 1) into this file")
+    parser.add_argument("--profile-format", choices=sorted(instrument.PROFILERS), default="pstats",
+                        help="pstats for pstats/snakeviz, collapsed for flame graphs")
 
     args = parser.parse_args()
+    if args.tokens and args.incremental:
+        parser.error("--tokens cannot be combined with --incremental")
 
-    transformer = Transformer(args.input_dir, args.output_dir)
+    layout_cache = None
+    if args.layout_cache:
+        layout_cache = LayoutCache(args.layout_cache, max_bytes=args.layout_cache_size * 1024 * 1024)
 
-    if args.barcode:
-        transformer.transform_volume(args.barcode)
-    else:
-        transformer.transform_all_volumes()
+    transformer = Transformer(args.input_dir, args.output_dir,
+                              jobs=args.jobs, max_tasks_per_child=args.max_tasks_per_child,
+                              page_jobs=args.page_jobs, incremental=args.incremental,
+                              layout_cache=layout_cache, timings=bool(args.timings),
+                              count_calls=args.count_calls, tokens=args.tokens,
+                              compact_pages=args.compact_pages)
+
+    profiling = instrument.profile(args.profile, args.profile_format) if args.profile else nullcontext()
+    with profiling:
+        if args.barcode:
+            recording = instrument.recording(args.count_calls) if args.timings else nullcontext()
+            with recording as report:
+                transformer.transform_volume(args.barcode)
+            if report:
+                transformer.timing_report.merge(report.to_dict())
+        else:
+            transformer.transform_all_volumes()
+
+    if args.timings:
+        transformer.timing_report.write(args.timings)
+        logging.info(f"timings written to {args.timings}\n{transformer.timing_report.summary()}")
 
 if __name__ == "__main__":
     main()
-
@@ -12,3 +12,104 @@ sys.path.insert(0, str(src_path))
 
 # Print paths for debugging
 print(f"Python path: {sys.path}")
+
+
+import pytest
+
+
+XHTML_PAGE = """<?xml version="1.0" encoding="UTF-8"?>
+<!DOCTYPE html PUBLIC "-//W3C//DTD XHTML 1.0 Transitional//EN" "http://www.w3.org/TR/xhtml1/DTD/xhtml1-transitional.dtd">
+<html xmlns="http://www.w3.org/1999/xhtml"><head><title></title></head><body>
+<div class='ocr_page' title='bbox 0 0 2000 3000'>{blocks}</div>
+</body></html>
+"""
+
+METS_FILE = """<?xml version="1.0" encoding="UTF-8"?>
+<METS:mets xmlns:METS="http://www.loc.gov/METS/" xmlns:xlink="http://www.w3.org/1999/xlink" OBJID="{barcode}">
+<METS:fileSec>
+<METS:fileGrp USE="image">{images}</METS:fileGrp>
+<METS:fileGrp USE="coordOCR">{html}</METS:fileGrp>
+</METS:fileSec>
+<METS:structMap TYPE="physical"><METS:div TYPE="volume">{divs}</METS:div></METS:structMap>
+</METS:mets>
+"""
+
+GREEK = "ἐν ἀρχῇ ἦν ὁ λόγος καὶ ὁ λόγος ἦν πρὸς τὸν θεόν".split()
+LATIN = "in principio erat verbum et verbum erat apud deum".split()
+
+
+def hocr_line(left, top, right, words, height=30):
+    """An ocr_line whose words are spread evenly between left and right."""
+    step = (right - left) // len(words)
+    spans = []
+    for i, word in enumerate(words):
+        x = left + i * step
+        x_max = right if i == len(words) - 1 else x + step - 10
+        spans.append(f"<span class='ocrx_word' title='bbox {x} {top} {x_max} {top + height}'>{word}</span>")
+    return (f"<span class='ocr_line' title='bbox {left} {top} {right} {top + height}'>"
+            + " ".join(spans) + "</span>")
+
+
+def hocr_page(lines):
+    """A page with one block and paragraph holding the given lines."""
+    if not lines:
+        return XHTML_PAGE.format(blocks="")
+    body = "\n".join(hocr_line(*line) for line in lines)
+    block = (f"<div class='ocrx_block' title='bbox 100 100 1900 2900'>"
+             f"<p class='ocr_par' title='bbox 100 100 1900 2900'>\n{body}\n</p></div>")
+    return XHTML_PAGE.format(blocks=block)
+
+
+def two_column_lines(rows=6, fused_row=None):
+    """A running head, then Greek lines on the left and Latin lines on the right.
+    If fused_row is given, that row is a single line running across both columns."""
+    lines = [(100, 100, 1900, ["ΠΑΤΡΟΛΟΓΙΑ", "ΕΛΛΗΝΙΚΗ"], 30)]
+    for row in range(rows):
+        top = 200 + row * 50
+        if row == fused_row:
+            lines.append((100, top, 1900, GREEK[:6] + LATIN[:6], 40))
+        else:
+            lines.append((100, top, 900, GREEK[row % 4:row % 4 + 5], 40))
+            lines.append((1000, top, 1900, LATIN[row % 4:row % 4 + 5], 40))
+    return lines
+
+
+def write_volume(directory, barcode, pages):
+    """Write a METS file and coordOCR pages; pages is a list of
+    (orderlabel, admid, lines) tuples in physical order."""
+    directory.mkdir(parents=True, exist_ok=True)
+    images, html, divs = [], [], []
+    for order, (label, admid, lines) in enumerate(pages, start=1):
+        name = f"{order:08d}"
+        images.append(f"<METS:file ID='IMG{name}'><METS:FLocat xlink:href='{name}.jp2'/></METS:file>")
+        html.append(f"<METS:file ID='HTML{name}'><METS:FLocat xlink:href='{name}.html'/></METS:file>")
+        attrs = f"TYPE='page' ORDER='{order}'"
+        if label:
+            attrs += f" ORDERLABEL='{label}'"
+        if admid:
+            attrs += f" ADMID='{admid}'"
+        divs.append(f"<METS:div {attrs}><METS:fptr FILEID='IMG{name}'/><METS:fptr FILEID='HTML{name}'/></METS:div>")
+        (directory / f"{name}.html").write_text(hocr_page(lines), encoding="utf-8")
+    mets = METS_FILE.format(barcode=barcode, images="".join(images),
+                            html="".join(html), divs="".join(divs))
+    (directory / f"{barcode}.mets.xml").write_text(mets, encoding="utf-8")
+    return directory
+
+
+@pytest.fixture
+def volume_dir(tmp_path):
+    pages = [
+        (None, "FRONT_COVER", []),
+        ("11", "CHAPTER_START", two_column_lines()),
+        ("13", None, two_column_lines(rows=8, fused_row=3)),
+        (None, None, []),
+        ("15", None, two_column_lines(rows=4)),
+    ]
+    return write_volume(tmp_path / "32101000000001", "32101000000001", pages)
+
+
+@pytest.fixture
+def fused_page_tree():
+    """A parsed two-column page whose fourth row is a fused line."""
+    from lxml import etree
+    return etree.fromstring(hocr_page(two_column_lines(rows=8, fused_row=3)).encode("utf-8"))
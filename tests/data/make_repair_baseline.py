@@ -0,0 +1,39 @@
+# make_repair_baseline.py
+#
+# Writes repair_baseline.json, the output that tests/test_repair.py
+# compares the fused line repair against. It runs the Page and Line code
+# of an older checkout, before the repair was rewritten around TopOrder
+# and the one-pass Line.unfuse, on the pages and lines that the test
+# generates:
+#
+#   git archive 2fa6de0 src | tar -x -C /tmp/baseline
+#   python tests/data/make_repair_baseline.py /tmp/baseline/src
+
+import json
+import random
+import sys
+from pathlib import Path
+
+sys.path.insert(0, sys.argv[1])
+from nlp.page import Page      # the old Page; tests.conftest adds src/ later
+from lxml import etree
+sys.path.insert(1, str(Path(__file__).parents[2]))
+from tests import test_repair
+
+
+def main():
+    assert sys.modules["nlp.page"].__file__.startswith(str(Path(sys.argv[1]).resolve()))
+    baseline = {"unfuse": [], "pages": []}
+    for tree in test_repair.fused_line_trees():
+        left, right = Page(tree).lines[0].unfuse()
+        baseline["unfuse"].append([[t.text for t in left.tokens], [t.text for t in right.tokens]])
+    for tree in test_repair.page_trees():
+        page = Page(tree)
+        page.repair_fused_lines()
+        baseline["pages"].append(test_repair.snapshot(page))
+    with open(test_repair.BASELINE, 'w', encoding='utf-8') as f:
+        json.dump(baseline, f, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    main()
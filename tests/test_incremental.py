@@ -0,0 +1,47 @@
+import incremental
+import pg
+from pg import PgVolume
+from tests.conftest import hocr_page, two_column_lines
+
+
+def counting_loads(monkeypatch):
+    loaded = []
+    page_from_bytes = pg.Loader.page_from_bytes
+
+    def counting_page_from_bytes(self, mets_page, page_num, raw_data, **kwargs):
+        loaded.append(page_num)
+        return page_from_bytes(self, mets_page, page_num, raw_data, **kwargs)
+
+    monkeypatch.setattr(pg.Loader, 'page_from_bytes', counting_page_from_bytes)
+    return loaded
+
+
+def test_unchanged_volume_is_skipped(volume_dir, tmp_path, monkeypatch):
+    out = tmp_path / "out"
+    out.mkdir()
+    assert incremental.build_pg_volume(PgVolume(volume_dir), out) == "done"
+    loaded = counting_loads(monkeypatch)
+    assert incremental.build_pg_volume(PgVolume(volume_dir), out) == "skipped"
+    assert loaded == []
+
+
+def test_only_changed_pages_are_rebuilt(volume_dir, tmp_path, monkeypatch):
+    out = tmp_path / "out"
+    out.mkdir()
+    incremental.build_pg_volume(PgVolume(volume_dir), out)
+    (volume_dir / "00000005.html").write_text(hocr_page(two_column_lines(rows=6)), encoding="utf-8")
+    loaded = counting_loads(monkeypatch)
+    assert incremental.build_pg_volume(PgVolume(volume_dir), out) == "done"
+    assert loaded == [5]
+    written = (out / "32101000000001.xml").read_text(encoding="utf-8")
+    assert written == PgVolume(volume_dir).xml()
+
+
+def test_pipeline_change_rebuilds_everything(volume_dir, tmp_path, monkeypatch):
+    out = tmp_path / "out"
+    out.mkdir()
+    incremental.build_pg_volume(PgVolume(volume_dir), out)
+    monkeypatch.setattr(incremental, '_source_digest', "changed")
+    loaded = counting_loads(monkeypatch)
+    assert incremental.build_pg_volume(PgVolume(volume_dir), out) == "done"
+    assert loaded == [1, 2, 3, 4, 5]
@@ -0,0 +1,37 @@
+import re
+from lxml import etree
+from nlp import ingest
+from tests.conftest import XHTML_PAGE
+
+
+def old_fix_entities(xml_string:str) -> str:
+    xml_string = re.sub(r'<\?xml.*?\?>', '', xml_string, flags=re.DOTALL)
+    xml_string = xml_string.replace("&shy;", "\u00AD")
+    xml_string = xml_string.replace("&quot;", "\u0022")
+    return xml_string
+
+def old_mets_fix_entities(xml_string:str) -> str:
+    xml_string = re.sub(r'<\?xml.*?\?>', '', xml_string, flags=re.DOTALL)
+    xml_string = xml_string.replace("&shy;", "\u00AD")
+    xml_string = xml_string.replace("&", "&amp;")
+    return xml_string
+
+
+PAGE = XHTML_PAGE.format(blocks="<span class='ocrx_word' title='bbox 1 2 3 4'>λό&shy;γος &quot;x&quot; a &amp; b</span>")
+
+
+def test_parse_matches_str_pipeline():
+    old = etree.fromstring(old_fix_entities(PAGE))
+    new = ingest.parse(PAGE.encode("utf-8"))
+    assert etree.tostring(new) == etree.tostring(old)
+
+
+def test_escape_ampersands_matches_mets_reader():
+    old = etree.XML(old_mets_fix_entities(PAGE))
+    new = ingest.parse(PAGE.encode("utf-8"), escape_ampersands=True)
+    assert etree.tostring(new) == etree.tostring(old)
+
+
+def test_parse_empty_file():
+    assert ingest.parse(b"") is None
+    assert ingest.fix_entities(b"no entities") == b"no entities"
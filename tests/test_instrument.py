@@ -0,0 +1,62 @@
+import json
+import pstats
+from nlp import instrument
+from nlp.span import Span
+from pg import PgVolume
+from volume_transformer import transform_volume_task
+
+
+def test_disabled_timers_record_nothing():
+    assert not instrument.enabled()
+    assert instrument.timer("lxml") is instrument._NULL
+
+
+def test_page_timings_per_stage(volume_dir):
+    with instrument.recording() as report:
+        PgVolume(volume_dir).xml()
+    timers = report.to_dict()["timers"]
+    for name in ("load", "parse", "repair", "classify", "serialize", "fix_entities", "lxml", "spans"):
+        assert name in timers
+    assert timers["parse"]["wall"] >= timers["lxml"]["wall"]
+    assert [page["page"] for page in report.pages] == [1, 2, 3, 4, 5]
+    assert not instrument.enabled()
+
+
+def test_page_timings_come_back_from_workers(volume_dir):
+    with instrument.recording() as report:
+        PgVolume(volume_dir, jobs=2).xml()
+    assert "analyze" in report.timers and "lxml" in report.timers
+    assert len(report.pages) == 5
+
+
+def test_call_counters_are_removed_afterwards(volume_dir):
+    lines = Span.__dict__["lines"]
+    with instrument.recording(count_calls=True) as report:
+        PgVolume(volume_dir).xml()
+        assert Span.__dict__["lines"] is not lines
+    assert report.counters["Span.lines"] > 0
+    assert report.counters["Token.is_greek"] > 0
+    assert Span.__dict__["lines"] is lines
+
+
+def test_volume_task_returns_its_report(volume_dir, tmp_path):
+    out = tmp_path / "out"
+    out.mkdir()
+    _, status, _, timings = transform_volume_task(volume_dir.parent, out, volume_dir.name,
+                                                  timings=True)
+    assert status == "done"
+    assert timings["volumes"][volume_dir.name]["pages"] == 5
+    report = instrument.Report()
+    report.merge(timings)
+    report.write(tmp_path / "timings.json")
+    assert json.loads((tmp_path / "timings.json").read_text())["timers"]["serialize"]["count"] == 5
+
+
+def test_profiles(volume_dir, tmp_path):
+    with instrument.profile(tmp_path / "pg.prof"):
+        PgVolume(volume_dir).xml()
+    assert "repair_fused_lines" in str(pstats.Stats(str(tmp_path / "pg.prof")).stats)
+    with instrument.profile(tmp_path / "pg.folded", format="collapsed"):
+        PgVolume(volume_dir).xml()
+    stacks = (tmp_path / "pg.folded").read_text().splitlines()
+    assert any(line.startswith("pipeline-parse;") and "parse (ingest.py" in line for line in stacks)
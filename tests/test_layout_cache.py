@@ -0,0 +1,49 @@
+from lxml import etree
+from pg import PgVolume, Loader
+from nlp.layout_cache import LayoutCache, dump_page, load_page
+from nlp.page import Page
+
+
+def test_round_trip(fused_page_tree):
+    page = Page(fused_page_tree)
+    restored = load_page(dump_page(page), number=7)
+    assert restored.number == 7
+    assert [line.bbox for line in restored.lines] == [line.bbox for line in page.lines]
+    assert [t.is_greek for t in restored.tokens] == [t.is_greek for t in page.tokens]
+    assert restored.xml() == Page(fused_page_tree).xml().replace('n="0"', 'n="7"')
+
+
+def test_loader_uses_cache(volume_dir, tmp_path, monkeypatch):
+    cache = LayoutCache(tmp_path / "cache")
+    expected = PgVolume(volume_dir).xml()
+    assert PgVolume(volume_dir, layout_cache=cache).xml() == expected
+
+    parses = []
+    fromstring = etree.fromstring
+    monkeypatch.setattr(etree, 'fromstring', lambda *a, **k: parses.append(1) or fromstring(*a, **k))
+    warm = PgVolume(volume_dir, layout_cache=cache)
+    assert warm.page(1).type == 'blank'
+    assert warm.page(4).type == 'blank'
+    assert warm.xml() == expected
+    assert parses == []
+
+
+def test_unreadable_entry_is_reparsed(volume_dir, tmp_path):
+    cache = LayoutCache(tmp_path / "cache")
+    Loader(volume_dir, layout_cache=cache).load_page(2)
+    for _, _, path in cache.entries():
+        with open(path, 'r+b') as f:
+            f.truncate(12)
+    page = Loader(volume_dir, layout_cache=cache).load_page(2)
+    assert page.type == 'page'
+
+
+def test_eviction(volume_dir, tmp_path):
+    cache = LayoutCache(tmp_path / "cache", check_every=1)
+    PgVolume(volume_dir, layout_cache=cache).xml()
+    before = cache.entries()
+    cache.max_bytes = sum(size for _, size, _ in before) - 1
+    cache.evict()
+    after = cache.entries()
+    assert len(after) < len(before)
+    assert sum(size for _, size, _ in after) <= cache.max_bytes * 9 // 10
@@ -0,0 +1,85 @@
+from models.mets import MetsVolume, MetsManifest, MANIFEST_NAME
+from nlp.page_cache import PageCache
+from tests.conftest import write_volume
+
+
+def test_manifest(volume_dir):
+    vol = MetsVolume(volume_dir)
+    assert vol.id == ['32101000000001']
+    assert vol.page_list == [1, 2, 3, 4, 5]
+    assert vol.manifest.files['HTML00000002'] == ('coordOCR', '00000002.html')
+
+
+def test_page_files(volume_dir):
+    page = MetsVolume(volume_dir).page(2)
+    assert page.physical_order == '2'
+    assert page.logical_order == '11'
+    assert 'CHAPTER_START' in page.tags
+    assert page.coordOCR_file == volume_dir / '00000002.html'
+    assert page.image_file == volume_dir / '00000002.jp2'
+
+
+def test_page_is_lazy(volume_dir):
+    page = MetsVolume(volume_dir).page(2)
+    assert page._html is None
+    assert page._doc is None
+
+
+def test_persisted_manifest(volume_dir, monkeypatch):
+    vol = MetsVolume(volume_dir, persist_manifest=True)
+    assert (volume_dir / MANIFEST_NAME).is_file()
+
+    def no_parse(*args, **kwargs):
+        raise AssertionError("METS file was parsed again")
+
+    monkeypatch.setattr(MetsManifest, 'from_mets', no_parse)
+    reopened = MetsVolume(volume_dir, persist_manifest=True)
+    assert reopened.page_index == vol.page_index
+    assert reopened.manifest.files == vol.manifest.files
+
+
+def test_persisted_manifest_follows_mets_changes(volume_dir):
+    MetsVolume(volume_dir, persist_manifest=True)
+    mets_file = volume_dir / "32101000000001.mets.xml"
+    mets_file.write_text(mets_file.read_text().replace("ORDERLABEL='13'", "ORDERLABEL='17'"))
+    assert MetsVolume(volume_dir, persist_manifest=True).page(3).logical_order == '17'
+
+
+def test_manifest_is_shared(volume_dir, monkeypatch):
+    vol = MetsVolume(volume_dir)
+
+    def no_parse(*args, **kwargs):
+        raise AssertionError("METS file was parsed again")
+
+    monkeypatch.setattr(MetsManifest, 'from_mets', no_parse)
+    seeded = MetsVolume(volume_dir, manifest=vol.manifest)
+    assert seeded.page(2).coordOCR_file == vol.page(2).coordOCR_file
+
+
+def test_tags_match_substrings_of_admid(tmp_path):
+    directory = write_volume(tmp_path / "v", "v", [
+        (None, "BLANK_PAGE CHAPTER_START", []),
+        (None, None, []),
+    ])
+    vol = MetsVolume(directory)
+    assert vol.page(1).tags == "BLANK_PAGE CHAPTER_START"
+    assert 'BLANK' in vol.page(1).tags
+    assert 'CHAPTER_START' in vol.page(1).tags
+    assert vol.page(2).tags == []
+
+
+def test_mets_file_is_found_by_its_root_element(volume_dir):
+    (volume_dir / "00000000.xml").write_text("<notes/>", encoding="utf-8")
+    (volume_dir / "0000.xml").write_text("not xml", encoding="utf-8")
+    vol = MetsVolume(volume_dir)
+    assert vol.mets_file == volume_dir / "32101000000001.mets.xml"
+    assert vol.page_list == [1, 2, 3, 4, 5]
+
+
+def test_pages_are_kept_in_the_given_cache(volume_dir):
+    cache = PageCache(max_entries=2)
+    vol = MetsVolume(volume_dir, page_cache=cache)
+    for pagenum in vol.page_list:
+        vol.page(pagenum)
+    assert cache.keys() == [4, 5]
+    assert vol.page(5) is vol.page(5)
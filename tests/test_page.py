@@ -0,0 +1,46 @@
+from nlp.page import Page
+
+
+def test_layout_is_reused(fused_page_tree):
+    page = Page(fused_page_tree)
+    layout = page.layout
+    page.print_region
+    page.left_lines()
+    assert page.layout is layout
+    assert page.print_region is layout.print_region
+
+
+def test_repair_invalidates_layout(fused_page_tree):
+    page = Page(fused_page_tree)
+    layout = page.layout
+    assert len(page.fused_lines) == 1
+    page.repair_fused_lines()
+    assert page.layout is not layout
+    assert page.fused_lines == []
+
+
+def test_repeated_xml_does_not_repair_again(fused_page_tree):
+    page = Page(fused_page_tree)
+    first = page.xml()
+    layout = page.layout
+    assert page.xml() == first
+    assert page.layout is layout
+
+
+def test_line_index_matches_scans(fused_page_tree):
+    page = Page(fused_page_tree)
+    for line in page.lines:
+        assert page.lines_adjacent(line) == [l for l in page.lines if abs(line.bottom - l.bottom) <= 10]
+    assert page.lines_aligned_left(500) == [l for l in page.lines if l.left <= 500]
+    assert page.layout.line_index.by_top == sorted(page.lines, key=lambda line: line.top)
+    head = page.lines[0]
+    assert page.line_below(head) is page.lines[1]
+    assert page.line_below(page.layout.line_index.by_top[-1]) is None
+
+
+def test_line_index_follows_repairs(fused_page_tree):
+    page = Page(fused_page_tree)
+    index = page.layout.line_index
+    page.repair_fused_lines()
+    assert page.layout.line_index is not index
+    assert len(page.layout.line_index.lines) == len(page.lines)
@@ -0,0 +1,65 @@
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from nlp.page_cache import PageCache
+from pg import PgVolume
+
+
+def test_least_recently_used_page_is_evicted():
+    cache = PageCache(max_entries=2)
+    cache.put(1, 'a')
+    cache.put(2, 'b')
+    assert cache.get(1) == 'a'
+    cache.put(3, 'c')
+    assert cache.keys() == [1, 3]
+    assert cache.get(2) is None
+
+
+def test_weight_budget():
+    cache = PageCache(max_entries=10, max_weight=5, weight=len)
+    cache.put(1, 'abc')
+    cache.put(2, 'de')
+    cache.put(3, 'f')
+    assert cache.keys() == [2, 3]
+    assert cache.total_weight == 3
+    cache.put(4, 'ghijklm')
+    assert cache.keys() == [4]
+
+
+def test_volume_keeps_a_bounded_number_of_pages(volume_dir):
+    vol = PgVolume(volume_dir, page_cache=PageCache(max_entries=2))
+    for pagenum in vol.page_list:
+        vol.page(pagenum)
+    assert vol._pages.keys() == [4, 5]
+    assert vol.page(5) is vol.page(5)
+
+
+def test_iter_pages_does_not_cache(volume_dir):
+    vol = PgVolume(volume_dir)
+    assert [page.physical_order for page in vol.iter_pages()] == ['1', '2', '3', '4', '5']
+    assert len(vol._pages) == 0
+    assert list(vol.chapter_titles()) == [2]
+    assert len(vol._pages) == 0
+
+
+def test_shared_between_threads():
+    cache = PageCache(max_entries=8, max_weight=40, weight=len)
+
+    def hammer(t):
+        for i in range(2000):
+            key = (t * 7 + i) % 20
+            cache.put(key, 'x' * (key % 5 + 1))
+            cache.get((key + 3) % 20)
+            if i % 11 == 0:
+                cache.discard((key + 5) % 20)
+
+    # switch threads often, so that unlocked updates would interleave
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    try:
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            list(pool.map(hammer, range(8)))
+    finally:
+        sys.setswitchinterval(interval)
+    assert len(cache) <= 8
+    assert cache.total_weight == sum(len(cache.peek(key)) for key in cache.keys())
+    assert cache.total_weight <= 40
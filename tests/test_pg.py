@@ -0,0 +1,171 @@
+import io
+import threading
+from pathlib import Path
+from lxml import etree
+import pg
+from pg import PgVolume, Loader
+from nlp.page_cache import PageCache
+from tests.conftest import two_column_lines, write_volume
+
+
+def test_load_page_reads_and_parses_once(volume_dir, monkeypatch):
+    counts = {'reads': 0, 'parses': 0}
+    path_open = Path.open
+    fromstring = etree.fromstring
+
+    def counting_open(self, *args, **kwargs):
+        if self.suffix == '.html':
+            counts['reads'] += 1
+        return path_open(self, *args, **kwargs)
+
+    def counting_fromstring(*args, **kwargs):
+        counts['parses'] += 1
+        return fromstring(*args, **kwargs)
+
+    monkeypatch.setattr(Path, 'open', counting_open)
+    monkeypatch.setattr(etree, 'fromstring', counting_fromstring)
+
+    page = Loader(volume_dir).load_page(2)
+    assert page.type == 'page'
+    assert counts == {'reads': 1, 'parses': 1}
+
+
+def test_blank_pages(volume_dir):
+    vol = PgVolume(volume_dir)
+    assert vol.page(1).type == 'blank'
+    assert vol.page(4).type == 'blank'
+    assert vol.page(2).type == 'page'
+
+
+def test_tagged_blank_pages_are_not_read(volume_dir, monkeypatch):
+    reads = []
+    monkeypatch.setattr(pg.ingest, 'read', lambda path: reads.append(path))
+    page = Loader(volume_dir).load_page(1)
+    assert reads == []
+    assert page.type == 'blank'
+    assert len(page._nlp_page) == 0
+    assert page.xml() == '<page n="1">\n</page>\n'
+
+
+def test_empty_pages_build_no_tree(volume_dir, monkeypatch):
+    monkeypatch.setattr(pg.Page, '__init__', None)
+    page = Loader(volume_dir).load_page(4)
+    assert page.type == 'blank'
+    assert page._nlp_page.root is None
+
+
+def test_parallel_xml_matches_serial(volume_dir):
+    serial = PgVolume(volume_dir).xml()
+    parallel = PgVolume(volume_dir, jobs=2, window=2).xml()
+    assert parallel == serial
+    assert serial.count("<page ") == 5
+
+
+def test_page_fragments_with_jobs_keep_page_order(volume_dir):
+    serial = list(PgVolume(volume_dir).page_fragments())
+    parallel = list(PgVolume(volume_dir, jobs=2, window=1).page_fragments())
+    assert parallel == serial
+    numbers = [etree.fromstring(fragment).get("n") for fragment in parallel]
+    assert numbers == ["1", "2", "3", "4", "5"]
+
+
+def test_load_threads_share_a_small_mets_page_cache(tmp_path):
+    directory = write_volume(tmp_path / "v", "v",
+                             [(str(2 * n + 1), None, two_column_lines(rows=3)) for n in range(40)])
+    expected = PgVolume(directory).xml()
+    vol = PgVolume(directory)
+    # the two load threads and the parse thread evict each other's MetsPages
+    vol.metsvol._pages = PageCache(max_entries=1)
+    assert vol.xml() == expected
+    assert len(vol.metsvol._pages) == 1
+    assert vol.metsvol._pages.total_weight == 1
+
+
+def test_loader_and_page_workers_share_the_manifest(volume_dir):
+    vol = PgVolume(volume_dir, jobs=2)
+    assert vol.loader.metsvol is vol.metsvol
+    assert vol.pipeline().stages[-1].initargs[1] is vol.metsvol.manifest
+
+
+def test_page_jobs_window(volume_dir):
+    assert PgVolume(volume_dir, jobs=3).pipeline().stages[-1].window == 12
+    assert PgVolume(volume_dir, jobs=3, window=5).pipeline().stages[-1].window == 5
+    assert PgVolume(volume_dir).pipeline(jobs=2).stages[-1].kind == "process"
+
+
+def test_transformer_page_jobs(volume_dir, tmp_path):
+    from volume_transformer import Transformer
+    (tmp_path / "serial").mkdir()
+    (tmp_path / "parallel").mkdir()
+    name = f"{volume_dir.name}.xml"
+    Transformer(volume_dir.parent, tmp_path / "serial").transform_volume(volume_dir.name)
+    Transformer(volume_dir.parent, tmp_path / "parallel", page_jobs=2).transform_volume(volume_dir.name)
+    assert (tmp_path / "parallel" / name).read_bytes() == (tmp_path / "serial" / name).read_bytes()
+
+
+def test_serialize_streams_same_document(volume_dir, tmp_path):
+    vol = PgVolume(volume_dir)
+    vol.serialize(tmp_path)
+    written = (tmp_path / vol.barcode).with_suffix('.xml').read_text(encoding='utf-8')
+    assert vol._xml is None
+    assert written == PgVolume(volume_dir).xml()
+
+
+def test_write_streams_each_fragment(volume_dir):
+    vol = PgVolume(volume_dir)
+    buffer = io.BytesIO()
+    written = []
+
+    def fragments():
+        for fragment in vol.page_fragments():
+            # every fragment is in the output before the next one is built
+            assert all(previous in buffer.getvalue() for previous in written)
+            written.append(fragment)
+            yield fragment
+
+    vol.write(buffer, fragments=fragments())
+    assert len(written) == 5
+    assert len(vol._pages) == 0 and vol._xml is None
+
+
+def test_read_ahead_pages_match_plain_reads(volume_dir, monkeypatch):
+    plain = [page.xml() for page in PgVolume(volume_dir).iter_pages()]
+    threads = []
+    read = pg.ingest.read
+
+    def recording_read(path):
+        threads.append(threading.current_thread().name)
+        return read(path)
+
+    monkeypatch.setattr(pg.ingest, 'read', recording_read)
+    vol = PgVolume(volume_dir, read_ahead=2)
+    assert [page.xml() for page in vol.iter_pages()] == plain
+    vol.close()
+    assert threads and all(name.startswith("prefetch") for name in threads)
+    assert vol.loader._prefetcher.keys() == []
+
+
+def test_read_ahead_byte_budget(volume_dir):
+    loader = Loader(volume_dir, read_ahead=3, read_ahead_bytes=1)
+    loader.prefetch([2])
+    # the file read ahead uses up the budget: no more are started
+    loader._prefetcher._ahead[2].result()
+    loader.prefetch([2, 3, 5])
+    assert loader._prefetcher.keys() == [2]
+    assert loader.load_page(2).type == 'page'
+    assert loader._prefetcher.keys() == []
+    loader.close()
+
+
+def test_read_ahead_drops_pages_out_of_the_window(tmp_path):
+    directory = write_volume(tmp_path / "v", "v", [("1", None, two_column_lines())] * 10)
+    vol = PgVolume(directory, read_ahead=2)
+    vol.page(1)
+    assert vol.loader._prefetcher.keys() == [2, 3]
+    vol.page(6)
+    assert vol.loader._prefetcher.keys() == [7, 8]
+    vol.page(9)
+    assert vol.loader._prefetcher.keys() == [10]
+    vol.page(7)
+    assert vol.loader._prefetcher.keys() == [8]
+    vol.close()
@@ -0,0 +1,79 @@
+import threading
+import time
+import pytest
+from nlp.pipeline import Pipeline, Stage, _Chain, _fused
+from nlp.volume import Epub, EPubVolume
+from pg import PgVolume
+from tests.test_volume import write_epub
+
+
+def slow_square(n):
+    # later items finish first
+    time.sleep(0.01 * (5 - n % 5))
+    return n * n
+
+
+def fail_on_three(n):
+    if n == 3:
+        raise ValueError("three")
+    return n
+
+
+def test_results_keep_input_order():
+    pipeline = Pipeline([Stage("square", slow_square, workers=4),
+                         Stage("add", lambda n: n + 1)], queue_size=2)
+    assert list(pipeline.run(range(12))) == [n * n + 1 for n in range(12)]
+
+
+def test_process_stage():
+    pipeline = Pipeline([Stage("square", slow_square, workers=2, kind="process")])
+    assert list(pipeline.run(range(6))) == [n * n for n in range(6)]
+
+
+def test_exceptions_reach_the_caller():
+    pipeline = Pipeline([Stage("fail", fail_on_three), Stage("square", slow_square, workers=2)])
+    results = []
+    with pytest.raises(ValueError, match="three"):
+        for n in pipeline.run(range(10)):
+            results.append(n)
+    assert results == [0, 1, 4]
+
+
+def test_pg_pipeline_matches_page_xml(volume_dir):
+    vol = PgVolume(volume_dir)
+    fragments = dict(vol.page_fragment_items())
+    for pagenum in vol.page_list:
+        page = PgVolume(volume_dir).page(pagenum)
+        assert fragments[pagenum] == (page.xml_bytes() if page else None)
+
+
+def test_epub_pipeline_matches_page_xml(tmp_path):
+    path = write_epub(tmp_path / "v.epub", pages=5)
+    serial = list(EPubVolume(path).page_fragment_items())
+    assert [i for i, _ in serial] == [0, 1, 2, 3]
+    assert serial[2][1] == EPubVolume(path).page(2).xml_bytes()
+    assert list(EPubVolume(path).page_fragment_items(jobs=2)) == serial
+
+
+def test_io_stages_keep_their_thread(tmp_path):
+    stages = _fused(EPubVolume(write_epub(tmp_path / "v.epub")).pipeline().stages)
+    assert [stage.name for stage in stages] == ["load", "parse"]
+    assert isinstance(stages[1].fn, _Chain) and len(stages[1].fn.fns) == 4
+
+
+def test_epub_pipeline_reads_ahead(tmp_path, monkeypatch):
+    path = write_epub(tmp_path / "v.epub", pages=6)
+    plain = EPubVolume(path).xml()
+    threads = []
+    read_locked = Epub._read_locked
+
+    def recording_read(self, fname):
+        threads.append(threading.current_thread().name)
+        return read_locked(self, fname)
+
+    monkeypatch.setattr(Epub, '_read_locked', recording_read)
+    volume = EPubVolume(path, read_ahead=2)
+    assert volume.xml() == plain
+    volume.close()
+    assert threads[0] == "pipeline-load"
+    assert all(name.startswith("prefetch") for name in threads[1:])
@@ -0,0 +1,41 @@
+import threading
+from nlp.prefetch import Prefetcher
+
+
+def test_reads_the_window_ahead_and_drops_the_rest():
+    release = threading.Event()
+
+    def read(key):
+        release.wait()
+        return bytes(key)
+
+    prefetcher = Prefetcher(read, window=2)
+    prefetcher.prefetch([1, 2, 3])
+    assert prefetcher.keys() == [1, 2]
+    prefetcher.prefetch([2, 3])
+    assert prefetcher.keys() == [2, 3]
+    release.set()
+    assert prefetcher.take(3).result() == bytes(3)
+    assert prefetcher.take(1) is None
+    assert prefetcher.keys() == [2]
+    prefetcher.close()
+    assert prefetcher.keys() == []
+
+
+def test_byte_budget():
+    prefetcher = Prefetcher(bytes, window=3, max_bytes=4)
+    prefetcher.prefetch([5])
+    # the 5 bytes read ahead use up the budget: no more reads are started
+    prefetcher._ahead[5].result()
+    prefetcher.prefetch([5, 1, 2])
+    assert prefetcher.keys() == [5]
+    assert prefetcher.ahead_bytes() == 5
+    prefetcher.close()
+
+
+def test_no_window_reads_nothing_ahead():
+    prefetcher = Prefetcher(bytes)
+    prefetcher.prefetch([1, 2])
+    assert prefetcher.keys() == []
+    assert prefetcher.submit(3).result() == bytes(3)
+    prefetcher.close()
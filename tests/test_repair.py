@@ -0,0 +1,122 @@
+import json
+import random
+from pathlib import Path
+import pytest
+from lxml import etree
+from nlp.page import Page
+from tests.conftest import GREEK, LATIN, hocr_page
+
+
+BASELINE = Path(__file__).parent / "data" / "repair_baseline.json"
+
+
+def random_words(rng, n):
+    words = []
+    for _ in range(n):
+        words.append(rng.choice(GREEK if rng.random() < 0.5 else LATIN))
+        if rng.random() < 0.2:
+            words.append(rng.choice([",", ".", "·", ";"]))
+    return words
+
+
+def random_fused_words(rng):
+    """Greek then Latin, or Latin then Greek, with some of the other
+    script mixed in and some punctuation."""
+    first, second = (GREEK, LATIN) if rng.random() < 0.5 else (LATIN, GREEK)
+    words = []
+    for script in (first, second):
+        for _ in range(rng.randint(2, 9)):
+            words.append(rng.choice(script if rng.random() < 0.85 else LATIN + GREEK))
+            if rng.random() < 0.25:
+                words.append(rng.choice([",", ".", "·"]))
+    return words
+
+
+def random_page_lines(rng, rows):
+    lines = [(100, 100, 1900, ["ΠΑΤΡΟΛΟΓΙΑ", "ΕΛΛΗΝΙΚΗ"], 30)]
+    top = 200
+    for row in range(rows):
+        if rng.random() < 0.3 or row >= rows - 2 and rng.random() < 0.5:
+            lines.append((100, top, 1900, random_fused_words(rng), 40))
+        else:
+            lines.append((100, top + rng.choice([0, 0, 5]), 900, random_words(rng, rng.randint(1, 6)), 40))
+            lines.append((1000, top + rng.choice([0, 0, -5]), 1900, random_words(rng, rng.randint(1, 6)), 40))
+        top += rng.choice([50, 50, 50, 0, 120])
+    return lines
+
+
+def fused_line_trees(count=300):
+    rng = random.Random(1)
+    for _ in range(count):
+        words = random_fused_words(rng)
+        yield etree.fromstring(hocr_page([(100, 200, 1900, words, 40)]).encode("utf-8"))
+
+
+def page_trees(count=60):
+    rng = random.Random(2)
+    for _ in range(count):
+        yield etree.fromstring(hocr_page(random_page_lines(rng, rng.randint(3, 20))).encode("utf-8"))
+    # a fused last line
+    yield etree.fromstring(hocr_page([(100, 200, 900, GREEK[:5], 40), (1000, 200, 1900, LATIN[:5], 40),
+                                      (100, 250, 1900, GREEK[:6] + LATIN[:6], 40)]).encode("utf-8"))
+
+
+def snapshot(page):
+    """The lines of a page, their boxes, the line of each token and the
+    Greek columns, in a form that can be saved as JSON."""
+    tokens = page.tokens
+    lines = page.lines
+    line_number = {id(line): i for i, line in enumerate(lines)}
+    return {
+        "lines": [str(line) for line in lines],
+        "boxes": [[line.bbox.left, line.bbox.top, line.bbox.right, line.bbox.bottom]
+                  for line in lines],
+        "parents": [line_number.get(id(token.parent), type(token.parent).__name__)
+                    for token in tokens],
+        "greek_columns": [str(column) for column in page.greek_columns],
+    }
+
+
+@pytest.fixture(scope="module")
+def baseline():
+    """What the repair code produced before TopOrder and the one-pass
+    unfuse (see data/make_repair_baseline.py)."""
+    with open(BASELINE, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def test_unfuse_matches_baseline(baseline):
+    for tree, expected in zip(fused_line_trees(), baseline["unfuse"], strict=True):
+        left, right = Page(tree).lines[0].unfuse()
+        assert [[t.text for t in left.tokens], [t.text for t in right.tokens]] == expected
+
+
+def test_unfuse_matches_stepwise():
+    for tree in fused_line_trees():
+        fast = Page(tree).lines[0]
+        slow = Page(tree).lines[0]
+        fast_halves = fast.unfuse()
+        slow_halves = slow._unfuse_stepwise()
+        for a, b in zip(fast_halves, slow_halves):
+            assert [t.text for t in a.objects] == [t.text for t in b.objects]
+            assert a.bbox.__dict__ == b.bbox.__dict__
+            assert [t.parent is a for t in a.objects] == [t.parent is b for t in b.objects]
+        assert [t.parent is fast for t in fast.tokens] == [t.parent is slow for t in slow.tokens]
+
+
+def test_repair_matches_baseline(baseline):
+    repaired = 0
+    for tree, expected in zip(page_trees(), baseline["pages"], strict=True):
+        page = Page(tree)
+        repaired += len(page.fused_lines)
+        page.repair_fused_lines()
+        assert snapshot(page) == expected
+    assert repaired > 50
+
+
+def test_repair_of_the_last_line():
+    *_, tree = page_trees()
+    page = Page(tree)
+    assert len(page.fused_lines) == 1
+    page.repair_fused_lines()
+    assert [str(line).split() for line in page.lines][-2:] == [GREEK[:6], LATIN[:6]]
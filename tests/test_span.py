@@ -18,3 +18,66 @@ def test_length():
 def test_tokens():
     span = Span(span1)
     tokens = span.tokens
+
+
+def test_cached_views_invalidated_up_the_tree():
+    par = Span(etree.XML("<p class='ocr_par'></p>"))
+    line = Span(span1)
+    par.append(line)
+    assert len(par.tokens) == 17
+    assert par.lines == [line]
+    assert par.tokens is par.tokens
+
+    token = line.pop()
+    assert len(line.tokens) == 16
+    assert len(par.tokens) == 16
+
+    line.prepend(token)
+    assert par.tokens[0] is token
+
+    par.remove(line)
+    assert par.tokens == []
+    assert par.lines == []
+
+
+def test_splice_and_extend():
+    par = Span(etree.XML("<p class='ocr_par'></p>"))
+    line = Span(span1)
+    par.append(line)
+    tokens = list(line.objects)
+
+    removed = line.splice(2, 5, [tokens[0]])
+    assert removed == tokens[2:5]
+    assert all(token.parent is None for token in removed)
+    assert list(line.objects) == tokens[:2] + tokens[:1] + tokens[5:]
+    assert len(par.tokens) == 15
+
+    line.splice(0, 3)
+    line.extend(removed)
+    assert list(line.objects) == tokens[5:] + tokens[2:5]
+    assert all(token.parent is line for token in line.objects)
+    assert par.tokens == line.tokens
+
+
+def test_splice_into_another_span():
+    line = Span(span1)
+    tokens = list(line.objects)
+    tail = Span(None)
+    tail.extend(line.splice(10, len(line)))
+    assert list(line.objects) == tokens[:10]
+    assert list(tail.objects) == tokens[10:]
+    assert all(token.parent is tail for token in tail.objects)
+    assert line.bbox == BBox(92, 155, 912, 196)
+    assert tail.bbox == BBox(919, 155, 1695, 196)
+
+
+def test_bbox_is_computed_once_after_edits():
+    line = Span(span1)
+    bbox = line.bbox
+    assert line.bbox is bbox
+    tokens = [line.pop() for _ in range(5)]
+    assert line._bbox is None
+    assert line.bbox == BBox(92, 155, 1206, 196)
+    for token in reversed(tokens):
+        line.append(token)
+    assert line.bbox == bbox
@@ -0,0 +1,75 @@
+import pytest
+from lxml import etree
+from nlp.page import Page
+from nlp.store import CompactPage
+from pg import PgVolume
+from tests.conftest import hocr_page
+
+
+def test_store_matches_page(fused_page_tree):
+    page = Page(fused_page_tree)
+    compact = CompactPage(fused_page_tree)
+    assert len(compact.store) == len(page.tokens)
+    assert [str(line) for line in compact.lines] == [str(line) for line in page.lines]
+    assert [line.bbox for line in compact.lines] == [line.bbox for line in page.lines]
+    assert [t.is_greek for t in compact.tokens] == [t.is_greek for t in page.tokens]
+    assert [t.text for t in compact.words] == [t.text for t in page.words]
+    assert compact.bbox == page.bbox
+
+
+def test_store_layout_matches_page(fused_page_tree):
+    page = Page(fused_page_tree)
+    compact = CompactPage(fused_page_tree)
+    assert compact.print_region == page.print_region
+    assert [str(l) for l in compact.left_lines()] == [str(l) for l in page.left_lines()]
+    assert [str(l) for l in compact.right_lines()] == [str(l) for l in page.right_lines()]
+    assert [str(l) for l in compact.running_head] == [str(l) for l in page.running_head]
+    assert [str(c) for c in compact.greek_columns] == [str(c) for c in page.greek_columns]
+    assert [l.is_fused for l in compact.lines] == [l.is_fused for l in page.lines]
+    assert compact.column_numbers == page.column_numbers
+
+
+def test_compact_page_drops_its_caches(fused_page_tree):
+    compact = CompactPage(fused_page_tree)
+    fused = [str(l) for l in compact.fused_lines]
+    sides = compact.greek_sides
+    compact.drop_caches()
+    assert compact._lines is None and compact._print_region is None
+    assert compact._left == {} and compact._greek_sides is None
+    assert [str(l) for l in compact.fused_lines] == fused
+    assert compact.greek_sides == sides
+
+
+def test_store_empty_page():
+    compact = CompactPage(etree.fromstring(hocr_page([]).encode("utf-8")))
+    assert len(compact) == 0
+    assert compact.lines == []
+    assert compact.greek_columns == []
+
+
+def test_compact_pages_write_the_same_volume(volume_dir, tmp_path):
+    (tmp_path / "pages").mkdir()
+    (tmp_path / "compact").mkdir()
+    PgVolume(volume_dir).serialize(tmp_path / "pages", tokens=True)
+    PgVolume(volume_dir, compact_pages=True).serialize(tmp_path / "compact", tokens=True)
+    for name in (f"{volume_dir.name}.xml", f"{volume_dir.name}.tokens"):
+        assert (tmp_path / "compact" / name).read_bytes() == (tmp_path / "pages" / name).read_bytes()
+    assert PgVolume(volume_dir, compact_pages=True, jobs=2).xml() == PgVolume(volume_dir).xml()
+
+
+def test_pages_with_fused_lines_are_built_in_full(volume_dir):
+    loader = PgVolume(volume_dir).loader
+    built = {}
+    for n in (2, 3):
+        mets_page = loader.metsvol.page(n)
+        built[n] = loader.page_from_bytes(mets_page, n, loader.read_page(mets_page), compact=True)
+    assert isinstance(built[2]._nlp_page, CompactPage)
+    assert isinstance(built[3]._nlp_page, Page)
+
+
+def test_compact_page_cannot_repair(fused_page_tree):
+    compact = CompactPage(fused_page_tree)
+    assert [str(line) for line in compact.fused_lines] == [str(line) for line in Page(fused_page_tree).fused_lines]
+    assert compact.layout.greek_sides == Page(fused_page_tree).layout.greek_sides
+    with pytest.raises(ValueError):
+        compact.repair_fused_lines()
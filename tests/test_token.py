@@ -1,5 +1,5 @@
 from lxml import etree
-from nlp.token import Token
+from nlp.token import Token, classify_greek, is_greek_text, label_greek
 
 token1_xml = etree.XML("<span class='ocrx_word' title='bbox 766 155 816 196;x_wconf 100'>του</span>")
 token2_xml = etree.XML("<span class='ocrx_word' title='bbox 766 155 816 196;x_wconf 100'>foo</span>")
@@ -17,3 +17,15 @@ def test_token_text():
 
     assert greek_token.is_greek
     assert non_greek_token.is_greek is False
+
+def test_classify_greek_matches_is_greek_text():
+    texts = ['του', 'foo', '', '.', 'λόγος,', 'aβ', 'abγ', 'ΠΑΤΡΟΛΟΓΙΑ', 'x\x1fy']
+    assert classify_greek(texts) == [is_greek_text(text) for text in texts]
+    assert classify_greek([]) == []
+
+def test_is_greek_is_cached():
+    token = Token(token1_xml)
+    label_greek([token])
+    assert token._is_greek is True
+    token.text = 'foo'
+    assert token.is_greek
@@ -0,0 +1,37 @@
+from lxml import etree
+from pg import PgVolume
+from nlp.token_table import TokenTable
+
+
+def test_token_table_matches_xml(volume_dir, tmp_path):
+    PgVolume(volume_dir).serialize(tmp_path, tokens=True)
+    barcode = volume_dir.name
+    volume = etree.parse(str(tmp_path / f"{barcode}.xml")).getroot()
+    with TokenTable(tmp_path / f"{barcode}.tokens") as table:
+        assert table.volume == barcode
+        rows = list(table)
+        assert len(rows) == len(table) > 0
+        assert set(table.column("is_greek")) == {1}
+        assert table.column("page").tolist() == [row["page"] for row in rows]
+
+    # the rows of each <column>, line by line, are the text of the column
+    for page in volume.iter("page"):
+        for column in page.iter("column"):
+            column_rows = [row for row in rows if row["page"] == int(page.get("n"))
+                           and row["column"] == int(column.get("n"))]
+            lines = {}
+            for row in column_rows:
+                lines.setdefault(row["line"], []).append(row["text"])
+            assert list(lines.values()) == [line.split() for line in column.text.strip().split("\n")]
+            assert {row["side"] for row in column_rows} == {"left"}
+            assert all(row["left"] < row["right"] and row["top"] < row["bottom"]
+                       for row in column_rows)
+
+
+def test_token_table_with_page_jobs(volume_dir, tmp_path):
+    (tmp_path / "serial").mkdir()
+    (tmp_path / "parallel").mkdir()
+    PgVolume(volume_dir).serialize(tmp_path / "serial", tokens=True)
+    PgVolume(volume_dir, jobs=2).serialize(tmp_path / "parallel", tokens=True)
+    name = f"{volume_dir.name}.tokens"
+    assert (tmp_path / "parallel" / name).read_bytes() == (tmp_path / "serial" / name).read_bytes()
@@ -0,0 +1,82 @@
+import pickle
+import zipfile
+import pytest
+from nlp.volume import Epub, EPubVolume
+from tests.conftest import hocr_page, two_column_lines
+
+
+def write_epub(path, pages=4):
+    with zipfile.ZipFile(path, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        for i in range(pages):
+            archive.writestr(f"OEBPS/xhtml/{i:08d}.xhtml", hocr_page(two_column_lines(rows=2 + i)))
+    return path
+
+
+def test_archive_is_opened_once(tmp_path, monkeypatch):
+    epub = Epub(write_epub(tmp_path / "v.epub"))
+    opened = []
+    monkeypatch.setattr(zipfile.ZipFile, '_RealGetContents',
+                        lambda self, real=zipfile.ZipFile._RealGetContents: opened.append(1) or real(self))
+    archive = epub.archive
+    for name in epub.names:
+        assert isinstance(epub.read(name), bytes)
+        assert epub.get_member(name) is not None
+    assert epub.archive is archive
+    assert opened == []
+
+
+def test_read_ahead_matches_plain_reads(tmp_path):
+    path = write_epub(tmp_path / "v.epub", pages=6)
+    plain = EPubVolume(path).xml()
+    volume = EPubVolume(path, read_ahead=2)
+    assert volume.xml() == plain
+    volume.close()
+
+
+def test_epub_pickles_without_its_archive(tmp_path):
+    epub = Epub(write_epub(tmp_path / "v.epub"))
+    clone = pickle.loads(pickle.dumps(epub))
+    assert clone._archive is None
+    assert clone.read(clone.names[0]) == epub.read(epub.names[0])
+
+
+def test_epub_pages_are_cached(tmp_path):
+    volume = EPubVolume(write_epub(tmp_path / "v.epub"))
+    assert volume.page(1) is volume.page(1)
+    assert len(list(volume.iter_pages())) == 4
+    assert volume._pages.keys() == [1]
+
+
+def test_epub_serialize_streams(tmp_path):
+    path = write_epub(tmp_path / "v.epub")
+    volume = EPubVolume(path)
+    volume.serialize(tmp_path)
+    assert volume._xml is None
+    assert (tmp_path / "v.xml").read_text(encoding="utf-8") == EPubVolume(path).xml()
+
+
+def test_interrupted_epub_serialize_leaves_no_output(tmp_path, monkeypatch):
+    path = write_epub(tmp_path / "v.epub")
+    out = tmp_path / "out"
+    out.mkdir()
+
+    def interrupted_write(self, f, *args, **kwargs):
+        f.write(b"<volume")
+        raise KeyboardInterrupt
+
+    monkeypatch.setattr(EPubVolume, 'write', interrupted_write)
+    with pytest.raises(KeyboardInterrupt):
+        EPubVolume(path).serialize(out)
+    assert list(out.iterdir()) == []
+
+
+def test_read_ahead_drops_members_out_of_the_window(tmp_path):
+    volume = EPubVolume(write_epub(tmp_path / "v.epub", pages=8), read_ahead=2)
+    names = volume.page_list
+    volume.page(0)
+    assert volume.epub._prefetcher.keys() == names[1:3]
+    volume.page(4)
+    assert volume.epub._prefetcher.keys() == names[5:7]
+    volume.page(5)
+    assert volume.epub._prefetcher.keys() == names[6:8]
+    volume.close()
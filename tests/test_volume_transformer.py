@@ -0,0 +1,138 @@
+import logging
+import os
+import subprocess
+import sys
+import pytest
+import pg
+import volume_transformer
+from pg import PgVolume
+from volume_transformer import Transformer, claim_lock, transform_volume_task
+from tests.conftest import two_column_lines, write_volume
+
+
+def volumes(tmp_path, count=3):
+    indir = tmp_path / "in"
+    for n in range(count):
+        barcode = f"3210100000000{n}"
+        write_volume(indir / barcode, barcode, [
+            ("1", "CHAPTER_START", two_column_lines(rows=3 + n)),
+            ("2", None, two_column_lines(rows=4, fused_row=2)),
+        ])
+    return indir
+
+
+def dead_pid():
+    process = subprocess.Popen([sys.executable, "-c", "pass"])
+    process.wait()
+    return process.pid
+
+
+CRASHING = "32101000000001"
+
+
+def crashing_task(indir, outdir, barcode, *args):
+    """transform_volume_task, except that the worker transforming
+    CRASHING dies holding its lock, as a worker crashing in lxml would."""
+    if barcode == CRASHING:
+        claim_lock((outdir / barcode).with_suffix(".xml.lock"))
+        os._exit(1)
+    return transform_volume_task(indir, outdir, barcode, *args)
+
+
+def test_jobs_match_serial(tmp_path):
+    indir = volumes(tmp_path)
+    (tmp_path / "serial").mkdir()
+    (tmp_path / "parallel").mkdir()
+    serial = Transformer(indir, tmp_path / "serial").transform_all_volumes()
+    parallel = Transformer(indir, tmp_path / "parallel", jobs=2,
+                           max_tasks_per_child=1).transform_all_volumes()
+    assert serial == parallel == {d.name: ("done", None) for d in indir.iterdir()}
+    for path in (tmp_path / "serial").iterdir():
+        assert (tmp_path / "parallel" / path.name).read_bytes() == path.read_bytes()
+    assert sorted(p.suffix for p in (tmp_path / "parallel").iterdir()) == [".xml"] * 3
+
+
+def test_summary_report(tmp_path, caplog):
+    indir = volumes(tmp_path, count=2)
+    (indir / "32101000000009").mkdir()   # no METS file
+    out = tmp_path / "out"
+    out.mkdir()
+    (out / "32101000000001.xml").write_text("<volume/>")
+    with caplog.at_level(logging.INFO):
+        results = Transformer(indir, out).transform_all_volumes()
+    assert {barcode: status for barcode, (status, _) in results.items()} == {
+        "32101000000000": "done", "32101000000001": "skipped", "32101000000009": "failed"}
+    assert "summary: 1 done, 1 failed, 1 skipped" in caplog.text
+    assert "volume 32101000000009 failed: " in caplog.text
+    assert not (out / "32101000000009.xml").exists()
+
+
+def test_held_lock_skips_the_volume(volume_dir, tmp_path):
+    out = tmp_path / "out"
+    out.mkdir()
+    lock_path = out / f"{volume_dir.name}.xml.lock"
+    lock_path.write_text(str(os.getpid()))
+    assert Transformer(volume_dir.parent, out).transform_volume(volume_dir.name) == "skipped"
+    assert lock_path.exists()
+    assert not (out / f"{volume_dir.name}.xml").exists()
+
+
+def test_stale_lock_is_broken(volume_dir, tmp_path):
+    out = tmp_path / "out"
+    out.mkdir()
+    lock_path = out / f"{volume_dir.name}.xml.lock"
+    lock_path.write_text(str(dead_pid()))
+    assert Transformer(volume_dir.parent, out).transform_volume(volume_dir.name) == "done"
+    assert sorted(p.name for p in out.iterdir()) == [f"{volume_dir.name}.xml"]
+
+
+def test_claim_lock_records_the_pid(tmp_path):
+    lock_path = tmp_path / "v.xml.lock"
+    assert claim_lock(lock_path)
+    assert lock_path.read_text() == str(os.getpid())
+    assert not claim_lock(lock_path)
+
+
+def test_temporary_files_of_a_killed_run_are_removed(volume_dir, tmp_path):
+    out = tmp_path / "out"
+    out.mkdir()
+    pid = dead_pid()
+    (out / f"{volume_dir.name}.xml.lock").write_text(str(pid))
+    (out / f"{volume_dir.name}.xml.{pid}.tmp").write_bytes(b"<volume")
+    assert Transformer(volume_dir.parent, out).transform_volume(volume_dir.name) == "done"
+    assert sorted(p.name for p in out.iterdir()) == [f"{volume_dir.name}.xml"]
+
+
+def test_interrupted_run_leaves_no_output(volume_dir, tmp_path, monkeypatch):
+    out = tmp_path / "out"
+    out.mkdir()
+    write = PgVolume.write
+
+    def interrupted_write(self, f, *args, **kwargs):
+        f.write(b"<volume")
+        assert not (out / f"{volume_dir.name}.xml").exists()
+        raise KeyboardInterrupt
+
+    monkeypatch.setattr(pg.PgVolume, 'write', interrupted_write)
+    transformer = Transformer(volume_dir.parent, out)
+    with pytest.raises(KeyboardInterrupt):
+        transformer.transform_volume(volume_dir.name)
+    assert list(out.iterdir()) == []
+    monkeypatch.setattr(pg.PgVolume, 'write', write)
+    assert transformer.transform_volume(volume_dir.name) == "done"
+
+
+def test_dead_worker_fails_only_its_volume(tmp_path, monkeypatch, caplog):
+    indir = volumes(tmp_path, count=5)
+    out = tmp_path / "out"
+    out.mkdir()
+    monkeypatch.setattr(volume_transformer, 'transform_volume_task', crashing_task)
+    with caplog.at_level(logging.INFO):
+        results = Transformer(indir, out, jobs=2).transform_all_volumes()
+    assert results.pop(CRASHING) == ("failed", "the worker process died")
+    # a volume whose worker was killed with the pool may have been
+    # written before its result was lost: it is then skipped on retry
+    assert set(results) == {d.name for d in indir.iterdir()} - {CRASHING}
+    assert {status for status, _ in results.values()} <= {"done", "skipped"}
+    assert "1 failed" in caplog.text
+    assert sorted(p.name for p in out.iterdir()) == sorted(f"{barcode}.xml" for barcode in results)